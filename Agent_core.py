@@ -1,104 +1,160 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import time
 import json
-from typing import List, Optional, Dict, Any
+import os
+from typing import Iterator, List, Optional, Dict, Any
 from textwrap import dedent
-from pydantic import BaseModel, Field, validator
-from GUI import *
+from urllib.parse import urlparse
 import logging
+import Gpa_engine
+from Gpa_engine import BestAttemptIndex
+import Prompt_compactor
+import Semester_records
+from Tracing import Tracer, traced
 
-# Agno imports
-from agno.agent import Agent
-from agno.models.ollama import Ollama
-from agno.knowledge.json import JSONKnowledgeBase
-from agno.tools.reasoning import ReasoningTools
+# selenium, agno/ollama, pydantic, numpy (Retake_solver) và tkinter (GUI) chỉ được import khi dùng tới,
+# để import module này (worker batch/service, phân tích offline) không phải trả chi phí khởi động của chúng
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class MonCanCaiThien(BaseModel):
-    """Model cho môn học cần cải thiện"""
-    ma_mon: str = Field(..., description="Mã số của môn học cần cải thiện")
-    ten_mon: str = Field(..., description="Tên đầy đủ của môn học cần cải thiện")
-    diem_so: float = Field(..., description="Điểm số hiện tại theo thang điểm GPA (0-10)")
-    tin_chi: int = Field(..., description="Số tín chỉ của môn học")
-    diem_chu: str = Field(..., description="Điểm chữ hiện tại (A+, A, B+, B, C+, C, D+, D, F)")
-    ly_do: str = Field(..., description="Lý do cụ thể tại sao môn này cần cải thiện")
-    muc_do_uu_tien: str = Field(..., description="Mức độ ưu tiên: 'Cao', 'Trung bình', 'Thấp'")
-    
-    @validator('diem_so')
-    def validate_diem_so(cls, v):
-        if not 0 <= v <= 10:
-            raise ValueError('Điểm số phải nằm trong khoảng 0-10')
-        return v
-    
-    @validator('tin_chi')
-    def validate_tin_chi(cls, v):
-        if v <= 0:
-            raise ValueError('Số tín chỉ phải lớn hơn 0')
-        return v
+SSO_LOGIN_URL = "https://sso.hcmut.edu.vn/cas/login?service=https%3A%2F%2Fmybk.hcmut.edu.vn%2Fapp%2Flogin%2Fcas"
+GRADES_URL = "https://mybk.hcmut.edu.vn/app/sinh-vien/ket-qua-hoc-tap/bang-diem-hoc-ky"
 
-class HocPhanUuTien(BaseModel):
-    """Model cho học phần được ưu tiên"""
-    ma_mon: str = Field(..., description="Mã số của học phần")
-    ten_mon: str = Field(..., description="Tên đầy đủ của học phần")
-    tin_chi: int = Field(..., description="Số tín chỉ của học phần")
-    diem_hien_tai: Optional[float] = Field(None, description="Điểm hiện tại nếu đã học")
-    uu_tien_vi: str = Field(..., description="Lý do ưu tiên học phần này")
-    kha_nang_cai_thien: str = Field(..., description="Đánh giá khả năng cải thiện: 'Dễ', 'Trung bình', 'Khó'")
-    thoi_gian_de_xuat: str = Field(..., description="Thời gian đề xuất học: 'Học kỳ tới', 'Học kỳ hè', 'Trong năm'")
+# Thời gian chờ tối đa (giây) cho từng tín hiệu sẵn sàng của trang
+DEFAULT_READINESS_TIMEOUTS = {
+    "sso_redirect": 20.0,
+    "table_present": 15.0,
+    "rows_stable": 15.0,
+    "footer_rendered": 5.0,
+    "session_restore": 10.0,
+    "stable_for": 0.5,
+    # Bảng rỗng (sinh viên chưa có điểm) chỉ coi là sẵn sàng khi 0 dòng giữ nguyên lâu hơn, vì dòng có thể chưa render
+    "empty_stable_for": 2.0,
+    "poll_interval": 0.1,
+}
 
-class ChienLuocCaiThien(BaseModel):
-    """Model cho chiến lược cải thiện"""
-    ten_chien_luoc: str = Field(..., description="Tên chiến lược")
-    mo_ta: str = Field(..., description="Mô tả chi tiết chiến lược")
-    thoi_gian_thuc_hien: str = Field(..., description="Thời gian thực hiện ước tính")
-    do_kho: str = Field(..., description="Mức độ khó: 'Dễ', 'Trung bình', 'Khó'")
-    tai_nguyen_can_thiet: List[str] = Field(..., description="Danh sách tài nguyên cần thiết")
+TABLE_ROW_COUNT_JS = """
+const table = document.getElementById('lsKetQuaHocTap');
+return table ? table.querySelectorAll('tbody > tr').length : 0;
+"""
 
-class KeHoachHocTap(BaseModel):
-    """Model cho kế hoạch học tập"""
-    muc_tieu_gpa: float = Field(..., description="Mục tiêu GPA muốn đạt được")
-    thoi_gian_du_kien: str = Field(..., description="Thời gian dự kiến để đạt mục tiêu")
-    chien_luoc_chinh: List[ChienLuocCaiThien] = Field(..., description="Các chiến lược chính")
-    cac_buoc_thuc_hien: List[str] = Field(..., description="Các bước thực hiện cụ thể theo thứ tự")
-    rui_ro_tiem_an: List[str] = Field(..., description="Các rủi ro tiềm ẩn và cách phòng tránh")
+# Script lấy toàn bộ bảng điểm trong một lần gọi WebDriver (thay vì ~8 lần gọi mỗi môn)
+TABLE_SNAPSHOT_JS = """
+const table = document.getElementById('lsKetQuaHocTap');
+if (!table) { return null; }
+const bodyRows = [];
+table.querySelectorAll('tbody > tr').forEach(tr => {
+    bodyRows.push(Array.from(tr.querySelectorAll('td'), td => td.innerText));
+});
+const footerRows = [];
+table.querySelectorAll('tr').forEach(tr => {
+    const tds = Array.from(tr.children).filter(td => td.tagName === 'TD' && td.getAttribute('colspan') === '2');
+    if (tds.length === 0) { return; }
+    footerRows.push(tds.map(td => {
+        const b = td.querySelector('b');
+        return {text: td.innerText, b: b ? b.innerText : null};
+    }));
+});
+return {body_rows: bodyRows, footer_rows: footerRows};
+"""
 
-class PhanTichKetQua(BaseModel):
-    """Model chính cho kết quả phân tích"""
-    gpa_hien_tai: float = Field(..., description="GPA hiện tại của sinh viên")
-    tong_tin_chi_da_hoc: int = Field(..., description="Tổng số tín chỉ đã học")
-    nhan_xet_tong_quan: str = Field(..., description="Nhận xét chi tiết về tình hình học tập")
-    diem_manh: List[str] = Field(..., description="Các điểm mạnh trong học tập")
-    diem_yeu: List[str] = Field(..., description="Các điểm yếu cần cải thiện")
-    mon_can_cai_thien: List[MonCanCaiThien] = Field(..., description="Danh sách môn học cần cải thiện")
-    hoc_phan_uu_tien: List[HocPhanUuTien] = Field(..., description="Danh sách học phần ưu tiên")
-    ke_hoach_chi_tiet: KeHoachHocTap = Field(..., description="Kế hoạch học tập chi tiết")
-    du_bao_ket_qua: str = Field(..., description="Dự báo khả năng đạt được mục tiêu")
+class LoginFailed(ValueError):
+    """CAS từ chối tài khoản/mật khẩu (thử lại không có ích)"""
+
+# Các model pydantic nằm ở Analysis_models, vẫn import được từ module này như trước
+ANALYSIS_MODELS = ("MonCanCaiThien", "HocPhanUuTien", "ChienLuocCaiThien", "KeHoachHocTap",
+                   "PhanTichKetQua", "NhanXetPhanTich")
+
+def __getattr__(name: str):
+    if name in ANALYSIS_MODELS:
+        import Analysis_models
+        return getattr(Analysis_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class GpaAnalyzer:
     """Class chính để phân tích GPA"""
     
-    def __init__(self, output_file: str = "ket_qua.json"):
+    def __init__(self, output_file: str = "ket_qua.json", readiness_timeouts: Optional[Dict[str, float]] = None,
+                 session_store=None, keep_driver_alive: bool = False,
+                 login_url: str = SSO_LOGIN_URL, grades_url: str = GRADES_URL, fetcher=None,
+                 model_id: str = "qwen3:8b", analysis_cache=None, index_path: Optional[str] = None, embedder=None,
+                 inline_transcript: bool = True, transcript_token_budget: int = Prompt_compactor.DEFAULT_TOKEN_BUDGET,
+                 tokenizer=None, series_file: Optional[str] = None, transcript_store=None, history_db=None,
+                 curriculum_path: Optional[str] = None, curriculum_index=None,
+                 remaining_semesters: Optional[int] = None, max_credits_per_semester: int = 24,
+                 tracer: Optional[Tracer] = None):
         self.output_file = output_file
+        self.readiness_timeouts = {**DEFAULT_READINESS_TIMEOUTS, **(readiness_timeouts or {})}
+        self.wait_timings: Dict[str, float] = {}
+        # session_store: Session_store.SessionStore (tùy chọn) để dùng lại cookie giữa các lần chạy
+        self.session_store = session_store
+        # keep_driver_alive: giữ một trình duyệt cho nhiều lần scrape, chỉ đóng khi cleanup(force=True)
+        self.keep_driver_alive = keep_driver_alive
+        self.login_url = login_url
+        self.grades_url = grades_url
+        # fetcher: backend không dùng trình duyệt (ví dụ Http_fetcher.HttpTranscriptFetcher), None = Selenium
+        self.fetcher = fetcher
+        # tracer: Tracing.Tracer để đo thời gian từng bước, đếm round-trip và token (mặc định tắt)
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        if fetcher is not None and getattr(fetcher, "session", None) is not None:
+            self.tracer.instrument_session(fetcher.session)
+        self.model_id = model_id
+        # analysis_cache: Analysis_cache.AnalysisCache (tùy chọn) để không gọi lại LLM khi dữ liệu không đổi
+        self.analysis_cache = analysis_cache
+        self.index_path = index_path or os.path.splitext(output_file)[0] + ".index.json"
+        # Chuỗi GPA theo học kỳ dạng cột, đọc lại không cần parse câu footer
+        self.series_file = series_file or os.path.splitext(output_file)[0] + ".series.json"
+        # transcript_store: Transcript_store.TranscriptStore (tùy chọn), nối thêm mỗi lần scrape vào kho dạng cột
+        self.transcript_store = transcript_store
+        self.username: Optional[str] = None
+        # history_db: History_db.HistoryDB (tùy chọn), lưu mọi lần scrape và diff để bỏ qua các bước khi không đổi
+        self.history_db = history_db
+        self.last_diff: Optional[Dict[str, Any]] = None
+        # Mọi dòng môn học của lần scrape gần nhất (kể cả lần học không phải tốt nhất), ghi vào history_db
+        self.attempts: List[Dict[str, Any]] = []
+        # curriculum_path: file PDF chương trình đào tạo (từ GUI), parse một lần và cache theo hash file
+        self.curriculum_path = curriculum_path
+        self.curriculum_index = curriculum_index
+        self.curriculum: Optional[Dict[str, Any]] = None
+        # remaining_semesters: số kỳ còn lại (từ GUI), dùng để xếp lịch học lại/học phần còn thiếu
+        self.remaining_semesters = remaining_semesters
+        self.max_credits_per_semester = max_credits_per_semester
+        self.embedder = embedder
+        # inline_transcript: chèn bảng điểm rút gọn vào instructions thay vì cho agent tìm trong index
+        self.inline_transcript = inline_transcript
+        self.transcript_token_budget = transcript_token_budget
+        # tokenizer: hàm encode (text -> list token) để đếm token chính xác, None = ước lượng
+        self.tokenizer = tokenizer
+        self.bang_diem_gon = ""
+        self.prompt_report: Dict[str, Any] = {}
         self.driver = None
         self.knowledge_base = None
         self.agent = None
+        self.ollama_model = None
+        self.data: Optional[Dict[str, Any]] = None
+        self.metrics: Optional[Dict[str, Any]] = None
+        self.stream_timings: Dict[str, float] = {}
         
+    @traced("driver_launch")
     def setup_driver(self):
         """Thiết lập webdriver với error handling"""
+        if self.fetcher is not None:
+            logger.info("Đang dùng backend HTTP, bỏ qua thiết lập webdriver")
+            return
+        
+        if self.driver is not None and self.keep_driver_alive:
+            logger.info("Dùng lại webdriver đang chạy")
+            return
+        
+        from selenium import webdriver
         try:
             options = webdriver.EdgeOptions()
             options.add_argument('--disable-blink-features=AutomationControlled')
             options.add_experimental_option("excludeSwitches", ["enable-automation"])
             options.add_experimental_option('useAutomationExtension', False)
             
-            self.driver = webdriver.Edge(options=options)
+            self.driver = self.tracer.instrument_driver(webdriver.Edge(options=options))
             self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
             logger.info("Webdriver đã được thiết lập thành công")
             
@@ -106,33 +162,32 @@ class GpaAnalyzer:
             logger.error(f"Lỗi khi thiết lập webdriver: {e}")
             raise
     
+    @traced("login_and_scrape")
     def login_and_scrape(self, username: str, password: str) -> Dict[str, Any]:
         """Đăng nhập và scrape dữ liệu với error handling"""
+        self.wait_timings = {}
+        self.username = username
+        if self.fetcher is not None:
+            return self._fetch_http(username, password)
+        
+        from selenium.common.exceptions import TimeoutException, NoSuchElementException
         try:
-            self.driver.get("https://sso.hcmut.edu.vn/cas/login?service=https%3A%2F%2Fmybk.hcmut.edu.vn%2Fapp%2Flogin%2Fcas")
-            
-            # Đăng nhập
-            username_field = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.NAME, "username"))
-            )
-            username_field.send_keys(username)
-            
-            password_field = self.driver.find_element(By.NAME, "password")
-            password_field.send_keys(password)
-            
-            login_button = self.driver.find_element(By.NAME, 'submit')
-            login_button.click()
+            if self.session_store is not None and self._restore_session(username):
+                logger.info("Đã dùng lại phiên đăng nhập đã lưu, bỏ qua đăng nhập CAS")
+            else:
+                self._login(username, password)
+                
+                # Chuyển đến trang bảng điểm
+                self.driver.get(self.grades_url)
             
-            # Chuyển đến trang bảng điểm
-            self.driver.get("https://mybk.hcmut.edu.vn/app/sinh-vien/ket-qua-hoc-tap/bang-diem-hoc-ky")
-            time.sleep(10)  # Đợi một chút để trang load
+            self._wait_for_grades_table()
+            data = self._extract_grades_data()
             
-            # Đợi trang load
-            WebDriverWait(self.driver, 15).until(
-                EC.presence_of_element_located((By.ID, "lsKetQuaHocTap"))
-            )
+            if self.session_store is not None:
+                self.session_store.save(username, self._get_all_cookies())
             
-            return self._extract_grades_data()
+            self._record_history(data)
+            return data
             
         except TimeoutException:
             logger.error("Timeout khi tải trang")
@@ -144,52 +199,296 @@ class GpaAnalyzer:
             logger.error(f"Lỗi trong quá trình đăng nhập và scrape: {e}")
             raise
     
-    def _extract_grades_data(self) -> Dict[str, Any]:
+    def _fetch_http(self, username: str, password: str) -> Dict[str, Any]:
+        """Backend HTTP: lấy snapshot bảng điểm qua fetcher, không cần selenium"""
+        try:
+            with self.tracer.span("http_fetch"):
+                snapshot = self.fetcher.fetch_snapshot(username, password)
+            data = self._parse_table_snapshot(snapshot)
+            self._record_history(data)
+            return data
+        except Exception as e:
+            logger.error(f"Lỗi trong quá trình đăng nhập và scrape: {e}")
+            raise
+    
+    def _record_history(self, data: Dict[str, Any]):
+        """Ghi lần scrape vào lịch sử và giữ lại diff để các bước sau bỏ qua khi không có gì thay đổi"""
+        self.last_diff = None
+        if self.history_db is not None:
+            self.last_diff = self.history_db.record_scrape(self.username, data, attempts=self.attempts)
+    
+    @property
+    def has_changes(self) -> bool:
+        """Bảng điểm có thay đổi so với lần scrape trước không (luôn True nếu không dùng lịch sử)"""
+        return self.last_diff is None or self.last_diff["has_changes"]
+    
+    @traced("sso_login")
+    def _login(self, username: str, password: str):
+        """Đăng nhập qua form CAS và đợi chuyển hướng về mybk"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+        # Xóa cookie cũ để CAS không tự đăng nhập bằng phiên của tài khoản khác
+        self._clear_cookies()
+        self.driver.get(self.login_url)
+        
+        # Đăng nhập
+        username_field = WebDriverWait(self.driver, 10).until(
+            EC.presence_of_element_located((By.NAME, "username"))
+        )
+        username_field.send_keys(username)
+        
+        password_field = self.driver.find_element(By.NAME, "password")
+        password_field.send_keys(password)
+        
+        login_button = self.driver.find_element(By.NAME, 'submit')
+        login_button.click()
+        
+        # Đợi SSO chuyển hướng về mybk (hoặc CAS báo lỗi đăng nhập) thay vì sleep cố định
+        def redirected_or_rejected(driver) -> bool:
+            return self._left_login_page(driver) or len(driver.find_elements(By.ID, "msg")) > 0
+        
+        self._wait_for("sso_redirect", redirected_or_rejected)
+        if not self._left_login_page(self.driver):
+            raise LoginFailed("Đăng nhập CAS thất bại: sai tài khoản hoặc mật khẩu")
+    
+    def _left_login_page(self, driver) -> bool:
+        """Điều kiện: trình duyệt đã rời trang đăng nhập CAS và về tới host của mybk"""
+        current = urlparse(driver.current_url)
+        login = urlparse(self.login_url)
+        return (
+            current.netloc == urlparse(self.grades_url).netloc
+            and (current.netloc, current.path) != (login.netloc, login.path)
+        )
+    
+    @traced("session_restore")
+    def _restore_session(self, username: str) -> bool:
+        """Nạp cookie đã lưu và kiểm tra phiên còn hợp lệ bằng cách mở trang bảng điểm"""
+        from selenium.webdriver.common.by import By
+        cookies = self.session_store.load(username)
+        if not cookies:
+            return False
+        
+        self._clear_cookies()
+        self._set_cookies(cookies)
+        self.driver.get(self.grades_url)
         
-        """Trích xuất dữ liệu bảng điểm"""
+        # Phiên hợp lệ: bảng điểm xuất hiện; phiên hết hạn: mybk chuyển về trang đăng nhập CAS
+        login_netloc = urlparse(self.login_url).netloc
+        login_path = urlparse(self.login_url).path
+        
+        def restored_or_rejected(driver) -> bool:
+            current = urlparse(driver.current_url)
+            if (current.netloc, current.path) == (login_netloc, login_path):
+                return True
+            return len(driver.find_elements(By.ID, "lsKetQuaHocTap")) > 0
+        
+        self._wait_for("session_restore", restored_or_rejected, required=False)
+        if self.driver.find_elements(By.ID, "lsKetQuaHocTap"):
+            return True
+        
+        logger.info("Phiên đăng nhập đã lưu không còn hợp lệ, đăng nhập lại bằng form")
+        self.session_store.clear(username)
+        return False
+    
+    def _get_all_cookies(self) -> List[Dict[str, Any]]:
+        """Lấy cookie của mọi domain (CAS + mybk) qua CDP, fallback về cookie của trang hiện tại"""
+        from selenium.common.exceptions import WebDriverException
+        try:
+            cdp_cookies = self.driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        except (AttributeError, KeyError, WebDriverException):
+            return self.driver.get_cookies()
+        
+        cookies = []
+        for c in cdp_cookies:
+            cookie = {
+                "name": c["name"],
+                "value": c["value"],
+                "domain": c["domain"],
+                "path": c.get("path", "/"),
+                "secure": c.get("secure", False),
+                "httpOnly": c.get("httpOnly", False),
+            }
+            if not c.get("session", False) and c.get("expires", -1) > 0:
+                cookie["expiry"] = int(c["expires"])
+            cookies.append(cookie)
+        return cookies
+    
+    def _set_cookies(self, cookies: List[Dict[str, Any]]):
+        """Nạp cookie cho mọi domain qua CDP, fallback về add_cookie sau khi mở từng domain"""
+        from selenium.common.exceptions import WebDriverException
+        try:
+            for cookie in cookies:
+                params = {key: cookie[key] for key in ("name", "value", "domain", "path", "secure", "httpOnly") if key in cookie}
+                if "expiry" in cookie:
+                    params["expires"] = cookie["expiry"]
+                self.driver.execute_cdp_cmd("Network.setCookie", params)
+            return
+        except (AttributeError, WebDriverException):
+            pass
+        
+        for domain in {cookie.get("domain", "").lstrip(".") for cookie in cookies}:
+            if not domain:
+                continue
+            # add_cookie chỉ nhận cookie của domain đang mở
+            scheme = urlparse(self.grades_url).scheme
+            self.driver.get(f"{scheme}://{domain}/")
+            for cookie in cookies:
+                if cookie.get("domain", "").lstrip(".") == domain:
+                    self.driver.add_cookie(cookie)
+    
+    def _clear_cookies(self):
+        """Xóa cookie của mọi domain"""
+        from selenium.common.exceptions import WebDriverException
+        try:
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        except (AttributeError, WebDriverException):
+            self.driver.delete_all_cookies()
+    
+    def _wait_for(self, stage: str, condition, required: bool = True) -> bool:
+        """Đợi một điều kiện sẵn sàng và ghi lại thời gian đã đợi vào wait_timings"""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+        timeout = self.readiness_timeouts[stage]
+        start = time.monotonic()
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=self.readiness_timeouts["poll_interval"]).until(condition)
+            return True
+        except TimeoutException:
+            if required:
+                logger.error(f"Timeout ({timeout}s) khi đợi bước '{stage}'")
+                raise
+            logger.warning(f"Timeout ({timeout}s) khi đợi bước '{stage}', tiếp tục trích xuất")
+            return False
+        finally:
+            self.wait_timings[stage] = time.monotonic() - start
+            self.tracer.add_span(f"wait.{stage}", self.wait_timings[stage])
+            logger.info(f"Đã đợi '{stage}' trong {self.wait_timings[stage]:.2f}s")
+    
+    @traced("page_ready")
+    def _wait_for_grades_table(self):
+        """Đợi bảng điểm xuất hiện, số dòng tbody ổn định và các dòng GPA cuối học kỳ được render"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        self._wait_for("table_present", EC.presence_of_element_located((By.ID, "lsKetQuaHocTap")))
+        self._wait_for("rows_stable", self._table_rows_stable(self.readiness_timeouts["stable_for"],
+                                                              self.readiness_timeouts["empty_stable_for"]))
+        # Sinh viên chưa có học kỳ hoàn tất sẽ không có dòng GPA nên bước này không bắt buộc
+        self._wait_for(
+            "footer_rendered",
+            EC.presence_of_element_located((By.CSS_SELECTOR, "#lsKetQuaHocTap td[colspan='2'] b")),
+            required=False
+        )
+    
+    def _table_rows_stable(self, stable_for: float, empty_stable_for: Optional[float] = None):
+        """Điều kiện: số dòng tbody không đổi trong ít nhất stable_for giây (empty_stable_for nếu bảng rỗng)"""
+        empty_stable_for = stable_for if empty_stable_for is None else empty_stable_for
+        state = {"count": None, "since": 0.0}
+        
+        def condition(driver) -> bool:
+            count = driver.execute_script(TABLE_ROW_COUNT_JS)
+            now = time.monotonic()
+            if count != state["count"]:
+                state["count"] = count
+                state["since"] = now
+                return False
+            return now - state["since"] >= (stable_for if count else empty_stable_for)
+        
+        return condition
+    
+    @traced("extract")
+    def _extract_grades_data(self, single_round_trip: bool = True) -> Dict[str, Any]:
+        """Trích xuất dữ liệu bảng điểm (mặc định lấy cả bảng trong một lần gọi WebDriver)"""
+        from selenium.common.exceptions import WebDriverException
+        if single_round_trip:
+            try:
+                snapshot = self.driver.execute_script(TABLE_SNAPSHOT_JS)
+                if snapshot is not None:
+                    return self._parse_table_snapshot(snapshot)
+                logger.warning("Không tìm thấy bảng điểm qua execute_script, chuyển sang trích xuất từng phần tử")
+            except WebDriverException as e:
+                logger.warning(f"Lỗi khi lấy bảng điểm bằng execute_script, chuyển sang trích xuất từng phần tử: {e}")
+        
+        return self._extract_grades_data_per_element()
+    
+    @traced("parse_rows")
+    def _parse_table_snapshot(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Phân tích snapshot bảng điểm (kết quả của TABLE_SNAPSHOT_JS) ngay tại local"""
+        try:
+            best_attempts = BestAttemptIndex()
+            self.attempts = []
+            semesters = Semester_records.SemesterBuilder()
+            total_gpa = []
+            
+            # Xử lý từng dòng điểm (dòng footer xen giữa đánh dấu hết một học kỳ)
+            for cells in snapshot.get("body_rows", []):
+                if len(cells) >= 8:
+                    try:
+                        mon_hoc = self._build_mon_hoc([cell.strip() for cell in cells])
+                        best_attempts.add(mon_hoc)
+                        self.attempts.append(mon_hoc)
+                        semesters.add_course(mon_hoc)
+                    except (ValueError, IndexError) as e:
+                        logger.warning(f"Lỗi khi xử lý dòng dữ liệu: {e}")
+                        continue
+                elif Semester_records.is_footer_row([cell.strip() for cell in cells]):
+                    semesters.end_semester()
+            
+            # Xử lý thông tin GPA
+            for footer_tds in snapshot.get("footer_rows", []):
+                if len(footer_tds) >= 3:
+                    try:
+                        if footer_tds[1]["b"] is None or footer_tds[2]["b"] is None:
+                            raise ValueError("Thiếu thẻ <b> chứa GPA")
+                        total_gpa.append({
+                            "tin_chi": footer_tds[0]["text"].strip(),
+                            "gpa_hk": self._parse_float(footer_tds[1]["b"].strip()),
+                            "gpa_chung": self._parse_float(footer_tds[2]["b"].strip())
+                        })
+                    except ValueError as e:
+                        logger.warning(f"Lỗi khi xử lý GPA: {e}")
+                        continue
+            
+            hoc_ky = semesters.build(total_gpa)
+            self.tracer.count("rows.parsed", len(snapshot.get("body_rows", [])))
+            return {
+                "bang_diem": best_attempts.to_list(),
+                "total_gpa": total_gpa,
+                "hoc_ky": hoc_ky,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            
+        except Exception as e:
+            logger.error(f"Lỗi khi phân tích snapshot bảng điểm: {e}")
+            raise
+    
+    @traced("parse_rows_per_element")
+    def _extract_grades_data_per_element(self) -> Dict[str, Any]:
+        """Trích xuất dữ liệu bảng điểm bằng cách truy vấn từng phần tử (fallback)"""
+        from selenium.webdriver.common.by import By
         try:
             table = self.driver.find_element(By.ID, "lsKetQuaHocTap")
             rows = table.find_elements(By.XPATH, ".//tbody/tr")
             
-            bang_diem = []
+            best_attempts = BestAttemptIndex()
+            self.attempts = []
+            semesters = Semester_records.SemesterBuilder()
             total_gpa = []
             
-            # Xử lý từng dòng điểm
+            # Xử lý từng dòng điểm (dòng footer xen giữa đánh dấu hết một học kỳ)
             for row in rows:
                 cols = row.find_elements(By.TAG_NAME, "td")
                 if len(cols) >= 8:
                     try:
-                        mon_hoc = {
-                            "ma_mon": cols[0].text.strip(),
-                            "ten_mon": cols[1].text.strip(),
-                            "tin_chi": int(cols[2].text.strip()) if cols[2].text.strip().isdigit() else 0,
-                            "diem_tp": cols[3].text.strip(),
-                            "diem_so": self._parse_float(cols[4].text.strip()),
-                            "diem_chu": cols[5].text.strip(),
-                            "diem_dat": cols[6].text.strip(),
-                            "cap_nhat": cols[7].text.strip()
-                        }
-                        
-                        filtered_bang_diem = {}
-                        for mon in bang_diem:
-                            ma_mon = mon["ma_mon"]
-                            diem_so = mon["diem_so"]
-
-                            if (
-                                ma_mon not in filtered_bang_diem or 
-                                (diem_so is not None and diem_so > filtered_bang_diem[ma_mon]["diem_so"])
-    ):
-        
-                                if diem_so in [None, 0.0]:
-                                    mon["tin_chi"] = 0
-                                filtered_bang_diem[ma_mon] = mon
-
-                        bang_diem = list(filtered_bang_diem.values())
-        
-                        bang_diem.append(mon_hoc)
+                        mon_hoc = self._build_mon_hoc([col.text.strip() for col in cols[:8]])
+                        best_attempts.add(mon_hoc)
+                        self.attempts.append(mon_hoc)
+                        semesters.add_course(mon_hoc)
                     except (ValueError, IndexError) as e:
                         logger.warning(f"Lỗi khi xử lý dòng dữ liệu: {e}")
                         continue
+                elif Semester_records.is_footer_row([col.text.strip() for col in cols]):
+                    semesters.end_semester()
                     
             
             # Xử lý thông tin GPA
@@ -217,9 +516,11 @@ class GpaAnalyzer:
                         logger.warning(f"Lỗi khi xử lý GPA: {e}")
                         continue
             
+            hoc_ky = semesters.build(total_gpa)
             return {
-                "bang_diem": bang_diem,
+                "bang_diem": best_attempts.to_list(),
                 "total_gpa": total_gpa,
+                "hoc_ky": hoc_ky,
                 "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
             }
             
@@ -227,6 +528,19 @@ class GpaAnalyzer:
             logger.error(f"Lỗi khi trích xuất dữ liệu: {e}")
             raise
     
+    def _build_mon_hoc(self, cols: List[str]) -> Dict[str, Any]:
+        """Tạo bản ghi môn học từ text (đã strip) của 8 cột đầu tiên"""
+        return {
+            "ma_mon": cols[0],
+            "ten_mon": cols[1],
+            "tin_chi": int(cols[2]) if cols[2].isdigit() else 0,
+            "diem_tp": cols[3],
+            "diem_so": self._parse_float(cols[4]),
+            "diem_chu": cols[5],
+            "diem_dat": cols[6],
+            "cap_nhat": cols[7]
+        }
+    
     def _parse_float(self, value: str) -> float:
         """Parse float value an toàn"""
         try:
@@ -234,31 +548,105 @@ class GpaAnalyzer:
         except (ValueError, AttributeError):
             return 0.0
     
+    @traced("save_data")
     def save_data(self, data: Dict[str, Any]):
         """Lưu dữ liệu vào file JSON"""
         try:
-            with open(self.output_file, "w", encoding="utf-8") as f:
+            with self.tracer.span("write_json"), open(self.output_file, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
-            logger.info(f"Dữ liệu đã được lưu vào {self.output_file}")
+            with self.tracer.span("write_series"):
+                Semester_records.save_columns(Semester_records.semesters_of(data), self.series_file)
+            logger.info(f"Dữ liệu đã được lưu vào {self.output_file} (chuỗi học kỳ: {self.series_file})")
+            if self.transcript_store is not None and self.has_changes:
+                student = self.username or os.path.splitext(os.path.basename(self.output_file))[0]
+                with self.tracer.span("store_append"):
+                    self.transcript_store.append(student, data)
         except Exception as e:
             logger.error(f"Lỗi khi lưu dữ liệu: {e}")
             raise
     
+    def load_data(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """Đọc bảng điểm đã lưu (mặc định output_file) thay cho scrape, không cần trình duyệt"""
+        path = path or self.output_file
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc bảng điểm {path}: {e}")
+            raise
+        data["bang_diem"] = BestAttemptIndex().extend(data.get("bang_diem", [])).to_list()
+        self.data = data
+        return data
+    
+    @traced("warm_up")
+    def warm_up(self, keep_alive: str = "30m"):
+        """Nạp sẵn model Ollama vào bộ nhớ và đọc index môn học từ đĩa"""
+        if not self.inline_transcript:
+            if self.knowledge_base is None:
+                from Course_index import CourseIndex
+                self.knowledge_base = CourseIndex(self.index_path, embedder=self.embedder)
+            with self.tracer.span("knowledge_base_load"):
+                self.knowledge_base.preload()
+        self.load_curriculum()
+        
+        from ollama import Client
+        # Prompt rỗng chỉ nạp model, không sinh token
+        with self.tracer.span("model_warm_up", model=self.model_id):
+            Client().generate(model=self.model_id, prompt="", keep_alive=keep_alive)
+        logger.info(f"Model {self.model_id} đã được nạp sẵn")
+    
+    @traced("curriculum_load")
+    def load_curriculum(self) -> Optional[Dict[str, Any]]:
+        """Chương trình đào tạo đã parse (None nếu không có file), chỉ đọc PDF khi chưa có trong cache"""
+        if self.curriculum is None and self.curriculum_path:
+            if self.curriculum_index is None:
+                from Curriculum_index import CurriculumIndex
+                self.curriculum_index = CurriculumIndex()
+            self.curriculum = self.curriculum_index.load(self.curriculum_path)
+        return self.curriculum
+    
+    def _model(self) -> "Ollama":
+        """Một đối tượng model cho mọi agent của analyzer, giữ lại kết nối tới Ollama giữa các lần phân tích"""
+        from agno.models.ollama import Ollama
+        if self.ollama_model is None or self.ollama_model.id != self.model_id:
+            self.ollama_model = Ollama(id=self.model_id)
+        return self.ollama_model
+    
+    @traced("setup_agent")
     def setup_agent(self, data: Dict[str, Any]):
         """Thiết lập agent với cấu hình nâng cao"""
+        from agno.agent import Agent
+        from agno.tools.reasoning import ReasoningTools
+        from Analysis_models import NhanXetPhanTich
         try:
-            # Tạo knowledge base
-            self.knowledge_base = JSONKnowledgeBase(path=self.output_file)
+            # Index môn học lưu trên đĩa: chỉ index lại môn thay đổi, nạp khi agent tìm kiếm lần đầu
+            if not self.inline_transcript:
+                if self.knowledge_base is None:
+                    from Course_index import CourseIndex
+                    self.knowledge_base = CourseIndex(self.index_path, embedder=self.embedder)
+                if self.has_changes or not os.path.exists(self.index_path):
+                    with self.tracer.span("knowledge_base_update"):
+                        self.knowledge_base.update(data['bang_diem'])
+                else:
+                    logger.info("Bảng điểm không đổi so với lần trước, dùng lại index môn học")
+            
+            # Tính sẵn các số liệu GPA, LLM chỉ viết phần nhận xét
+            self.data = data
+            self.metrics = Gpa_engine.analyze(data['bang_diem'], hoc_ky=Semester_records.semesters_of(data))
             
-            # Lấy thông tin GPA hiện tại
-            current_gpa = data['total_gpa'][-1]['gpa_chung'] if data['total_gpa'] else 0.0
-            total_credits = data['total_gpa'][-1]['tin_chi'] if data['total_gpa'] else 0.0
+            # Bảng điểm rút gọn (bỏ diem_tp, cap_nhat, môn 0 tín chỉ) vừa ngân sách token
+            bang_diem_gon = ""
+            if self.inline_transcript:
+                with self.tracer.span("compact_transcript"):
+                    bang_diem_gon = Prompt_compactor.fit_to_budget(
+                        Prompt_compactor.compact_transcript(data), self.transcript_token_budget, self.tokenizer)
+            self.bang_diem_gon = bang_diem_gon
             
             # Tạo agent với cấu hình nâng cao
             self.agent = Agent(
                 name="GPA Analysis Expert",
                 role="Chuyên gia phân tích và tư vấn cải thiện GPA",
-                model=Ollama(id="qwen3:8b"),
+                model=self._model(),
                 tools=[ReasoningTools(add_instructions=True)],
                 
                 description=dedent("""
@@ -272,20 +660,21 @@ class GpaAnalyzer:
                 
                 instructions=[
                     dedent(f"""
-                    ĐỮ LIỆU CẦN PHÂN TÍCH:
-                    - GPA hiện tại: {current_gpa:.2f}
-                    - Tổng tín chỉ đã học: {total_credits}
+                    ĐỮ LIỆU CẦN PHÂN TÍCH (đã được tính chính xác, KHÔNG tự tính lại):
+                    - GPA hiện tại (thang 4): {self.metrics['gpa_hien_tai']:.2f}
+                    - Tổng tín chỉ tính GPA: {self.metrics['tong_tin_chi_da_hoc']}
                     - Tổng số môn học: {len(data['bang_diem'])}
+                    - GPA tối đa nếu học lại mọi môn yếu đạt {Gpa_engine.ACHIEVABLE_GRADE:.1f}/4: {self.metrics['gpa_toi_da_khi_hoc_lai']:.2f}
+                    
+                    {{bang_diem_gon}}
                     
                     QUY TRÌNH PHÂN TÍCH BẮNG BUỘC:
                     1. SỬ DỤNG REASONING TOOLS để suy luận từng bước
-                    2. CHỈ sử dụng dữ liệu có trong file ket_qua.json
+                    2. CHỈ sử dụng dữ liệu bảng điểm được cung cấp
                     3. KHÔNG tự tạo ra mã môn hoặc tên môn không tồn tại
-                    4. Phân tích dựa trên điểm số thực tế từ trường "diem_so"
-                    5. Ưu tiên các môn có điểm < 4.0 (Grade F) và < 6.0 (Grade D)
-                    6. Những môn có tín chỉ là 0 sẽ BỎ QUA trong phân tích
-                    7. Phải chỉ ra được tên môn học cần cải thiện
-                    """),
+                    4. Dùng các số liệu ở trên, KHÔNG tự tính lại GPA
+                    5. Những môn có tín chỉ là 0 sẽ BỎ QUA trong phân tích
+                    """).replace("{bang_diem_gon}", bang_diem_gon),
                     
                     dedent("""
                     NGUYÊN TẮC PHÂN TÍCH:
@@ -306,25 +695,19 @@ class GpaAnalyzer:
                     """),
                     
                     dedent("""
-                    CÁCH TÍNH TOÁN GPA MỚI:
-                    - Công thức: GPA = (Tổng (điểm_số(theo thang điểm 4) × tín_chỉ)) / Tổng_tín_chỉ
-                    - Khi học lại: thay thế điểm cũ bằng điểm mới
-                    - Ước tính điểm có thể đạt được dựa trên thực tế
-                    
                     LƯU Ý QUAN TRỌNG:
-                    - Nếu một môn xuất hiện nhiều lần, chỉ tính điểm cao nhất
                     - Không đề xuất học lại môn đã có điểm >= 7.0 trừ khi có lý do đặc biệt
                     - Xem xét khả năng tài chính và thời gian của sinh viên
                            
                     """)
                 ],
                 
-                response_model=PhanTichKetQua,
-                knowledge=self.knowledge_base,
-                search_knowledge=True,
+                response_model=NhanXetPhanTich,
+                retriever=None if self.inline_transcript else self.knowledge_base.retriever,
+                search_knowledge=not self.inline_transcript,
                 reasoning=True,
                 markdown=True,
-                add_references=True,
+                add_references=not self.inline_transcript,
                 show_tool_calls=True,
                 
                 # Cấu hình memory và storage
@@ -342,26 +725,173 @@ class GpaAnalyzer:
             logger.error(f"Lỗi khi thiết lập agent: {e}")
             raise
     
-    def analyze_gpa(self, target_gpa: float = 3.6) -> PhanTichKetQua:
+    @traced("compute_metrics")
+    def compute_metrics(self, target_gpa: float, credit_fee: Optional[float] = None) -> Dict[str, Any]:
+        """Số liệu của Gpa_engine cộng các phương án học lại tối ưu của Retake_solver"""
+        import Retake_solver
+        metrics = Gpa_engine.analyze(self.data['bang_diem'], target_gpa,
+                                     hoc_ky=Semester_records.semesters_of(self.data))
+        courses = Gpa_engine.graded_courses(self.data['bang_diem'])
+        with self.tracer.span("retake_solver", courses=len(courses)):
+            plans = Retake_solver.RetakeSolver(courses, credit_fee=credit_fee).solve(target_gpa)
+        
+        metrics['phuong_an_hoc_lai'] = plans
+        metrics['mon_can_cai_thien'] = Retake_solver.plan_to_mon_can_cai_thien(plans[0], courses)
+        metrics['hoc_phan_uu_tien'] = Retake_solver.plan_to_hoc_phan_uu_tien(plans[0])
+        
+        # Học phần bắt buộc còn thiếu theo chương trình đào tạo (sau các môn học lại đã chọn)
+        if self.load_curriculum() is not None:
+            import Curriculum_index
+            remaining = Curriculum_index.remaining_courses(self.curriculum, self.data['bang_diem'])
+            metrics['hoc_phan_con_lai'] = remaining
+            planned = {hoc_phan['ma_mon'] for hoc_phan in metrics['hoc_phan_uu_tien']}
+            metrics['hoc_phan_uu_tien'] += [
+                hoc_phan for hoc_phan in Curriculum_index.remaining_to_hoc_phan_uu_tien(remaining)
+                if hoc_phan['ma_mon'] not in planned
+            ]
+        
+        # Xếp lịch theo số kỳ còn lại, LLM chỉ giải thích lịch này
+        if self.remaining_semesters:
+            import Semester_scheduler
+            gpa, tin_chi = Gpa_engine.weighted_gpa(courses)
+            items = Semester_scheduler.build_items(plans[0], metrics.get('hoc_phan_con_lai'), self.curriculum,
+                                                   expected_grade=gpa,
+                                                   graded={mon['ma_mon']: mon['diem_4'] for mon in courses})
+            from Curriculum_index import is_passed
+            passed = {mon['ma_mon'] for mon in self.data['bang_diem'] if is_passed(mon)}
+            scheduler = Semester_scheduler.SemesterScheduler(
+                items, self.remaining_semesters, self.max_credits_per_semester, credit_fee, passed)
+            with self.tracer.span("semester_scheduler", items=len(items)):
+                metrics['lich_hoc'] = scheduler.schedule(
+                    gpa * tin_chi, tin_chi, gpa, first_semester=len(Semester_records.semesters_of(self.data)) + 1)
+            logger.info(f"Xếp lịch {len(items)} học phần vào {self.remaining_semesters} kỳ "
+                        f"({metrics['lich_hoc']['so_nut']} nút, {metrics['lich_hoc']['thoi_gian']:.3f}s)")
+        return metrics
+    
+    def analyze_offline(self, target_gpa: float = 3.6, credit_fee: Optional[float] = None) -> Dict[str, Any]:
+        """Phân tích không cần model: GPA, phương án học lại, học phần còn lại và lịch học từ bảng điểm đã có"""
+        if self.data is None:
+            self.load_data()
+        metrics = self.compute_metrics(target_gpa, credit_fee)
+        if 'lich_hoc' in metrics:
+            import Semester_scheduler
+            metrics['cac_buoc_thuc_hien'] = Semester_scheduler.schedule_steps(metrics['lich_hoc'])
+        return metrics
+    
+    def _cache_key(self, target_gpa: float, credit_fee: Optional[float]) -> Optional[str]:
+        """Khóa cache của lần phân tích, None nếu không dùng cache"""
+        if self.analysis_cache is None:
+            return None
+        from Analysis_cache import cache_key
+        curriculum = self.load_curriculum()
+        key = cache_key(self.data, target_gpa, self.model_id, self.agent.instructions,
+                        extra={"credit_fee": credit_fee, "curriculum": curriculum["file_hash"] if curriculum else None,
+                               "remaining_semesters": self.remaining_semesters,
+                               "max_credits_per_semester": self.max_credits_per_semester})
+        
+        # Bảng điểm đã đổi: bỏ kết quả phân tích cũ của sinh viên này khỏi cache
+        if self.history_db is not None and self.username:
+            previous = self.history_db.get_meta(self.username, "analysis_key")
+            if previous and previous != key and self.has_changes:
+                self.analysis_cache.delete(previous)
+            self.history_db.set_meta(self.username, "analysis_key", key)
+        return key
+    
+    def _build_query(self, metrics: Dict[str, Any], target_gpa: float) -> str:
+        """Câu hỏi gửi cho agent, kèm kết quả tính toán và phương án học lại tối ưu"""
+        best_plan = metrics['phuong_an_hoc_lai'][0]
+        kha_thi = "CÓ THỂ" if best_plan['dat_muc_tieu'] else "KHÔNG THỂ"
+        chi_phi = f", học phí {best_plan['chi_phi']:,.0f} VNĐ" if best_plan['chi_phi'] else ""
+        phuong_an = ", ".join(mon['ma_mon'] for mon in best_plan['mon']) or "không cần học lại"
+        # Cùng danh sách sẽ được trả về trong kết quả, để ly_do của model khớp với môn và mức tăng GPA
+        mon_yeu = "\n".join(
+            f"- {mon['ma_mon']} {mon['ten_mon']}: {mon['diem_so']} ({mon['diem_chu']}), "
+            f"{mon['tin_chi']} tín chỉ, ưu tiên {mon['muc_do_uu_tien']}"
+            for mon in metrics['mon_can_cai_thien']
+        ) or "- Không có"
+        chuong_trinh = ""
+        if 'hoc_phan_con_lai' in metrics:
+            con_lai = metrics['hoc_phan_con_lai']
+            chuong_trinh = (f"\nCHƯƠNG TRÌNH ĐÀO TẠO: còn {len(con_lai['bat_buoc'])} học phần bắt buộc "
+                            f"({con_lai['tin_chi_bat_buoc_con_lai']} tín chỉ) và "
+                            f"{con_lai['tin_chi_tu_chon_con_lai']} tín chỉ tự chọn.")
+        if 'lich_hoc' in metrics:
+            import Semester_scheduler
+            chuong_trinh += ("\nLỊCH HỌC ĐÃ XẾP (chỉ giải thích, KHÔNG thay đổi lịch này):\n"
+                             + "\n".join(f"- {buoc}" for buoc in Semester_scheduler.schedule_steps(metrics['lich_hoc'])))
+        
+        return dedent(f"""
+        Hãy phân tích chi tiết kết quả học tập của tôi và đưa ra kế hoạch cải thiện để đạt GPA {target_gpa}.
+        
+        KẾT QUẢ TÍNH TOÁN: học lại với mức điểm dự kiến thực tế thì {kha_thi} đạt GPA {target_gpa}
+        (GPA tối đa nếu mọi môn yếu đạt {Gpa_engine.ACHIEVABLE_GRADE:.1f}/4: {metrics['gpa_toi_da_khi_hoc_lai']:.2f}).
+        PHƯƠNG ÁN HỌC LẠI TỐI ƯU: {phuong_an} ({best_plan['tong_tin_chi']} tín chỉ{chi_phi},
+        GPA dự kiến {best_plan['gpa_du_kien']:.2f}).{{chuong_trinh}}
+        
+        CÁC MÔN CẦN CẢI THIỆN (xếp theo phương án học lại rồi mức tăng GPA):
+        {{mon_yeu}}
+        
+        YÊU CẦU CỤ THỂ:
+        1. Phân tích tình hình học tập hiện tại một cách khách quan
+        2. Giải thích vì sao các môn cần cải thiện đã nêu có tác động lớn nhất đến GPA
+        3. Đưa ra kế hoạch cải thiện thực tế và khả thi
+        4. Đánh giá rủi ro và thời gian cần thiết
+        
+        Hãy sử dụng reasoning tools để suy luận từng bước và đưa ra phân tích chính xác nhất.
+        """).replace("{chuong_trinh}", chuong_trinh).replace("{mon_yeu}", mon_yeu)
+    
+    def _report_prompt(self, query: str) -> Dict[str, Any]:
+        """Ghi lại số token (ước lượng) của từng phần prompt trước khi gửi cho model"""
+        self.prompt_report = Prompt_compactor.prompt_report(
+            {"description": self.agent.description or "", "instructions": "\n".join(self.agent.instructions), "query": query},
+            self.bang_diem_gon, self.data, self.transcript_token_budget, self.tokenizer)
+        logger.info(f"Prompt ~{self.prompt_report['total']} token {self.prompt_report['sections']}, "
+                    f"bảng điểm {self.prompt_report['transcript']}/{self.prompt_report['transcript_budget']} "
+                    f"(JSON đầy đủ {self.prompt_report['full_transcript']})")
+        return self.prompt_report
+    
+    def _record_prompt_usage(self, response):
+        """Số token prompt thực tế model đã xử lý (prompt_eval_count của Ollama) cho từng lần gọi"""
+        metrics = getattr(response, "metrics", None) or {}
+        if metrics.get("input_tokens"):
+            self.prompt_report["measured_input_tokens"] = metrics["input_tokens"]
+            logger.info(f"Token prompt thực tế: {metrics['input_tokens']}")
+        
+        # Ollama báo thời gian nạp model, prefill (đọc prompt) và decode (sinh token) theo nano giây
+        self.tracer.count("llm.calls", len(metrics.get("input_tokens") or []))
+        self.tracer.count("llm.input_tokens", sum(metrics.get("input_tokens") or []))
+        self.tracer.count("llm.output_tokens", sum(metrics.get("output_tokens") or []))
+        for extra in metrics.get("additional_metrics") or []:
+            for key, name in (("load_duration", "model_load"), ("prompt_eval_duration", "model_prefill"),
+                              ("eval_duration", "model_decode")):
+                if extra.get(key):
+                    self.tracer.add_span(name, extra[key] / 1e9)
+    
+    @traced("analyze_gpa")
+    def analyze_gpa(self, target_gpa: float = 3.6, credit_fee: Optional[float] = None) -> "PhanTichKetQua":
         """Phân tích GPA và đưa ra kế hoạch cải thiện"""
+        from Analysis_models import NhanXetPhanTich, PhanTichKetQua
         try:
-            query = dedent(f"""
-            Hãy phân tích chi tiết kết quả học tập của tôi và đưa ra kế hoạch cải thiện để đạt GPA {target_gpa}.
-            
-            YÊU CẦU CỤ THỂ:
-            1. Phân tích tình hình học tập hiện tại một cách khách quan
-            2. Xác định chính xác các môn cần cải thiện (điểm < 6.0)
-            3. Ưu tiên các môn có tác động lớn nhất đến GPA
-            4. Đưa ra kế hoạch cải thiện thực tế và khả thi
-            5. Tính toán cụ thể khả năng đạt được mục tiêu GPA {target_gpa}
-            6. Đánh giá rủi ro và thời gian cần thiết
+            cache_key = self._cache_key(target_gpa, credit_fee)
+            if cache_key is not None:
+                cached = self.analysis_cache.get(cache_key, PhanTichKetQua)
+                self.tracer.count("analysis_cache.hit" if cached is not None else "analysis_cache.miss")
+                if cached is not None:
+                    return cached
             
-            Hãy sử dụng reasoning tools để suy luận từng bước và đưa ra phân tích chính xác nhất.
-            """)
+            metrics = self.compute_metrics(target_gpa, credit_fee)
+            query = self._build_query(metrics, target_gpa)
+            self._report_prompt(query)
+            with self.tracer.span("model_run", model=self.model_id):
+                response = self.agent.run(query)
+                self._record_prompt_usage(response)
             
-            response = self.agent.run(query)
-            
-            if hasattr(response, 'content') and response.content:
+            if hasattr(response, 'content') and isinstance(response.content, NhanXetPhanTich):
+                result = self._build_result(metrics, response.content, target_gpa)
+                if cache_key is not None:
+                    self.analysis_cache.put(cache_key, result, {"target_gpa": target_gpa, "model_id": self.model_id})
+                return result
+            elif hasattr(response, 'content') and response.content:
                 return response.content
             else:
                 logger.error("Không nhận được phản hồi từ agent")
@@ -371,77 +901,171 @@ class GpaAnalyzer:
             logger.error(f"Lỗi khi phân tích GPA: {e}")
             raise
     
-    def cleanup(self):
-        """Dọn dẹp tài nguyên"""
-        if self.driver:
+    def analyze_gpa_stream(self, target_gpa: float = 3.6, credit_fee: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Phân tích GPA ở chế độ stream: trả về dần các sự kiện token/reasoning/field, cuối cùng là result
+        
+        Sự kiện: {"type": "field", "name", "value", "source"}, {"type": "token", "content"},
+        {"type": "reasoning", "content"}, {"type": "result", "value", "timings"}.
+        """
+        from Analysis_models import NhanXetPhanTich, PhanTichKetQua
+        from Stream_parser import IncrementalJsonFields
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        
+        def mark(name: str):
+            timings.setdefault(name, time.perf_counter() - start)
+        
+        try:
+            cache_key = self._cache_key(target_gpa, credit_fee)
+            if cache_key is not None:
+                cached = self.analysis_cache.get(cache_key, PhanTichKetQua)
+                if cached is not None:
+                    mark("first_useful_output")
+                    for name, value in cached.model_dump().items():
+                        yield {"type": "field", "name": name, "value": value, "source": "cache"}
+                    timings["total"] = time.perf_counter() - start
+                    self.stream_timings = timings
+                    yield {"type": "result", "value": cached, "timings": timings}
+                    return
+            
+            # Số liệu tính sẵn được hiển thị ngay, trước khi model trả token đầu tiên
+            metrics = self.compute_metrics(target_gpa, credit_fee)
+            mark("first_useful_output")
+            for name in ("gpa_hien_tai", "tong_tin_chi_da_hoc", "mon_can_cai_thien", "hoc_phan_uu_tien"):
+                yield {"type": "field", "name": name, "value": metrics[name], "source": "engine"}
+            
+            # Khi có response_model, agno chỉ trả kết quả cuối; tắt parse để nhận token rồi tự parse dần
+            parser = IncrementalJsonFields()
+            query = self._build_query(metrics, target_gpa)
+            self._report_prompt(query)
+            # agno giữ lại stream/stream_intermediate_steps sau lần run(stream=True), nên khôi phục cả hai
+            # để analyze_gpa() gọi sau đó trên cùng agent vẫn nhận RunResponse thay vì generator
+            saved = {name: getattr(self.agent, name) for name in ("parse_response", "stream", "stream_intermediate_steps")}
+            self.agent.parse_response = False
+            stream_start = time.perf_counter()
+            try:
+                for event in self.agent.run(query, stream=True, stream_intermediate_steps=True):
+                    if event.event == "ReasoningStep":
+                        mark("first_reasoning_step")
+                        yield {"type": "reasoning", "content": getattr(event, "reasoning_content", "") or str(event.content)}
+                    elif event.event == "RunResponseContent":
+                        thinking = getattr(event, "thinking", None) or getattr(event, "reasoning_content", None)
+                        if thinking:
+                            yield {"type": "reasoning", "content": thinking}
+                        if isinstance(event.content, str) and event.content:
+                            mark("first_token")
+                            yield {"type": "token", "content": event.content}
+                            for name, value in parser.feed(event.content):
+                                mark("first_model_field")
+                                yield {"type": "field", "name": name, "value": value, "source": "model"}
+            finally:
+                for name, value in saved.items():
+                    setattr(self.agent, name, value)
+                self.tracer.add_span("model_stream", time.perf_counter() - stream_start, model=self.model_id,
+                                     first_token=timings.get("first_token"))
+            self._record_prompt_usage(self.agent.run_response)
+            
+            if parser.result() is None:
+                raise ValueError("Agent không trả về JSON phân tích hoàn chỉnh")
+            nhan_xet = NhanXetPhanTich.model_validate(parser.result())
+            result = self._build_result(metrics, nhan_xet, target_gpa)
+            if cache_key is not None:
+                self.analysis_cache.put(cache_key, result, {"target_gpa": target_gpa, "model_id": self.model_id})
+            
+            timings["total"] = time.perf_counter() - start
+            self.stream_timings = timings
+            logger.info("Thời gian stream: " + ", ".join(f"{name}={value:.2f}s" for name, value in timings.items()))
+            yield {"type": "result", "value": result, "timings": timings}
+            
+        except Exception as e:
+            logger.error(f"Lỗi khi phân tích GPA (stream): {e}")
+            raise
+    
+    def _build_result(self, metrics: Dict[str, Any], nhan_xet: "NhanXetPhanTich", target_gpa: float) -> "PhanTichKetQua":
+        """Ghép số liệu của Gpa_engine với phần nhận xét của LLM thành PhanTichKetQua"""
+        from Analysis_models import HocPhanUuTien, MonCanCaiThien, PhanTichKetQua
+        update = {"muc_tieu_gpa": target_gpa}
+        if 'lich_hoc' in metrics:
+            import Semester_scheduler
+            update["cac_buoc_thuc_hien"] = Semester_scheduler.schedule_steps(metrics['lich_hoc'])
+        ke_hoach = nhan_xet.ke_hoach_chi_tiet.model_copy(update=update)
+        return PhanTichKetQua(
+            gpa_hien_tai=metrics['gpa_hien_tai'],
+            tong_tin_chi_da_hoc=metrics['tong_tin_chi_da_hoc'],
+            nhan_xet_tong_quan=nhan_xet.nhan_xet_tong_quan,
+            diem_manh=nhan_xet.diem_manh,
+            diem_yeu=nhan_xet.diem_yeu,
+            mon_can_cai_thien=[MonCanCaiThien(**mon) for mon in metrics['mon_can_cai_thien']],
+            hoc_phan_uu_tien=[HocPhanUuTien(**hoc_phan) for hoc_phan in metrics['hoc_phan_uu_tien']],
+            ke_hoach_chi_tiet=ke_hoach,
+            du_bao_ket_qua=nhan_xet.du_bao_ket_qua
+        )
+    
+    def cleanup(self, force: bool = False):
+        """Dọn dẹp tài nguyên (giữ lại webdriver ở chế độ keep_driver_alive trừ khi force=True)"""
+        if self.fetcher is not None and (force or not self.keep_driver_alive):
+            self.fetcher.close()
+        if self.driver and (force or not self.keep_driver_alive):
             self.driver.quit()
+            self.driver = None
             logger.info("Webdriver đã được đóng")
 
 def main():
-    """Hàm chính"""
-    root = tk.Tk()
-    app = SimpleTrainingProgramGUI(root)
-   
-    root.mainloop()
+    """Hàm chính: giao diện chạy pipeline trên worker thread nên không bị treo khi chờ model
+    
+    Phân tích lại bảng điểm đã lưu không cần giao diện: Gpa_service.py analyze --transcript ... [--offline].
+    """
+    import asyncio
+    import tkinter as tk
+    from Analysis_models import PhanTichKetQua
+    from GUI import SimpleTrainingProgramGUI
+    from Pipeline import AsyncPipeline
     
     analyzer = GpaAnalyzer()
     
-    try:
-        # Lấy username, password từ GUI
-        if not hasattr(app, "data") or not app.data:
-            raise ValueError("Không có dữ liệu từ GUI.")
-
-        user_info = app.data.get("user_info", {})
+    def run_job(data: Dict[str, Any], emit, cancel_event):
+        user_info = data.get("user_info", {})
+        program = data.get("training_program", {})
         username = user_info.get("username", "").strip()
         password = user_info.get("password", "").strip()
-
         if not username or not password:
             raise ValueError("Thiếu tài khoản hoặc mật khẩu từ GUI.")
-        # Nhập mục tiêu GPA
-        try:
-            target_gpa = float(input("Nhập mục tiêu GPA (mặc định 3.6): ").strip() or "3.6")
-            if not 0 <= target_gpa <= 4.0:
-                raise ValueError("GPA phải nằm trong khoảng 0-4.0")
-        except ValueError as e:
-            print(f"Lỗi: {e}")
-            target_gpa = 3.6
-        
-        # Thiết lập và chạy scraper
-        print("Đang thiết lập webdriver...")
-        analyzer.setup_driver()
-        
-        print("Đang đăng nhập và thu thập dữ liệu...")
-        data = analyzer.login_and_scrape(username, password)
-        
-        print("Đang lưu dữ liệu...")
-        analyzer.save_data(data)
         
-        print("Đang thiết lập AI agent...")
-        analyzer.setup_agent(data)
-        
-        print("Đang phân tích GPA và tạo kế hoạch cải thiện...")
-        result = analyzer.analyze_gpa(target_gpa)
-        
-        print("\n" + "="*50)
-        print("KẾT QUẢ PHÂN TÍCH GPA")
-        print("="*50)
+        # Scrape song song với warm-up model/index, sau đó phân tích (stream)
+        analyzer.curriculum_path = program.get("pdf_file_path") or None
+        analyzer.remaining_semesters = program.get("remaining_semesters")
+        target_gpa = program.get("target_gpa", 3.6)
+        try:
+            result, timings = asyncio.run(AsyncPipeline(analyzer).run(
+                username, password, target_gpa, program.get("credit_fee"), emit, cancel_event))
+        finally:
+            analyzer.cleanup()
         
         if isinstance(result, PhanTichKetQua):
-            print(f"GPA hiện tại: {result.gpa_hien_tai:.2f}")
-            print(f"Tổng tín chỉ đã học: {result.tong_tin_chi_da_hoc}")
-            print(f"Mục tiêu GPA: {target_gpa:.2f}")
-            print(f"\nNhận xét: {result.nhan_xet_tong_quan}")
-            print(f"\nDự báo: {result.du_bao_ket_qua}")
-        else:
-            print("Phân tích đã hoàn thành. Vui lòng kiểm tra kết quả.")
-        
+            emit({"type": "message", "text": "\n".join([
+                "",
+                "KẾT QUẢ PHÂN TÍCH GPA",
+                f"GPA hiện tại: {result.gpa_hien_tai:.2f}",
+                f"Tổng tín chỉ đã học: {result.tong_tin_chi_da_hoc}",
+                f"Mục tiêu GPA: {target_gpa:.2f}",
+                f"Nhận xét: {result.nhan_xet_tong_quan}",
+                f"Dự báo: {result.du_bao_ket_qua}",
+                "Thời gian từng bước: " + ", ".join(f"{name} {value:.2f}s" for name, value in timings.items()),
+            ])})
+    
+    root = tk.Tk()
+    app = SimpleTrainingProgramGUI(root, run_job=run_job)
+    
+    try:
+        root.mainloop()
     except KeyboardInterrupt:
         print("\nChương trình đã bị dừng bởi người dùng")
-    except Exception as e:
-        logger.error(f"Lỗi trong quá trình thực hiện: {e}")
-        print(f"Đã xảy ra lỗi: {e}")
+        app.cancel_event.set()
     finally:
-        analyzer.cleanup()
+        # Cửa sổ đã đóng: đợi worker dừng ở ranh giới bước kế tiếp rồi đóng webdriver
+        if app.worker is not None and app.worker.is_alive():
+            app.worker.join(timeout=10)
+        analyzer.cleanup(force=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
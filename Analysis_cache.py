@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Dict, Any, Type
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Các trường của môn học ảnh hưởng tới kết quả phân tích (bỏ diem_tp, cap_nhat...)
+KEY_FIELDS = ("ma_mon", "ten_mon", "tin_chi", "diem_so", "diem_chu")
+
+def normalize_transcript(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Chuẩn hóa bảng điểm để các lần scrape giống nhau về nội dung cho cùng một khóa"""
+    bang_diem = sorted(
+        ({field: mon.get(field) for field in KEY_FIELDS} for mon in data.get("bang_diem", [])),
+        key=lambda mon: (mon["ma_mon"] or "", mon["diem_so"] or 0.0)
+    )
+    total_gpa = [
+        {"tin_chi": " ".join(str(gpa.get("tin_chi", "")).split()),
+         "gpa_hk": gpa.get("gpa_hk"), "gpa_chung": gpa.get("gpa_chung")}
+        for gpa in data.get("total_gpa", [])
+    ]
+    return {"bang_diem": bang_diem, "total_gpa": total_gpa}
+
+def normalize_instructions(instructions: List[str]) -> List[str]:
+    """Bỏ khoảng trắng thừa trong instructions để định dạng không làm đổi khóa"""
+    return ["\n".join(line.strip() for line in text.strip().splitlines() if line.strip()) for text in instructions]
+
+def cache_key(data: Dict[str, Any], target_gpa: float, model_id: str, instructions: List[str],
+              extra: Optional[Dict[str, Any]] = None) -> str:
+    """SHA-256 của bảng điểm đã chuẩn hóa, mục tiêu GPA, model và instructions"""
+    payload = {
+        "transcript": normalize_transcript(data),
+        "target_gpa": round(float(target_gpa), 2),
+        "model_id": model_id,
+        "instructions": normalize_instructions(instructions),
+        "extra": extra or {},
+    }
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """Cache trên đĩa cho kết quả phân tích đã validate, đánh khóa theo nội dung, có giới hạn số lượng/dung lượng/tuổi"""
+
+    def __init__(self, directory: str = ".analysis_cache", max_entries: int = 256,
+                 max_bytes: int = 64 * 1024 * 1024, max_age: float = 30 * 24 * 3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str, model_cls: Type[BaseModel]) -> Optional[BaseModel]:
+        """Lấy kết quả đã cache (validate lại bằng model_cls), None nếu miss"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                self.evictions += 1
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            result = model_cls.model_validate(entry["result"])
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (ValueError, KeyError, ValidationError) as e:
+            logger.warning(f"Bỏ qua mục cache hỏng {key[:12]}: {e}")
+            os.remove(path)
+            self.misses += 1
+            return None
+
+        # Cập nhật mtime để eviction theo kiểu LRU
+        os.utime(path)
+        self.hits += 1
+        logger.info(f"Cache hit {key[:12]} (hit={self.hits}, miss={self.misses})")
+        return result
+
+    def put(self, key: str, result: BaseModel, metadata: Optional[Dict[str, Any]] = None):
+        """Lưu kết quả rồi dọn cache nếu vượt giới hạn"""
+        entry = {"created_at": time.time(), "metadata": metadata or {}, "result": result.model_dump()}
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Xóa mục quá hạn, sau đó xóa mục ít dùng nhất tới khi trong giới hạn số lượng và dung lượng"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            if now - stat.st_mtime > self.max_age:
+                os.remove(path)
+                self.evictions += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            os.remove(path)
+            total_bytes -= size
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        """Xóa một mục (ví dụ khi bảng điểm của sinh viên đã thay đổi), trả về True nếu có mục để xóa"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            return False
+        self.evictions += 1
+        return True
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
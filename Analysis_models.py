@@ -0,0 +1,71 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, validator
+
+class MonCanCaiThien(BaseModel):
+    """Model cho môn học cần cải thiện"""
+    ma_mon: str = Field(..., description="Mã số của môn học cần cải thiện")
+    ten_mon: str = Field(..., description="Tên đầy đủ của môn học cần cải thiện")
+    diem_so: float = Field(..., description="Điểm số hiện tại theo thang điểm GPA (0-10)")
+    tin_chi: int = Field(..., description="Số tín chỉ của môn học")
+    diem_chu: str = Field(..., description="Điểm chữ hiện tại (A+, A, B+, B, C+, C, D+, D, F)")
+    ly_do: str = Field(..., description="Lý do cụ thể tại sao môn này cần cải thiện")
+    muc_do_uu_tien: str = Field(..., description="Mức độ ưu tiên: 'Cao', 'Trung bình', 'Thấp'")
+    
+    @validator('diem_so')
+    def validate_diem_so(cls, v):
+        if not 0 <= v <= 10:
+            raise ValueError('Điểm số phải nằm trong khoảng 0-10')
+        return v
+    
+    @validator('tin_chi')
+    def validate_tin_chi(cls, v):
+        if v <= 0:
+            raise ValueError('Số tín chỉ phải lớn hơn 0')
+        return v
+
+class HocPhanUuTien(BaseModel):
+    """Model cho học phần được ưu tiên"""
+    ma_mon: str = Field(..., description="Mã số của học phần")
+    ten_mon: str = Field(..., description="Tên đầy đủ của học phần")
+    tin_chi: int = Field(..., description="Số tín chỉ của học phần")
+    diem_hien_tai: Optional[float] = Field(None, description="Điểm hiện tại nếu đã học")
+    uu_tien_vi: str = Field(..., description="Lý do ưu tiên học phần này")
+    kha_nang_cai_thien: str = Field(..., description="Đánh giá khả năng cải thiện: 'Dễ', 'Trung bình', 'Khó'")
+    thoi_gian_de_xuat: str = Field(..., description="Thời gian đề xuất học: 'Học kỳ tới', 'Học kỳ hè', 'Trong năm'")
+
+class ChienLuocCaiThien(BaseModel):
+    """Model cho chiến lược cải thiện"""
+    ten_chien_luoc: str = Field(..., description="Tên chiến lược")
+    mo_ta: str = Field(..., description="Mô tả chi tiết chiến lược")
+    thoi_gian_thuc_hien: str = Field(..., description="Thời gian thực hiện ước tính")
+    do_kho: str = Field(..., description="Mức độ khó: 'Dễ', 'Trung bình', 'Khó'")
+    tai_nguyen_can_thiet: List[str] = Field(..., description="Danh sách tài nguyên cần thiết")
+
+class KeHoachHocTap(BaseModel):
+    """Model cho kế hoạch học tập"""
+    muc_tieu_gpa: float = Field(..., description="Mục tiêu GPA muốn đạt được")
+    thoi_gian_du_kien: str = Field(..., description="Thời gian dự kiến để đạt mục tiêu")
+    chien_luoc_chinh: List[ChienLuocCaiThien] = Field(..., description="Các chiến lược chính")
+    cac_buoc_thuc_hien: List[str] = Field(..., description="Các bước thực hiện cụ thể theo thứ tự")
+    rui_ro_tiem_an: List[str] = Field(..., description="Các rủi ro tiềm ẩn và cách phòng tránh")
+
+class PhanTichKetQua(BaseModel):
+    """Model chính cho kết quả phân tích"""
+    gpa_hien_tai: float = Field(..., description="GPA hiện tại của sinh viên")
+    tong_tin_chi_da_hoc: int = Field(..., description="Tổng số tín chỉ đã học")
+    nhan_xet_tong_quan: str = Field(..., description="Nhận xét chi tiết về tình hình học tập")
+    diem_manh: List[str] = Field(..., description="Các điểm mạnh trong học tập")
+    diem_yeu: List[str] = Field(..., description="Các điểm yếu cần cải thiện")
+    mon_can_cai_thien: List[MonCanCaiThien] = Field(..., description="Danh sách môn học cần cải thiện")
+    hoc_phan_uu_tien: List[HocPhanUuTien] = Field(..., description="Danh sách học phần ưu tiên")
+    ke_hoach_chi_tiet: KeHoachHocTap = Field(..., description="Kế hoạch học tập chi tiết")
+    du_bao_ket_qua: str = Field(..., description="Dự báo khả năng đạt được mục tiêu")
+
+class NhanXetPhanTich(BaseModel):
+    """Model cho phần nhận xét do LLM viết (các số liệu do Gpa_engine tính sẵn)"""
+    nhan_xet_tong_quan: str = Field(..., description="Nhận xét chi tiết về tình hình học tập")
+    diem_manh: List[str] = Field(..., description="Các điểm mạnh trong học tập")
+    diem_yeu: List[str] = Field(..., description="Các điểm yếu cần cải thiện")
+    ke_hoach_chi_tiet: KeHoachHocTap = Field(..., description="Kế hoạch học tập chi tiết")
+    du_bao_ket_qua: str = Field(..., description="Dự báo khả năng đạt được mục tiêu")
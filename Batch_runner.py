@@ -0,0 +1,303 @@
+import csv
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Dict, Any
+
+from Agent_core import GpaAnalyzer, LoginFailed, SSO_LOGIN_URL, GRADES_URL
+from Gpa_engine import BestAttemptIndex
+from Tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Giới hạn số lần bắt đầu scrape mỗi giây (dùng chung giữa các worker)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def load_credentials(path: str) -> List[Dict[str, str]]:
+    """Đọc file tài khoản: CSV có cột username,password hoặc JSON dạng list"""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    credentials = []
+    for row in rows:
+        username = (row.get("username") or "").strip()
+        password = (row.get("password") or "").strip()
+        if not username or not password:
+            logger.warning(f"Bỏ qua dòng tài khoản không hợp lệ: {username or row}")
+            continue
+        credentials.append({"username": username, "password": password})
+    return credentials
+
+class BatchRunner:
+    """Chạy scrape cho cả nhóm sinh viên qua một pool worker có giới hạn, retry/backoff và rate limit"""
+
+    def __init__(self, output_dir: str = "batch_results", workers: int = 4, backend: str = "selenium",
+                 max_retries: int = 3, backoff: float = 2.0, rate: float = 1.0,
+                 login_url: str = SSO_LOGIN_URL, grades_url: str = GRADES_URL, grades_json_url: Optional[str] = None,
+                 analyzer_factory: Optional[Callable[[], GpaAnalyzer]] = None, store_dir: Optional[str] = None,
+                 history_path: Optional[str] = None, tracer: Optional[Tracer] = None):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.backend = backend
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate)
+        self.login_url = login_url
+        self.grades_url = grades_url
+        # grades_json_url: endpoint JSON bảng điểm cho backend HTTP (trang mybk render bảng bằng JS nên cần endpoint)
+        self.grades_json_url = grades_json_url
+        self.analyzer_factory = analyzer_factory or self._default_analyzer
+        # tracer: dùng chung cho mọi worker để biết thời gian của cả nhóm dồn vào bước nào
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self._local = threading.local()
+        self._analyzers: List[GpaAnalyzer] = []
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        # store_dir: ghi mọi sinh viên vào một kho dạng cột thay vì mỗi sinh viên một file JSON
+        self.store = None
+        if store_dir is not None:
+            from Transcript_store import TranscriptStore
+            self.store = TranscriptStore(store_dir)
+        # history_path: CSDL lịch sử SQLite, chỉ ghi kết quả của sinh viên có bảng điểm thay đổi
+        self.history = None
+        if history_path is not None:
+            from History_db import HistoryDB
+            self.history = HistoryDB(history_path)
+
+    def _default_analyzer(self) -> GpaAnalyzer:
+        fetcher = None
+        if self.backend == "http":
+            from Http_fetcher import HttpTranscriptFetcher
+            fetcher = HttpTranscriptFetcher(self.login_url, self.grades_url, json_url=self.grades_json_url)
+        return GpaAnalyzer(keep_driver_alive=True, fetcher=fetcher,
+                           login_url=self.login_url, grades_url=self.grades_url, tracer=self.tracer)
+
+    def _worker_analyzer(self) -> GpaAnalyzer:
+        """Mỗi worker giữ một GpaAnalyzer (một trình duyệt hoặc một HTTP session) cho mọi sinh viên của nó"""
+        analyzer = getattr(self._local, "analyzer", None)
+        if analyzer is None:
+            analyzer = self.analyzer_factory()
+            if self.history is not None:
+                analyzer.history_db = self.history
+            analyzer.setup_driver()
+            self._local.analyzer = analyzer
+            with self._lock:
+                self._analyzers.append(analyzer)
+        return analyzer
+
+    def _discard_analyzer(self, analyzer: GpaAnalyzer):
+        """Đóng analyzer của worker (trình duyệt có thể đã chết) để lần thử sau tạo analyzer mới"""
+        try:
+            analyzer.cleanup(force=True)
+        except Exception as e:
+            logger.warning(f"Lỗi khi đóng webdriver hỏng: {e}")
+        self._local.analyzer = None
+        with self._lock:
+            if analyzer in self._analyzers:
+                self._analyzers.remove(analyzer)
+
+    def _is_driver_error(self, analyzer: GpaAnalyzer, error: Exception) -> bool:
+        if analyzer.driver is None:
+            return False
+        # Có driver nghĩa là selenium đã được import, không tốn thêm chi phí
+        from selenium.common.exceptions import WebDriverException
+        return isinstance(error, WebDriverException)
+
+    def _result_path(self, student_id: str) -> str:
+        safe_id = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in student_id)
+        return os.path.join(self.output_dir, f"{safe_id}.json")
+
+    def _summarize(self, student_id: str, data: Dict[str, Any], attempts: int, elapsed: float,
+                   diff: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        total_gpa = data.get("total_gpa") or []
+        summary = {
+            "student": student_id,
+            "status": "ok",
+            "attempts": attempts,
+            "elapsed": round(elapsed, 3),
+            "so_mon": len(data.get("bang_diem", [])),
+            "gpa_chung": total_gpa[-1]["gpa_chung"] if total_gpa else None,
+            "output_file": self.store.directory if self.store is not None else self._result_path(student_id),
+        }
+        if diff is not None:
+            summary["thay_doi"] = {"them": diff["added"], "doi": [mon["ma_mon"] for mon in diff["changed"]],
+                                   "bo": diff["removed"]}
+        return summary
+
+    def _save(self, student_id: str, data: Dict[str, Any], analyzer: Optional[GpaAnalyzer] = None,
+              diff: Optional[Dict[str, Any]] = None):
+        """Nối thêm vào kho dạng cột nếu có, nếu không thì ghi file JSON riêng của sinh viên"""
+        if diff is not None and not diff["has_changes"] and (
+                self.store is not None or os.path.exists(self._result_path(student_id))):
+            logger.info(f"[{student_id}] Bảng điểm không đổi, bỏ qua bước lưu")
+            return
+        if self.store is not None:
+            self.store.append(student_id, data)
+            return
+        analyzer = analyzer or GpaAnalyzer(tracer=self.tracer)
+        analyzer.output_file = self._result_path(student_id)
+        analyzer.series_file = os.path.splitext(analyzer.output_file)[0] + ".series.json"
+        analyzer.save_data(data)
+
+    def scrape_student(self, username: str, password: str) -> Dict[str, Any]:
+        """Scrape một sinh viên với retry + exponential backoff, ghi file kết quả riêng"""
+        start = time.monotonic()
+        last_error = None
+
+        for attempt in range(1, self.max_retries + 1):
+            with self.tracer.span("rate_limit_wait"):
+                self.rate_limiter.wait()
+            analyzer = None
+            try:
+                # Khởi động trình duyệt lỗi cũng chỉ là lỗi của sinh viên này: thử lại có backoff, không dừng cả nhóm
+                analyzer = self._worker_analyzer()
+                with self.tracer.span("scrape_student", attempt=attempt):
+                    data = analyzer.login_and_scrape(username, password)
+                    self._save(username, data, analyzer, analyzer.last_diff)
+                return self._summarize(username, data, attempt, time.monotonic() - start, analyzer.last_diff)
+            except LoginFailed as e:
+                # Sai tài khoản/mật khẩu: thử lại không có ích
+                last_error = e
+                break
+            except Exception as e:
+                last_error = e
+                if analyzer is not None and self._is_driver_error(analyzer, e):
+                    self._discard_analyzer(analyzer)
+                delay = self.backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+                logger.warning(f"[{username}] Lần thử {attempt}/{self.max_retries} lỗi: {e}, thử lại sau {delay:.1f}s")
+                self.tracer.count("batch.retries")
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+
+        return {
+            "student": username,
+            "status": "error",
+            "attempts": attempt,
+            "elapsed": round(time.monotonic() - start, 3),
+            "error": str(last_error),
+        }
+
+    def process_transcript(self, path: str) -> Dict[str, Any]:
+        """Xử lý một bảng điểm đã lưu (không cần scrape), ghi file kết quả đã chuẩn hóa"""
+        start = time.monotonic()
+        student_id = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with self.tracer.span("process_transcript"):
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                attempts = data.get("bang_diem", [])
+                data["bang_diem"] = BestAttemptIndex().extend(attempts).to_list()
+                diff = self.history.record_scrape(student_id, data, attempts) if self.history is not None else None
+                self._save(student_id, data, diff=diff)
+            return self._summarize(student_id, data, 1, time.monotonic() - start, diff)
+        except Exception as e:
+            logger.error(f"Lỗi khi xử lý {path}: {e}")
+            return {"student": student_id, "status": "error", "attempts": 1,
+                    "elapsed": round(time.monotonic() - start, 3), "error": str(e)}
+
+    def _run(self, jobs: List[Callable[[], Dict[str, Any]]]) -> Dict[str, Any]:
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(lambda job: job(), jobs))
+        finally:
+            for analyzer in self._analyzers:
+                analyzer.cleanup(force=True)
+            self._analyzers.clear()
+
+        summary = {
+            "total": len(results),
+            "ok": sum(1 for r in results if r["status"] == "ok"),
+            "error": sum(1 for r in results if r["status"] != "ok"),
+            "workers": self.workers,
+            "elapsed": round(time.monotonic() - start, 3),
+            "results": results,
+        }
+        summary_path = os.path.join(self.output_dir, "summary.json")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"Hoàn thành {summary['ok']}/{summary['total']} sinh viên trong {summary['elapsed']}s, "
+                    f"tổng kết tại {summary_path}")
+        return summary
+
+    def run_credentials(self, credentials: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Scrape đồng thời danh sách tài khoản"""
+        return self._run([
+            (lambda c=c: self.scrape_student(c["username"], c["password"])) for c in credentials
+        ])
+
+    def run_transcripts(self, directory: str) -> Dict[str, Any]:
+        """Xử lý đồng thời mọi file bảng điểm *.json trong thư mục"""
+        paths = sorted(path for path in glob.glob(os.path.join(directory, "*.json"))
+                       if not path.endswith(".series.json") and os.path.basename(path) != "summary.json")
+        return self._run([(lambda p=p: self.process_transcript(p)) for p in paths])
+
+def main():
+    """Chạy batch từ dòng lệnh"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape/xử lý bảng điểm cho cả nhóm sinh viên")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--credentials", help="File CSV (username,password) hoặc JSON chứa tài khoản")
+    source.add_argument("--transcripts", help="Thư mục chứa các file bảng điểm đã lưu")
+    parser.add_argument("--output-dir", default="batch_results")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--backend", choices=["http", "selenium"], default="selenium",
+                        help="http không cần trình duyệt nhưng cần --grades-json-url (bảng mybk được render bằng JS)")
+    parser.add_argument("--grades-json-url", help="Endpoint JSON bảng điểm cho backend http")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=2.0)
+    parser.add_argument("--rate", type=float, default=1.0, help="Số lần đăng nhập tối đa mỗi giây")
+    parser.add_argument("--login-url", default=SSO_LOGIN_URL)
+    parser.add_argument("--grades-url", default=GRADES_URL)
+    parser.add_argument("--store", help="Thư mục kho bảng điểm dạng cột (thay cho mỗi sinh viên một file JSON)")
+    parser.add_argument("--history", help="File SQLite lưu lịch sử scrape, chỉ lưu lại sinh viên có thay đổi")
+    parser.add_argument("--trace", help="Ghi trace thời gian từng bước (JSON dạng Chrome trace) ra file")
+    parser.add_argument("--profile", action="store_true", help="Chạy kèm cProfile (ghi thêm file .prof cạnh trace)")
+    parser.add_argument("--trace-memory", action="store_true", help="Theo dõi bộ nhớ bằng tracemalloc")
+    args = parser.parse_args()
+
+    tracer = None
+    if args.trace or args.profile or args.trace_memory:
+        tracer = Tracer(args.trace, profile=args.profile, trace_memory=args.trace_memory).start()
+
+    runner = BatchRunner(output_dir=args.output_dir, workers=args.workers, backend=args.backend,
+                         max_retries=args.retries, backoff=args.backoff, rate=args.rate,
+                         login_url=args.login_url, grades_url=args.grades_url,
+                         grades_json_url=args.grades_json_url, store_dir=args.store,
+                         history_path=args.history, tracer=tracer)
+    try:
+        if args.credentials:
+            summary = runner.run_credentials(load_credentials(args.credentials))
+        else:
+            summary = runner.run_transcripts(args.transcripts)
+    finally:
+        if tracer is not None:
+            tracer.stop()
+    print(f"Thành công: {summary['ok']}/{summary['total']} - Thời gian: {summary['elapsed']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Dict, Any
+
+import Gpa_engine
+from Mock_mybk import MockMybkServer, split_semesters, table_snapshot
+
+logger = logging.getLogger(__name__)
+
+RESULT_SCHEMA = 1
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+# Module cần khởi động nhanh (worker batch/service) và các thư viện nặng không được kéo theo khi import
+IMPORT_MODULES = ("Agent_core", "Gpa_service", "Batch_runner")
+HEAVY_MODULES = ("selenium", "agno", "ollama", "pydantic", "tkinter", "numpy", "asyncio")
+
+IMPORT_TIME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+STAGES = ("cold_import", "parse_snapshot", "extract_http", "extract_selenium", "save_data", "setup_agent", "analyze_gpa",
+          "end_to_end")
+
+COURSE_NAMES = ("Giải tích", "Đại số tuyến tính", "Vật lý", "Hóa đại cương", "Lập trình", "Cấu trúc dữ liệu",
+                "Mạng máy tính", "Hệ điều hành", "Cơ sở dữ liệu", "Xác suất thống kê", "Kinh tế", "Triết học")
+
+def synthetic_transcript(courses: int, seed: int = 0, per_semester: int = 6,
+                         retake_rate: float = 0.05, zero_credit_rate: float = 0.03) -> Dict[str, Any]:
+    """Bảng điểm giả cùng dạng ket_qua.json: `courses` dòng môn học, footer mỗi học kỳ, có học lại và môn 0 tín chỉ
+
+    Cùng seed luôn cho cùng bảng điểm, nên kết quả benchmark giữa các lần chạy so sánh được.
+    """
+    rng = random.Random(seed)
+    bang_diem: List[Dict[str, Any]] = []
+    for i in range(courses):
+        if bang_diem and rng.random() < retake_rate:
+            earlier = rng.choice(bang_diem)
+            ma_mon, ten_mon, tin_chi = earlier["ma_mon"], earlier["ten_mon"], earlier["tin_chi"]
+        else:
+            ma_mon = f"{chr(65 + i // 260000 % 26)}{chr(65 + i // 10000 % 26)}{i % 10000:04d}"
+            ten_mon = f"{rng.choice(COURSE_NAMES)} {i % 4 + 1}"
+            tin_chi = 0 if rng.random() < zero_credit_rate else rng.choice((1, 2, 3, 3, 4))
+        if tin_chi == 0:
+            diem_so, diem_chu, diem_tp = 0.0, "--", "--"
+        else:
+            diem_so = round(min(max(rng.gauss(6.8, 1.8), 0.0), 10.0), 1)
+            diem_chu = Gpa_engine.score_to_letter(diem_so)
+            diem_tp = f"BT: {round(rng.uniform(4, 10), 1)} KT: {round(rng.uniform(4, 10), 1)}"
+        bang_diem.append({
+            "ma_mon": ma_mon,
+            "ten_mon": ten_mon,
+            "tin_chi": tin_chi,
+            "diem_tp": diem_tp,
+            "diem_so": diem_so,
+            "diem_chu": diem_chu,
+            "diem_dat": "" if diem_chu in ("--", "F") else "Đạt",
+            "cap_nhat": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024 10:00",
+        })
+
+    # Footer khớp với cách Mock_mybk chia môn vào học kỳ
+    data = {"bang_diem": bang_diem, "total_gpa": [None] * max(-(-courses // per_semester), 1)}
+    total_gpa, tich_luy, points, credits = [], 0, 0.0, 0
+    for chunk in split_semesters(data):
+        graded = Gpa_engine.graded_courses(chunk)
+        hk_gpa, hk_credits = Gpa_engine.weighted_gpa(graded)
+        dat = sum(mon["tin_chi"] for mon in graded if mon["diem_chu"] != "F")
+        tich_luy += dat
+        points += hk_gpa * hk_credits
+        credits += hk_credits
+        total_gpa.append({
+            "tin_chi": f"Số tín chỉ đạt/đăng ký học kỳ: {dat}/{hk_credits} - Số TCTL chung: {tich_luy}",
+            "gpa_hk": round(hk_gpa, 1),
+            "gpa_chung": round(points / credits, 1) if credits else 0.0,
+        })
+    data["total_gpa"] = total_gpa
+    data["timestamp"] = "2024-11-01 18:20:00"
+    return data
+
+def schema_instance(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Any:
+    """Giá trị hợp lệ tối thiểu, tất định cho một JSON schema (đủ cho các response_model của agent)"""
+    defs = defs if defs is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return schema_instance(defs[schema["$ref"].split("/")[-1]], defs)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"] or schema[key]
+            return schema_instance(options[0], defs)
+    if "enum" in schema:
+        # Agent suy luận dừng ngay ở bước đầu để số lần gọi model cố định
+        return "final_answer" if "final_answer" in schema["enum"] else schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: schema_instance(prop, defs) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [schema_instance(schema.get("items", {"type": "string"}), defs)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 0.5
+    if kind == "boolean":
+        return True
+    return "Nội dung mẫu của model giả lập để đo thời gian."
+
+class FakeOllamaServer:
+    """Server HTTP local thay cho Ollama: trả lời tất định theo schema, độ trễ cấu hình được
+
+    latency: thời gian trước chunk đầu tiên (giây); token_latency: thời gian giữa hai chunk khi stream.
+    """
+
+    def __init__(self, latency: float = 0.0, token_latency: float = 0.0, chunk_chars: int = 16,
+                 default_schema: Optional[Dict[str, Any]] = None, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_chars = chunk_chars
+        self.default_schema = default_schema
+        self.request_counts: Dict[str, int] = {}
+        self.prompt_chars = 0
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reply(self, request: Dict[str, Any]) -> str:
+        schema = request.get("format") if isinstance(request.get("format"), dict) else self.default_schema
+        if schema is None:
+            return "Nội dung mẫu của model giả lập."
+        return json.dumps(schema_instance(schema), ensure_ascii=False)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, body: Dict[str, Any]):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, chunks: List[Dict[str, Any]]):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, chunk in enumerate(chunks):
+                    if i and server.token_latency:
+                        time.sleep(server.token_latency)
+                    line = (json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                with server.lock:
+                    server.request_counts[self.path] = server.request_counts.get(self.path, 0) + 1
+
+                if self.path == "/api/embed":
+                    inputs = request.get("input") or []
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    return self._send_json({"model": request.get("model"), "embeddings": [
+                        [((zlib.crc32(f"{text}:{i}".encode()) % 2001) - 1000) / 1000 for i in range(64)]
+                        for text in inputs]})
+
+                prompt = request.get("prompt") or "".join(
+                    str(message.get("content") or "") for message in request.get("messages", []))
+                with server.lock:
+                    server.prompt_chars += len(prompt)
+                if server.latency and (prompt or self.path == "/api/chat"):
+                    time.sleep(server.latency)
+
+                base = {"model": request.get("model"), "created_at": datetime.now().isoformat()}
+                final = dict(base, done=True, done_reason="stop", prompt_eval_count=len(prompt) // 4,
+                             total_duration=int(server.latency * 1e9))
+                if self.path == "/api/generate":
+                    return self._send_json(dict(final, response=""))
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+
+                content = server.reply(request)
+                final["eval_count"] = len(content) // 4
+                final["prompt_eval_duration"] = int(server.latency * 1e9)
+                final["eval_duration"] = int(server.token_latency * (len(content) // server.chunk_chars + 1) * 1e9)
+                if not request.get("stream", True):
+                    return self._send_json(dict(final, message={"role": "assistant", "content": content}))
+                size = server.chunk_chars
+                chunks = [dict(base, done=False, message={"role": "assistant", "content": content[i:i + size]})
+                          for i in range(0, len(content), size)]
+                self._stream(chunks + [dict(final, message={"role": "assistant", "content": ""})])
+
+        return Handler
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    return {
+        "runs": len(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, Any]:
+    """Thời gian (giây) của `repeat` lần gọi func, sau `warmup` lần chạy bỏ qua"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def import_time(module: str, repeat: int) -> Dict[str, Any]:
+    """Thời gian import module trong tiến trình Python mới (cold start) và các thư viện nặng bị kéo theo"""
+    samples, heavy = [], []
+    script = IMPORT_TIME_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        heavy = result["heavy"]
+    return {"module": module, "heavy_modules": heavy, **summarize(samples)}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+class BenchmarkSuite:
+    """Đo từng bước của GpaAnalyzer và toàn bộ pipeline trên server mybk/Ollama giả lập"""
+
+    def __init__(self, sizes=DEFAULT_SIZES, stages=STAGES, repeat: int = 5, seed: int = 0,
+                 model_latency: float = 0.0, token_latency: float = 0.0, work_dir: Optional[str] = None):
+        self.sizes = list(sizes)
+        self.stages = list(stages)
+        self.repeat = repeat
+        self.seed = seed
+        self.model_latency = model_latency
+        self.token_latency = token_latency
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="gpa_bench_")
+        self.results: List[Dict[str, Any]] = []
+
+    def _analyzer(self, size: int, **kwargs):
+        from Agent_core import GpaAnalyzer
+        output_file = os.path.join(self.work_dir, f"bench_{size}.json")
+        return GpaAnalyzer(output_file=output_file, **kwargs)
+
+    def _record(self, stage: str, size: int, **fields):
+        result = {"stage": stage, "courses": size, **fields}
+        self.results.append(result)
+        if "median" in result:
+            logger.info(f"{stage} ({size} môn): median {result['median'] * 1000:.2f} ms, "
+                        f"min {result['min'] * 1000:.2f} ms ({result['runs']} lần)")
+        else:
+            logger.info(f"{stage} ({size} môn): bỏ qua - {result.get('skipped')}")
+
+    def _bench_stage(self, stage: str, size: int, data: Dict[str, Any], mybk: MockMybkServer,
+                     model: FakeOllamaServer):
+        from Agent_core import GpaAnalyzer
+        from Http_fetcher import HttpTranscriptFetcher
+        from Pipeline import AsyncPipeline
+        import asyncio
+
+        if stage == "parse_snapshot":
+            analyzer, snapshot = self._analyzer(size), table_snapshot(data)
+            return self._record(stage, size, **measure(lambda: analyzer._parse_table_snapshot(snapshot), self.repeat))
+
+        if stage == "extract_http":
+            fetcher = HttpTranscriptFetcher(mybk.login_url, mybk.grades_url)
+            analyzer = self._analyzer(size, fetcher=fetcher, login_url=mybk.login_url, grades_url=mybk.grades_url)
+            requests = sum(mybk.request_counts.values())
+            try:
+                result = measure(lambda: analyzer.login_and_scrape("sinhvien", "matkhau"), self.repeat)
+                requests = (sum(mybk.request_counts.values()) - requests) / (self.repeat + 1)
+                return self._record(stage, size, round_trips_per_run=requests, **result)
+            finally:
+                fetcher.close()
+
+        if stage == "extract_selenium":
+            analyzer = self._analyzer(size, login_url=mybk.login_url, grades_url=mybk.grades_url)
+            try:
+                analyzer.setup_driver()
+                analyzer.login_and_scrape("sinhvien", "matkhau")
+            except Exception as e:
+                analyzer.cleanup(force=True)
+                return self._record(stage, size, skipped=f"Không chạy được Selenium: {e}".splitlines()[0])
+            try:
+                return self._record(stage, size, **measure(analyzer._extract_grades_data, self.repeat))
+            finally:
+                analyzer.cleanup(force=True)
+
+        if stage == "save_data":
+            analyzer = self._analyzer(size)
+            return self._record(stage, size, **measure(lambda: analyzer.save_data(data), self.repeat))
+
+        if stage == "setup_agent":
+            analyzer = self._analyzer(size)
+            return self._record(stage, size, **measure(lambda: analyzer.setup_agent(data), self.repeat))
+
+        if stage == "analyze_gpa":
+            analyzer = self._analyzer(size)
+            analyzer.setup_agent(data)
+            calls = sum(model.request_counts.values())
+            result = measure(lambda: analyzer.analyze_gpa(3.6), self.repeat)
+            calls = (sum(model.request_counts.values()) - calls) / (self.repeat + 1)
+            return self._record(stage, size, model_calls_per_run=calls,
+                                prompt_tokens=analyzer.prompt_report.get("total"), **result)
+
+        if stage == "end_to_end":
+            fetcher = HttpTranscriptFetcher(mybk.login_url, mybk.grades_url)
+            analyzer = self._analyzer(size, fetcher=fetcher, login_url=mybk.login_url, grades_url=mybk.grades_url)
+            pipeline = AsyncPipeline(analyzer)
+            stage_times: Dict[str, List[float]] = {}
+
+            def run():
+                asyncio.run(pipeline.run("sinhvien", "matkhau", 3.6))
+                for name, value in pipeline.timings.items():
+                    stage_times.setdefault(name, []).append(value)
+
+            try:
+                result = measure(run, self.repeat)
+            finally:
+                fetcher.close()
+            return self._record(stage, size, stages={name: statistics.median(values)
+                                                     for name, values in stage_times.items()}, **result)
+
+        raise ValueError(f"Không có bước benchmark {stage}")
+
+    def run(self) -> Dict[str, Any]:
+        from Agent_core import NhanXetPhanTich
+
+        start = time.perf_counter()
+        previous_host = os.environ.get("OLLAMA_HOST")
+        with FakeOllamaServer(self.model_latency, self.token_latency,
+                              default_schema=NhanXetPhanTich.model_json_schema()) as model:
+            # Client của ollama đọc OLLAMA_HOST khi được tạo, mọi analyzer trong suite đều gọi model giả lập
+            os.environ["OLLAMA_HOST"] = model.base_url
+            try:
+                if "cold_import" in self.stages:
+                    for module in IMPORT_MODULES:
+                        self._record(f"cold_import.{module}", 0, **import_time(module, self.repeat))
+                for size in self.sizes:
+                    data = synthetic_transcript(size, self.seed)
+                    with MockMybkServer(data) as mybk:
+                        for stage in self.stages:
+                            if stage == "cold_import":
+                                continue
+                            try:
+                                self._bench_stage(stage, size, json.loads(json.dumps(data)), mybk, model)
+                            except Exception as e:
+                                logger.error(f"Lỗi khi benchmark {stage} ({size} môn): {e}")
+                                self._record(stage, size, error=str(e))
+            finally:
+                if previous_host is None:
+                    os.environ.pop("OLLAMA_HOST", None)
+                else:
+                    os.environ["OLLAMA_HOST"] = previous_host
+
+        return {
+            "schema": RESULT_SCHEMA,
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "git_commit": git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "repeat": self.repeat,
+                "seed": self.seed,
+                "model_latency": self.model_latency,
+                "token_latency": self.token_latency,
+                "elapsed": time.perf_counter() - start,
+            },
+            "results": self.results,
+        }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2) -> List[Dict[str, Any]]:
+    """Các bước có median chậm hơn baseline quá `threshold` (tỉ lệ), so theo (stage, courses)"""
+    base = {(r["stage"], r["courses"]): r for r in baseline.get("results", []) if "median" in r}
+    regressions = []
+    for result in current.get("results", []):
+        old = base.get((result["stage"], result["courses"]))
+        if old is None or "median" not in result or not old["median"]:
+            continue
+        ratio = result["median"] / old["median"]
+        if ratio > 1 + threshold:
+            regressions.append({"stage": result["stage"], "courses": result["courses"],
+                                "baseline": old["median"], "current": result["median"], "ratio": ratio})
+    return regressions
+
+def main():
+    """Chạy benchmark từ dòng lệnh, ghi kết quả JSON và so sánh với lần chạy trước"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark GpaAnalyzer trên server mybk và Ollama giả lập")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Số môn của bảng điểm giả")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Độ trễ trước chunk đầu tiên (giây)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Độ trễ giữa hai chunk stream (giây)")
+    parser.add_argument("--output", help="File JSON kết quả (mặc định bench_results/<thời gian>.json)")
+    parser.add_argument("--baseline", help="File kết quả trước đó để phát hiện chậm đi")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tỉ lệ chậm hơn được coi là regression")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    report = BenchmarkSuite(args.sizes, args.stages, args.repeat, args.seed,
+                            args.model_latency, args.token_latency).run()
+
+    output = args.output or os.path.join("bench_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Kết quả benchmark: {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"CHẬM HƠN: {r['stage']} ({r['courses']} môn) {r['baseline'] * 1000:.2f} ms -> "
+                  f"{r['current'] * 1000:.2f} ms (x{r['ratio']:.2f})")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
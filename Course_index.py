@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from typing import List, Optional, Dict, Any
+
+from Gpa_engine import BestAttemptIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+def fold(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt để so khớp từ khóa"""
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9.+]+", fold(text))
+
+def record_checksum(mon: Dict[str, Any]) -> str:
+    """Checksum nội dung của một bản ghi môn học (gồm cả cap_nhat)"""
+    canonical = json.dumps(mon, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def record_text(mon: Dict[str, Any]) -> str:
+    """Văn bản dùng để index/embedding một môn học"""
+    return (f"{mon['ma_mon']} {mon['ten_mon']} - {mon['tin_chi']} tín chỉ - điểm {mon['diem_so']} "
+            f"({mon['diem_chu']}) - {mon.get('diem_tp', '')} - cập nhật {mon.get('cap_nhat', '')}")
+
+class CourseIndex:
+    """Index từ khóa/vector các môn học lưu trên đĩa, chỉ index lại các môn thêm mới hoặc thay đổi"""
+
+    def __init__(self, path: str = ".course_index.json", embedder=None):
+        self.path = path
+        # embedder: agno Embedder (ví dụ OllamaEmbedder) tùy chọn, None = chỉ dùng index từ khóa
+        self.embedder = embedder
+        self._records: Optional[Dict[str, Dict[str, Any]]] = None
+        self._pending: Optional[List[Dict[str, Any]]] = None
+        self._doc_freq: Dict[str, int] = {}
+        self.last_sync: Dict[str, int] = {}
+
+    def _load(self):
+        """Đọc index từ đĩa (chỉ gọi khi cần tới lần đầu)"""
+        self._records = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                if stored.get("version") == INDEX_VERSION and stored.get("embedder") == self._embedder_id():
+                    self._records = stored.get("records", {})
+                else:
+                    logger.info("Index môn học khác phiên bản/embedder, sẽ index lại toàn bộ")
+            except (ValueError, OSError) as e:
+                logger.warning(f"Không đọc được index môn học, sẽ index lại: {e}")
+        self._rebuild_doc_freq()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "embedder": self._embedder_id(), "records": self._records},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _embedder_id(self) -> Optional[str]:
+        if self.embedder is None:
+            return None
+        return f"{type(self.embedder).__name__}:{getattr(self.embedder, 'id', '')}"
+
+    def _rebuild_doc_freq(self):
+        self._doc_freq = {}
+        for entry in self._records.values():
+            for token in entry["tokens"]:
+                self._doc_freq[token] = self._doc_freq.get(token, 0) + 1
+
+    def _ensure_ready(self):
+        if self._records is None:
+            self._load()
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            self.sync(pending)
+
+    def preload(self):
+        """Đọc index từ đĩa ngay (ví dụ trong lúc đang scrape) thay vì đợi lần tìm kiếm đầu tiên"""
+        if self._records is None:
+            self._load()
+
+    def update(self, bang_diem: List[Dict[str, Any]]):
+        """Ghi nhận bảng điểm mới; việc đọc index và index lại được hoãn tới lần tìm kiếm đầu tiên"""
+        self._pending = bang_diem
+
+    def sync(self, bang_diem: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Đồng bộ index với bảng điểm, chỉ embedding lại các môn có checksum thay đổi"""
+        if self._records is None:
+            self._load()
+
+        stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        current = {mon["ma_mon"]: mon for mon in BestAttemptIndex().extend(bang_diem).to_list()}
+
+        for ma_mon in list(self._records):
+            if ma_mon not in current:
+                del self._records[ma_mon]
+                stats["removed"] += 1
+
+        for ma_mon, mon in current.items():
+            checksum = record_checksum(mon)
+            entry = self._records.get(ma_mon)
+            if entry is not None and entry["checksum"] == checksum:
+                stats["unchanged"] += 1
+                continue
+
+            text = record_text(mon)
+            tokens: Dict[str, int] = {}
+            for token in tokenize(text):
+                tokens[token] = tokens.get(token, 0) + 1
+            self._records[ma_mon] = {
+                "checksum": checksum,
+                "record": mon,
+                "text": text,
+                "tokens": tokens,
+                "embedding": self.embedder.get_embedding(text) if self.embedder is not None else None,
+            }
+            stats["added" if entry is None else "changed"] += 1
+
+        if stats["added"] or stats["changed"] or stats["removed"]:
+            self._rebuild_doc_freq()
+            self._save()
+        self.last_sync = stats
+        logger.info(f"Đồng bộ index môn học: {stats}")
+        return stats
+
+    def _keyword_scores(self, query: str) -> Dict[str, float]:
+        query_tokens = tokenize(query)
+        total = len(self._records) or 1
+        scores = {}
+        for ma_mon, entry in self._records.items():
+            score = 0.0
+            for token in query_tokens:
+                tf = entry["tokens"].get(token)
+                if tf:
+                    idf = math.log(1 + total / self._doc_freq.get(token, 1))
+                    score += idf * tf / (tf + 1.0)
+            if fold(ma_mon) in query_tokens:
+                score += 10.0
+            if score:
+                scores[ma_mon] = score
+        return scores
+
+    def _vector_scores(self, query: str) -> Dict[str, float]:
+        query_vec = self.embedder.get_embedding(query)
+        query_norm = math.sqrt(sum(x * x for x in query_vec)) or 1.0
+        scores = {}
+        for ma_mon, entry in self._records.items():
+            vec = entry.get("embedding")
+            if not vec:
+                continue
+            norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+            scores[ma_mon] = sum(a * b for a, b in zip(query_vec, vec)) / (norm * query_norm)
+        return scores
+
+    def search(self, query: str, num_documents: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Các môn liên quan nhất tới câu truy vấn"""
+        self._ensure_ready()
+        scores = self._keyword_scores(query)
+        if self.embedder is not None:
+            for ma_mon, score in self._vector_scores(query).items():
+                scores[ma_mon] = scores.get(ma_mon, 0.0) + score
+        ranked = sorted(scores, key=scores.get, reverse=True)[:num_documents or 5]
+        return [self._records[ma_mon]["record"] for ma_mon in ranked]
+
+    def retriever(self, query: str, num_documents: Optional[int] = None, **kwargs) -> Optional[List[Dict[str, Any]]]:
+        """Hàm retriever cho agno Agent (thay cho JSONKnowledgeBase)"""
+        return self.search(query, num_documents) or None
+
+    def __len__(self) -> int:
+        self._ensure_ready()
+        return len(self._records)
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Dict, Any
+
+import Gpa_engine
+from Course_index import fold
+
+logger = logging.getLogger(__name__)
+
+PARSER_VERSION = 1
+
+COURSE_CODE_RE = re.compile(r"\b([A-Z]{2,3}\d{4})\b")
+SEMESTER_RE = re.compile(r"^\s*hoc\s*ky\s*(\d+)")
+REQUIRED_CREDITS_RE = re.compile(r"(\d+)\s*(?:tc|tin chi)\b")
+PAREN_RE = re.compile(r"\([^)]*\)")
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 của file, đọc từng đoạn để không nạp cả file vào bộ nhớ"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_pages(path: str) -> Iterator[str]:
+    """Text của từng trang, đọc lần lượt (file .txt: các trang phân cách bằng ký tự form feed)"""
+    if path.lower().endswith(".txt"):
+        page = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                while "\f" in line:
+                    before, line = line.split("\f", 1)
+                    page.append(before)
+                    yield "".join(page)
+                    page = []
+                page.append(line)
+        if page:
+            yield "".join(page)
+        return
+
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError("Cần cài pypdf để đọc file PDF chương trình đào tạo: pip install pypdf") from e
+    # PdfReader chỉ phân tích trang khi được truy cập, text được trích từng trang một
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+def parse_course_line(line: str) -> Optional[Dict[str, Any]]:
+    """Dòng môn học dạng "[STT] MÃ_MÔN Tên môn [số] TÍN_CHỈ [(giờ)] [cột khác] [mã môn tiên quyết...]"
+
+    Tín chỉ là số nguyên <= 15 cuối cùng trước mã môn tiên quyết đầu tiên, nên tên môn có số
+    (ví dụ "Giải tích 1 4") vẫn tách đúng.
+    """
+    codes = list(COURSE_CODE_RE.finditer(line))
+    if not codes:
+        return None
+    first = codes[0]
+    end = codes[1].start() if len(codes) > 1 else len(line)
+    tokens = PAREN_RE.sub(" ", line[first.end():end]).split()
+
+    credit_index = None
+    for i, token in enumerate(tokens):
+        if token.isdigit() and 0 < int(token) <= 15 and i > 0:
+            credit_index = i
+    if credit_index is None:
+        return None
+    return {
+        "ma_mon": first.group(1),
+        "ten_mon": " ".join(tokens[:credit_index]),
+        "tin_chi": int(tokens[credit_index]),
+        "tien_quyet": [code.group(1) for code in codes[1:]],
+    }
+
+class CurriculumParser:
+    """Parse từng dòng text của chương trình đào tạo: học kỳ, môn bắt buộc, nhóm tự chọn, môn tiên quyết"""
+
+    def __init__(self):
+        self.courses: Dict[str, Dict[str, Any]] = {}
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self._semester: Optional[int] = None
+        self._group: Optional[str] = None
+
+    def feed_line(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        folded = fold(line)
+        if not COURSE_CODE_RE.search(line):
+            semester = SEMESTER_RE.match(folded)
+            if semester:
+                self._semester = int(semester.group(1))
+            if "tu chon" in folded:
+                self._group = line
+                credits = REQUIRED_CREDITS_RE.search(folded)
+                self.groups.setdefault(line, {"tin_chi_can": int(credits.group(1)) if credits else None, "mon": []})
+            elif "bat buoc" in folded:
+                self._group = None
+            return
+
+        course = parse_course_line(line)
+        if course is None or course["ma_mon"] in self.courses:
+            return
+        course["hoc_ky"] = self._semester
+        course["nhom"] = self._group
+        self.courses[course["ma_mon"]] = course
+        if self._group is not None:
+            self.groups[self._group]["mon"].append(course["ma_mon"])
+
+    def feed_page(self, text: str):
+        for line in text.splitlines():
+            self.feed_line(line)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "version": PARSER_VERSION,
+            "courses": list(self.courses.values()),
+            "nhom_tu_chon": self.groups,
+        }
+
+def parse_curriculum(pages: Iterable[str]) -> Dict[str, Any]:
+    """Parse chương trình đào tạo từ các trang text (có thể là generator)"""
+    parser = CurriculumParser()
+    for page in pages:
+        parser.feed_page(page)
+    return parser.result()
+
+class CurriculumIndex:
+    """Chương trình đào tạo đã parse, cache trên đĩa theo hash của file nên chỉ parse PDF một lần"""
+
+    def __init__(self, cache_dir: str = ".curriculum_cache"):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load(self, path: str) -> Dict[str, Any]:
+        digest = file_hash(path)
+        cache_path = os.path.join(self.cache_dir, f"{digest}.json")
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    curriculum = json.load(f)
+                if curriculum.get("version") == PARSER_VERSION:
+                    logger.info(f"Dùng chương trình đào tạo đã parse từ cache ({digest[:12]})")
+                    return curriculum
+            except ValueError as e:
+                logger.warning(f"Cache chương trình đào tạo hỏng, parse lại: {e}")
+
+        try:
+            curriculum = parse_curriculum(iter_pages(path))
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc chương trình đào tạo {path}: {e}")
+            raise
+        curriculum["file_hash"] = digest
+        curriculum["source"] = os.path.basename(path)
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(curriculum, f, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+        logger.info(f"Đã parse {len(curriculum['courses'])} học phần, "
+                    f"{len(curriculum['nhom_tu_chon'])} nhóm tự chọn từ {path}")
+        return curriculum
+
+def is_passed(mon: Dict[str, Any]) -> bool:
+    return mon.get("diem_chu") in Gpa_engine.GRADE_POINTS and mon.get("diem_chu") != "F"
+
+def remaining_courses(curriculum: Dict[str, Any], bang_diem: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Các học phần bắt buộc chưa đạt và tín chỉ tự chọn còn thiếu (một lượt qua mỗi danh sách, O(n + m))"""
+    taken = {mon["ma_mon"]: mon for mon in bang_diem}
+    passed = {ma_mon for ma_mon, mon in taken.items() if is_passed(mon)}
+
+    bat_buoc = []
+    for course in curriculum["courses"]:
+        if course["nhom"] is not None or course["ma_mon"] in passed:
+            continue
+        mon = taken.get(course["ma_mon"])
+        bat_buoc.append(dict(
+            course,
+            diem_hien_tai=mon["diem_so"] if mon else None,
+            thieu_tien_quyet=[code for code in course["tien_quyet"] if code not in passed],
+        ))
+
+    by_code = {course["ma_mon"]: course for course in curriculum["courses"]}
+    tu_chon = []
+    for name, group in curriculum["nhom_tu_chon"].items():
+        earned = sum(by_code[code]["tin_chi"] for code in group["mon"] if code in passed)
+        needed = group["tin_chi_can"]
+        if needed is not None and earned >= needed:
+            continue
+        tu_chon.append({
+            "nhom": name,
+            "tin_chi_can": needed,
+            "tin_chi_da_dat": earned,
+            "lua_chon": [code for code in group["mon"] if code not in passed],
+        })
+
+    return {
+        "bat_buoc": bat_buoc,
+        "tu_chon": tu_chon,
+        "tin_chi_bat_buoc_con_lai": sum(course["tin_chi"] for course in bat_buoc),
+        "tin_chi_tu_chon_con_lai": sum(max((g["tin_chi_can"] or 0) - g["tin_chi_da_dat"], 0) for g in tu_chon),
+    }
+
+def remaining_to_hoc_phan_uu_tien(remaining: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Học phần bắt buộc còn lại đúng dạng HocPhanUuTien: môn đủ điều kiện tiên quyết và học kỳ sớm xếp trước"""
+    courses = sorted(remaining["bat_buoc"],
+                     key=lambda c: (bool(c["thieu_tien_quyet"]), c["hoc_ky"] if c["hoc_ky"] is not None else 99))
+    result = []
+    for course in courses:
+        ly_do = "Học phần bắt buộc " + ("bị rớt" if course["diem_hien_tai"] is not None else "chưa học")
+        if course["hoc_ky"] is not None:
+            ly_do += f" (học kỳ {course['hoc_ky']} theo chương trình)"
+        if course["thieu_tien_quyet"]:
+            ly_do += f", cần hoàn thành trước: {', '.join(course['thieu_tien_quyet'])}"
+        result.append({
+            "ma_mon": course["ma_mon"],
+            "ten_mon": course["ten_mon"],
+            "tin_chi": course["tin_chi"],
+            "diem_hien_tai": course["diem_hien_tai"],
+            "uu_tien_vi": ly_do,
+            "kha_nang_cai_thien": "Khó" if course["thieu_tien_quyet"] else "Trung bình",
+            "thoi_gian_de_xuat": "Trong năm" if course["thieu_tien_quyet"] else "Học kỳ tới",
+        })
+    return result
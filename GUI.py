@@ -1,13 +1,41 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import json
+import queue
+import threading
+import time
 from datetime import datetime
 
+# Chu kỳ (ms) đọc hàng đợi sự kiện từ worker thread
+POLL_INTERVAL_MS = 100
+
+# Tên hiển thị và thứ tự các bước của pipeline (dùng cho thanh tiến trình)
+STAGE_LABELS = {
+    "warm_up": "Chuẩn bị model",
+    "scrape": "Thu thập bảng điểm",
+    "save_data": "Lưu dữ liệu",
+    "setup_agent": "Khởi tạo AI agent",
+    "analyze": "Phân tích GPA",
+}
+
+FIELD_LABELS = {
+    "gpa_hien_tai": "GPA hiện tại",
+    "tong_tin_chi_da_hoc": "Tổng tín chỉ đã học",
+    "mon_can_cai_thien": "Môn cần cải thiện",
+    "hoc_phan_uu_tien": "Học phần ưu tiên",
+    "nhan_xet_tong_quan": "Nhận xét",
+    "diem_manh": "Điểm mạnh",
+    "diem_yeu": "Điểm yếu",
+    "ke_hoach_chi_tiet": "Kế hoạch",
+    "du_bao_ket_qua": "Dự báo",
+}
+
 class SimpleTrainingProgramGUI:
-    def __init__(self, root):
+    def __init__(self, root, run_job=None):
+        """run_job(data, emit, cancel_event) chạy trên worker thread; không truyền thì chỉ thu thập dữ liệu rồi đóng"""
         self.root = root
         self.root.title("Quản lý Chương trình Đào tạo")
-        self.root.geometry("500x500")
+        self.root.geometry("640x760" if run_job else "500x500")
         self.root.configure(bg='#f0f0f0')
         
         # Variables
@@ -16,8 +44,19 @@ class SimpleTrainingProgramGUI:
         self.pdf_file = tk.StringVar()
         self.remaining_semesters = tk.IntVar()
         self.credit_fee = tk.DoubleVar()
+        self.target_gpa = tk.DoubleVar(value=3.6)
+        self.status = tk.StringVar(value="Sẵn sàng")
+        
+        self.run_job = run_job
+        self.events: "queue.Queue" = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.worker = None
+        self.result = None
+        self._token_count = 0
+        self._job_start = 0.0
         
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def create_widgets(self):
         # Main frame
@@ -70,9 +109,42 @@ class SimpleTrainingProgramGUI:
         ttk.Entry(input_frame, textvariable=self.credit_fee, width=20).grid(
             row=1, column=1, sticky=tk.W, padx=(10, 0), pady=5)
         
-        # Export button
-        export_button = ttk.Button(main_frame, text="Xác nhận", command=self.export_json)
-        export_button.pack(pady=20)
+        # Target GPA
+        ttk.Label(input_frame, text="Mục tiêu GPA:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        ttk.Spinbox(input_frame, from_=0.0, to=4.0, increment=0.1, textvariable=self.target_gpa, width=10).grid(
+            row=2, column=1, sticky=tk.W, padx=(10, 0), pady=5)
+        
+        # Buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=(0, 10))
+        self.export_button = ttk.Button(button_frame, text="Xác nhận", command=self.export_json)
+        self.export_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Hủy", command=self.cancel_job, state=tk.DISABLED)
+        if self.run_job:
+            self.cancel_button.pack(side=tk.LEFT, padx=5)
+            self.create_progress_widgets(main_frame)
+    
+    def create_progress_widgets(self, parent):
+        """Thanh tiến trình, thời gian từng bước và kết quả từng phần"""
+        progress_frame = ttk.LabelFrame(parent, text="Tiến trình", padding="10")
+        progress_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.progress = ttk.Progressbar(progress_frame, maximum=len(STAGE_LABELS), mode="determinate")
+        self.progress.pack(fill=tk.X)
+        ttk.Label(progress_frame, textvariable=self.status).pack(anchor=tk.W, pady=(5, 5))
+        
+        self.stage_view = ttk.Treeview(progress_frame, columns=("status", "elapsed"), height=len(STAGE_LABELS))
+        self.stage_view.heading("#0", text="Bước")
+        self.stage_view.heading("status", text="Trạng thái")
+        self.stage_view.heading("elapsed", text="Thời gian")
+        self.stage_view.column("status", width=120)
+        self.stage_view.column("elapsed", width=90)
+        for stage, label in STAGE_LABELS.items():
+            self.stage_view.insert("", tk.END, iid=stage, text=label, values=("Chờ", ""))
+        self.stage_view.pack(fill=tk.X, pady=(0, 5))
+        
+        self.output = tk.Text(progress_frame, height=12, wrap=tk.WORD, state=tk.DISABLED)
+        self.output.pack(fill=tk.BOTH, expand=True)
         
     def select_pdf(self):
         """Chọn file PDF chương trình đào tạo"""
@@ -107,6 +179,14 @@ class SimpleTrainingProgramGUI:
             messagebox.showerror("Lỗi", "Học phí tín chỉ phải lớn hơn 0!")
             return
         
+        try:
+            target_gpa = self.target_gpa.get()
+        except tk.TclError:
+            target_gpa = -1
+        if not 0 <= target_gpa <= 4.0:
+            messagebox.showerror("Lỗi", "Mục tiêu GPA phải nằm trong khoảng 0-4.0!")
+            return
+        
         # Tạo dữ liệu JSON
         self.data = {
             "user_info": {
@@ -117,17 +197,124 @@ class SimpleTrainingProgramGUI:
             "training_program": {
                 "pdf_file_path": self.pdf_file.get(),
                 "remaining_semesters": self.remaining_semesters.get(),
-                "credit_fee": self.credit_fee.get()* 1000  # Chuyển đổi sang VNĐ
+                "credit_fee": self.credit_fee.get()* 1000,  # Chuyển đổi sang VNĐ
+                "target_gpa": target_gpa
             },
             
             
         }       
-        if self.data:
+        if self.data and self.run_job:
+            self.start_job()
+        elif self.data:
             try:
                 messagebox.showinfo("thông báo", "Xuất dữ liệu thành công!")
                 self.root.destroy()   
             except Exception as e:
                 messagebox.showerror("Lỗi không thể xuất", f"Đã xảy ra lỗi khi xuất dữ liệu: {str(e)}")
-          
     
-
+    def start_job(self):
+        """Chạy pipeline trên worker thread, giao diện vẫn phản hồi trong lúc chờ"""
+        if self.worker is not None and self.worker.is_alive():
+            return
+        self.cancel_event = threading.Event()
+        self.events = queue.Queue()
+        self.result = None
+        self._token_count = 0
+        self._job_start = time.perf_counter()
+        self.progress["value"] = 0
+        for stage in STAGE_LABELS:
+            self.stage_view.item(stage, values=("Chờ", ""))
+        self._clear_output()
+        self.export_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status.set("Đang chạy...")
+        
+        self.worker = threading.Thread(target=self._run_worker, args=(self.data, self.events, self.cancel_event),
+                                       name="gpa-pipeline", daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_events)
+    
+    def _run_worker(self, data, events, cancel_event):
+        """Worker thread: chỉ giao tiếp với giao diện qua hàng đợi (Tk không an toàn đa luồng)"""
+        try:
+            self.run_job(data, events.put, cancel_event)
+            events.put({"type": "cancelled"} if cancel_event.is_set() else {"type": "done"})
+        except Exception as e:
+            if cancel_event.is_set():
+                events.put({"type": "cancelled"})
+            else:
+                events.put({"type": "error", "message": str(e)})
+    
+    def cancel_job(self):
+        """Yêu cầu dừng: pipeline dừng ở ranh giới bước hoặc chunk stream kế tiếp"""
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status.set("Đang hủy...")
+    
+    def poll_events(self):
+        """Đọc hết sự kiện đang chờ trong hàng đợi rồi hẹn lần đọc tiếp theo"""
+        finished = False
+        try:
+            while True:
+                event = self.events.get_nowait()
+                finished = self.handle_event(event) or finished
+        except queue.Empty:
+            pass
+        if not finished:
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+    
+    def handle_event(self, event) -> bool:
+        """Cập nhật giao diện theo một sự kiện; trả về True khi job đã kết thúc"""
+        kind = event["type"]
+        if kind == "stage":
+            label = STAGE_LABELS.get(event["name"], event["name"])
+            if event["status"] == "start":
+                self.stage_view.item(event["name"], values=("Đang chạy", ""))
+                self.status.set(f"{label}...")
+            else:
+                status = {"done": "Xong", "cancelled": "Đã hủy"}.get(event["status"], "Lỗi")
+                self.stage_view.item(event["name"], values=(status, f"{event['elapsed']:.2f}s"))
+                self.progress["value"] = self.progress["value"] + 1
+        elif kind == "field":
+            value = json.dumps(event["value"], ensure_ascii=False)
+            self._append_output(f"✓ {FIELD_LABELS.get(event['name'], event['name'])}: {value[:300]}\n")
+        elif kind == "token":
+            self._token_count += 1
+            self.status.set(f"Phân tích GPA... ({self._token_count} chunk từ model)")
+        elif kind == "result":
+            self.result = event["value"]
+            self._append_output(f"\nKết quả đầu tiên sau {event['timings']['first_useful_output']:.2f}s, "
+                                f"phân tích xong sau {event['timings']['total']:.2f}s\n")
+        elif kind == "message":
+            self._append_output(event["text"] + "\n")
+        elif kind in ("done", "cancelled", "error"):
+            elapsed = time.perf_counter() - self._job_start
+            self.export_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            if kind == "done":
+                self.progress["value"] = len(STAGE_LABELS)
+                self.status.set(f"Hoàn thành sau {elapsed:.1f}s")
+            elif kind == "cancelled":
+                self.status.set(f"Đã hủy sau {elapsed:.1f}s")
+            else:
+                self.status.set("Đã xảy ra lỗi")
+                messagebox.showerror("Lỗi", f"Đã xảy ra lỗi: {event['message']}")
+            return True
+        return False
+    
+    def _append_output(self, text: str):
+        self.output.config(state=tk.NORMAL)
+        self.output.insert(tk.END, text)
+        self.output.see(tk.END)
+        self.output.config(state=tk.DISABLED)
+    
+    def _clear_output(self):
+        self.output.config(state=tk.NORMAL)
+        self.output.delete("1.0", tk.END)
+        self.output.config(state=tk.DISABLED)
+    
+    def on_close(self):
+        """Đóng cửa sổ: hủy job đang chạy, worker là daemon thread nên không giữ tiến trình lại"""
+        self.cancel_event.set()
+        self.root.destroy()
@@ -0,0 +1,198 @@
+from typing import Iterable, List, Optional, Dict, Any, Tuple
+
+import Semester_records
+
+# Thang điểm HCMUT: điểm chữ -> thang 4
+GRADE_POINTS = {
+    "A+": 4.0, "A": 4.0, "B+": 3.5, "B": 3.0, "C+": 2.5,
+    "C": 2.0, "D+": 1.5, "D": 1.0, "F": 0.0,
+}
+
+# Ngưỡng điểm thang 10 (cận dưới) -> điểm chữ, xếp giảm dần
+SCORE_BANDS = [
+    (9.5, "A+"), (8.5, "A"), (8.0, "B+"), (7.0, "B"), (6.5, "C+"),
+    (5.5, "C"), (5.0, "D+"), (4.0, "D"), (0.0, "F"),
+]
+
+# Điểm thang 4 dự kiến khi học lại, dùng chung cho danh sách môn cần cải thiện và Retake_solver
+ACHIEVABLE_GRADE = 3.5
+
+class BestAttemptIndex:
+    """Chỉ mục lần học có điểm cao nhất theo ma_mon, cập nhật O(1) cho mỗi dòng"""
+
+    def __init__(self):
+        self._best: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, mon_hoc: Dict[str, Any]) -> bool:
+        """Thêm một lần học, trả về True nếu nó trở thành lần học tốt nhất của môn"""
+        ma_mon = mon_hoc["ma_mon"]
+        current = self._best.get(ma_mon)
+        diem_so = mon_hoc["diem_so"]
+
+        if current is None or (
+            diem_so is not None and (current["diem_so"] is None or diem_so > current["diem_so"])
+        ):
+            self._best[ma_mon] = mon_hoc
+            return True
+        return False
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> "BestAttemptIndex":
+        """Thêm nhiều lần học (ví dụ khi import hàng loạt bảng điểm)"""
+        for mon_hoc in rows:
+            self.add(mon_hoc)
+        return self
+
+    def __len__(self) -> int:
+        return len(self._best)
+
+    def __contains__(self, ma_mon: str) -> bool:
+        return ma_mon in self._best
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Danh sách môn cuối cùng theo thứ tự xuất hiện, môn không có điểm được đặt tin_chi = 0"""
+        return [
+            dict(mon, tin_chi=0) if mon["diem_so"] in (None, 0.0) else mon
+            for mon in self._best.values()
+        ]
+
+def score_to_letter(diem_so: float) -> str:
+    """Đổi điểm thang 10 sang điểm chữ"""
+    for lower, letter in SCORE_BANDS:
+        if diem_so >= lower:
+            return letter
+    return "F"
+
+def to_4_point(diem_so: Optional[float] = None, diem_chu: Optional[str] = None) -> Optional[float]:
+    """Đổi điểm sang thang 4, ưu tiên điểm chữ; None nếu môn không có điểm tính GPA (miễn, chưa có điểm...)"""
+    if diem_chu:
+        letter = diem_chu.strip().upper()
+        if letter in GRADE_POINTS:
+            return GRADE_POINTS[letter]
+        return None
+    if diem_so is None:
+        return None
+    return GRADE_POINTS[score_to_letter(diem_so)]
+
+def graded_courses(bang_diem: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Các môn tính GPA: lấy lần học cao nhất, bỏ môn 0 tín chỉ và môn không có điểm chữ hợp lệ"""
+    courses = []
+    for mon in BestAttemptIndex().extend(bang_diem).to_list():
+        diem_4 = to_4_point(mon.get("diem_so"), mon.get("diem_chu"))
+        if not mon.get("tin_chi") or diem_4 is None:
+            continue
+        courses.append(dict(mon, diem_4=diem_4))
+    return courses
+
+def weighted_gpa(courses: Iterable[Dict[str, Any]]) -> Tuple[float, int]:
+    """GPA thang 4 có trọng số tín chỉ và tổng tín chỉ của các môn (đã qua graded_courses)"""
+    points = 0.0
+    credits = 0
+    for mon in courses:
+        points += mon["diem_4"] * mon["tin_chi"]
+        credits += mon["tin_chi"]
+    return (points / credits if credits else 0.0), credits
+
+def semester_gpas(bang_diem: Iterable[Dict[str, Any]], key: str = "hoc_ky",
+                  hoc_ky: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """GPA từng học kỳ và GPA tích lũy theo thứ tự học kỳ (nhóm theo trường key của môn)
+
+    Bảng điểm lưu trước khi môn có trường học kỳ thì dùng GPA footer trong bản ghi học kỳ (hoc_ky),
+    không có cả hai thì trả về list rỗng thay vì một học kỳ None.
+    """
+    rows = list(bang_diem)
+    if not rows or any(mon.get(key) is None for mon in rows):
+        return [{
+            "hoc_ky": record["hoc_ky"],
+            "gpa_hk": record["gpa_hk"],
+            "tin_chi_hk": record["tc_dat"],
+            "gpa_chung": record["gpa_tich_luy"],
+            "tin_chi_tich_luy": record["tc_tich_luy"],
+        } for record in hoc_ky or [] if record["gpa_hk"] is not None]
+
+    semesters: Dict[Any, List[Dict[str, Any]]] = {}
+    for mon in rows:
+        semesters.setdefault(mon[key], []).append(mon)
+
+    series = []
+    best = BestAttemptIndex()
+    for hoc_ky, rows in semesters.items():
+        gpa_hk, tin_chi_hk = weighted_gpa(graded_courses(rows))
+        best.extend(rows)
+        gpa_chung, tin_chi_tl = weighted_gpa(graded_courses(best.to_list()))
+        series.append({
+            "hoc_ky": hoc_ky,
+            "gpa_hk": round(gpa_hk, 2),
+            "tin_chi_hk": tin_chi_hk,
+            "gpa_chung": round(gpa_chung, 2),
+            "tin_chi_tich_luy": tin_chi_tl,
+        })
+    return series
+
+def simulate_retakes(courses: List[Dict[str, Any]], retakes: Dict[str, float]) -> float:
+    """GPA sau khi học lại: retakes ánh xạ ma_mon -> điểm thang 4 dự kiến (chỉ thay nếu cao hơn điểm cũ)"""
+    simulated = [
+        dict(mon, diem_4=max(mon["diem_4"], retakes[mon["ma_mon"]])) if mon["ma_mon"] in retakes else mon
+        for mon in courses
+    ]
+    return weighted_gpa(simulated)[0]
+
+def retake_gain(mon: Dict[str, Any], total_credits: int, achievable: float = ACHIEVABLE_GRADE) -> float:
+    """Mức tăng GPA tích lũy nếu học lại môn và đạt điểm achievable (thang 4)"""
+    if not total_credits:
+        return 0.0
+    return max(achievable - mon["diem_4"], 0.0) * mon["tin_chi"] / total_credits
+
+def priority_label(diem_so: float) -> str:
+    """Mức độ ưu tiên học lại theo điểm thang 10"""
+    if diem_so < 5.0:
+        return "Cao"
+    if diem_so < 5.5:
+        return "Trung bình"
+    return "Thấp"
+
+def courses_to_improve(courses: List[Dict[str, Any]], threshold: float = 6.0,
+                       achievable: float = ACHIEVABLE_GRADE) -> List[Dict[str, Any]]:
+    """Các môn dưới ngưỡng điểm, xếp theo mức tăng GPA khi học lại (giảm dần), đúng dạng MonCanCaiThien"""
+    total_credits = sum(mon["tin_chi"] for mon in courses)
+    candidates = []
+    for mon in courses:
+        if mon["diem_so"] is None or mon["diem_so"] >= threshold:
+            continue
+        gain = retake_gain(mon, total_credits, achievable)
+        candidates.append((gain, {
+            "ma_mon": mon["ma_mon"],
+            "ten_mon": mon["ten_mon"],
+            "diem_so": mon["diem_so"],
+            "tin_chi": mon["tin_chi"],
+            "diem_chu": mon["diem_chu"],
+            "ly_do": (f"Điểm {mon['diem_chu']} ({mon['diem_so']}) với {mon['tin_chi']} tín chỉ; "
+                      f"học lại đạt {achievable:.1f} có thể tăng GPA thêm {gain:.2f}"),
+            "muc_do_uu_tien": priority_label(mon["diem_so"]),
+        }))
+    candidates.sort(key=lambda item: item[0], reverse=True)
+    return [item[1] for item in candidates]
+
+def analyze(bang_diem: List[Dict[str, Any]], target_gpa: Optional[float] = None,
+            threshold: float = 6.0, achievable: float = ACHIEVABLE_GRADE,
+            hoc_ky: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Tính toàn bộ số liệu của PhanTichKetQua mà không cần LLM (hoc_ky: bản ghi học kỳ để tính xu hướng)"""
+    courses = graded_courses(bang_diem)
+    gpa, credits = weighted_gpa(courses)
+    mon_can_cai_thien = courses_to_improve(courses, threshold, achievable)
+    gpa_toi_da = simulate_retakes(courses, {mon["ma_mon"]: achievable for mon in mon_can_cai_thien})
+
+    result = {
+        "gpa_hien_tai": round(gpa, 2),
+        "tong_tin_chi_da_hoc": credits,
+        "mon_can_cai_thien": mon_can_cai_thien,
+        "gpa_toi_da_khi_hoc_lai": round(gpa_toi_da, 2),
+    }
+    series = semester_gpas(bang_diem, hoc_ky=hoc_ky)
+    if series:
+        result["gpa_theo_hoc_ky"] = series
+    if hoc_ky:
+        result["xu_huong_gpa"] = Semester_records.gpa_trend(Semester_records.to_columns(hoc_ky))
+    if target_gpa is not None:
+        result["muc_tieu_gpa"] = target_gpa
+        result["dat_duoc_muc_tieu"] = gpa_toi_da >= target_gpa
+    return result
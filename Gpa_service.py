@@ -0,0 +1,474 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Dict, Any
+from urllib.parse import urlparse, parse_qs
+
+from Agent_core import GpaAnalyzer, SSO_LOGIN_URL, GRADES_URL
+from Gpa_engine import BestAttemptIndex
+from Tracing import Tracer
+
+logger = logging.getLogger(__name__)
+
+# Biến môi trường chứa mật khẩu cho chế độ dòng lệnh (không đưa mật khẩu vào tham số lệnh)
+PASSWORD_ENV = "HCMUT_PASSWORD"
+
+def parse_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Kiểm tra và chuẩn hóa yêu cầu phân tích, ném ValueError nếu không hợp lệ
+
+    Nguồn bảng điểm (đúng một): "data" (JSON bảng điểm), "transcript" (đường dẫn file đã lưu)
+    hoặc "username" + "password" (scrape mới). "offline": true chỉ trả số liệu tính sẵn, không gọi model.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Yêu cầu phải là một JSON object")
+    sources = [key for key in ("data", "transcript", "username") if payload.get(key)]
+    if len(sources) != 1:
+        raise ValueError("Cần đúng một nguồn bảng điểm: data, transcript hoặc username/password")
+    if sources[0] == "username" and not payload.get("password"):
+        raise ValueError("Thiếu mật khẩu cho username")
+    if sources[0] == "data" and not (isinstance(payload["data"], dict) and isinstance(payload["data"].get("bang_diem"), list)):
+        raise ValueError("data phải có danh sách bang_diem")
+
+    try:
+        target_gpa = float(payload.get("target_gpa", 3.6))
+        credit_fee = float(payload["credit_fee"]) if payload.get("credit_fee") is not None else None
+        remaining_semesters = int(payload["remaining_semesters"]) if payload.get("remaining_semesters") else None
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Tham số không hợp lệ: {e}") from e
+    if not 0 <= target_gpa <= 4.0:
+        raise ValueError("target_gpa phải nằm trong khoảng 0-4.0")
+
+    return {
+        "source": sources[0],
+        "data": payload.get("data"),
+        "transcript": payload.get("transcript"),
+        "username": (payload.get("username") or "").strip() or None,
+        "password": payload.get("password"),
+        "student": payload.get("student"),
+        "target_gpa": target_gpa,
+        "credit_fee": credit_fee,
+        "curriculum_path": payload.get("curriculum_path"),
+        "remaining_semesters": remaining_semesters,
+        "offline": bool(payload.get("offline")),
+    }
+
+class AnalysisService:
+    """Giữ một GpaAnalyzer đã warm-up (model, index, chương trình đào tạo) cho mọi yêu cầu phân tích
+
+    Job được đưa vào hàng đợi có giới hạn và chạy trên `workers` thread: các lần scrape chạy song song
+    (mỗi worker giữ một trình duyệt hoặc HTTP session), còn bước phân tích dùng chung analyzer nên
+    chạy lần lượt. Đường dẫn trong job gửi qua submit (transcript, curriculum_path) chỉ được nhận khi có
+    data_dir và phải nằm trong thư mục đó.
+    """
+
+    def __init__(self, analyzer: Optional[GpaAnalyzer] = None, workers: int = 2, max_queue: int = 32,
+                 backend: str = "selenium", login_url: str = SSO_LOGIN_URL, grades_url: str = GRADES_URL,
+                 scraper_factory: Optional[Callable[[], GpaAnalyzer]] = None, max_jobs_kept: int = 1000,
+                 data_dir: Optional[str] = None, grades_json_url: Optional[str] = None):
+        self.analyzer = analyzer or GpaAnalyzer()
+        self.data_dir = os.path.realpath(data_dir) if data_dir else None
+        self.workers = workers
+        self.backend = backend
+        self.login_url = login_url
+        self.grades_url = grades_url
+        self.grades_json_url = grades_json_url
+        self.scraper_factory = scraper_factory or self._default_scraper
+        self.max_jobs_kept = max_jobs_kept
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._done: Dict[str, threading.Event] = {}
+        self._requests: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._analysis_lock = threading.Lock()
+        self._local = threading.local()
+        self._scrapers: List[GpaAnalyzer] = []
+        self._threads: List[threading.Thread] = []
+        self.warm = False
+
+    def _default_scraper(self) -> GpaAnalyzer:
+        fetcher = None
+        if self.backend == "http":
+            from Http_fetcher import HttpTranscriptFetcher
+            fetcher = HttpTranscriptFetcher(self.login_url, self.grades_url, json_url=self.grades_json_url)
+        return GpaAnalyzer(keep_driver_alive=True, fetcher=fetcher,
+                           login_url=self.login_url, grades_url=self.grades_url, tracer=self.analyzer.tracer)
+
+    def _worker_scraper(self) -> GpaAnalyzer:
+        """Mỗi worker giữ một scraper (trình duyệt/HTTP session) cho mọi job của nó"""
+        scraper = getattr(self._local, "scraper", None)
+        if scraper is None:
+            scraper = self.scraper_factory()
+            scraper.history_db = self.analyzer.history_db
+            scraper.setup_driver()
+            self._local.scraper = scraper
+            with self._lock:
+                self._scrapers.append(scraper)
+        return scraper
+
+    def warm_up(self):
+        """Trả chi phí khởi động một lần: nạp model, index và chương trình đào tạo"""
+        start = time.perf_counter()
+        try:
+            self.analyzer.warm_up()
+            self.warm = True
+            logger.info(f"Service đã warm-up sau {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # Warm-up chỉ để tăng tốc, lỗi ở đây không làm hỏng phân tích
+            logger.warning(f"Warm-up thất bại, tiếp tục không warm-up: {e}")
+
+    def start(self, warm_up: bool = True) -> "AnalysisService":
+        if warm_up:
+            self.warm_up()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"gpa-service-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Dừng worker sau khi xong job đang chạy, đóng mọi trình duyệt"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        for scraper in self._scrapers:
+            scraper.cleanup(force=True)
+        self._scrapers.clear()
+        self.analyzer.cleanup(force=True)
+
+    def _confine(self, path: Optional[str], field: str) -> Optional[str]:
+        """Đường dẫn do client gửi chỉ được trỏ tới file trong data_dir (client không đọc được file tùy ý)"""
+        if not path:
+            return None
+        if self.data_dir is None:
+            raise ValueError(f"Service không nhận {field} (chạy serve với --data-dir), hãy gửi bảng điểm trong data")
+        resolved = os.path.realpath(os.path.join(self.data_dir, path))
+        if os.path.commonpath([self.data_dir, resolved]) != self.data_dir:
+            raise ValueError(f"{field} phải nằm trong thư mục dữ liệu của service")
+        return resolved
+
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Đưa yêu cầu vào hàng đợi; ném ValueError nếu yêu cầu sai, queue.Full nếu hàng đợi đã đầy"""
+        request = parse_request(payload)
+        request["transcript"] = self._confine(request["transcript"], "transcript")
+        request["curriculum_path"] = self._confine(request["curriculum_path"], "curriculum_path")
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "source": request["source"],
+            "student": request["student"] or request["username"],
+            "target_gpa": request["target_gpa"],
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "timings": {},
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            self.jobs[job_id] = job
+            self._done[job_id] = threading.Event()
+            self._requests[job_id] = request
+        try:
+            self.queue.put_nowait(job_id)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job_id], self._done[job_id], self._requests[job_id]
+            raise
+        return self.get(job_id)
+
+    def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Trạng thái của job (bản sao), chờ tối đa `wait` giây nếu job chưa xong"""
+        done = self._done.get(job_id)
+        if done is not None and wait > 0:
+            done.wait(wait)
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{key: job[key] for key in ("id", "status", "student", "submitted", "finished")}
+                    for job in self.jobs.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        return {
+            "warm": self.warm,
+            "workers": self.workers,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "done": statuses.count("done"),
+            "error": statuses.count("error"),
+            "queue_capacity": self.queue.maxsize,
+        }
+
+    def _worker_loop(self):
+        while True:
+            job_id = self.queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self.jobs[job_id]
+                request = self._requests.pop(job_id)
+                job["status"] = "running"
+                job["started"] = time.time()
+            try:
+                result, timings = self.run(request)
+                update = {"status": "done", "result": result, "timings": timings}
+            except Exception as e:
+                logger.error(f"Lỗi khi chạy job {job_id}: {e}")
+                update = {"status": "error", "error": str(e)}
+            with self._lock:
+                job.update(update, finished=time.time())
+                self._done.pop(job_id).set()
+                self._evict()
+
+    def _evict(self):
+        """Chỉ giữ lại max_jobs_kept job đã xong gần nhất"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["finished"] is not None]
+        for job_id in finished[:max(len(finished) - self.max_jobs_kept, 0)]:
+            del self.jobs[job_id]
+
+    def _load_data(self, request: Dict[str, Any], timings: Dict[str, float]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        if request["source"] == "username":
+            scraper = self._worker_scraper()
+            data = scraper.login_and_scrape(request["username"], request["password"])
+            request["student"] = request["student"] or request["username"]
+            request["diff"] = scraper.last_diff
+            timings["scrape"] = time.perf_counter() - start
+            return data
+
+        if request["source"] == "transcript":
+            with open(request["transcript"], "r", encoding="utf-8") as f:
+                data = json.load(f)
+            request["student"] = request["student"] or os.path.splitext(os.path.basename(request["transcript"]))[0]
+        else:
+            data = request["data"]
+        attempts = data.get("bang_diem", [])
+        data["bang_diem"] = BestAttemptIndex().extend(attempts).to_list()
+        history = self.analyzer.history_db
+        if history is not None and request["student"]:
+            request["diff"] = history.record_scrape(request["student"], data, attempts)
+        timings["load"] = time.perf_counter() - start
+        return data
+
+    def run(self, request: Dict[str, Any]) -> tuple:
+        """Chạy một yêu cầu đã chuẩn hóa, trả về (kết quả dạng dict, thời gian từng bước)"""
+        timings: Dict[str, float] = {}
+        data = self._load_data(request, timings)
+
+        with self._analysis_lock:
+            start = time.perf_counter()
+            analyzer = self.analyzer
+            analyzer.username = request["student"]
+            analyzer.last_diff = request.get("diff")
+            if request["curriculum_path"] != analyzer.curriculum_path:
+                analyzer.curriculum_path = request["curriculum_path"]
+                analyzer.curriculum = None
+            analyzer.remaining_semesters = request["remaining_semesters"]
+            if request["offline"]:
+                analyzer.data = data
+                metrics = analyzer.analyze_offline(request["target_gpa"], request["credit_fee"])
+                timings["analyze"] = time.perf_counter() - start
+                return {"so_lieu": metrics}, timings
+            analyzer.setup_agent(data)
+            timings["setup_agent"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = analyzer.analyze_gpa(request["target_gpa"], request["credit_fee"])
+            timings["analyze"] = time.perf_counter() - start
+            prompt = dict(analyzer.prompt_report)
+
+        return {"phan_tich": result.model_dump(), "prompt": prompt}, timings
+
+class ServiceServer:
+    """Server HTTP/JSON local cho AnalysisService
+
+    GET /health, GET /jobs, POST /jobs (202 + job, 400 yêu cầu sai, 503 hàng đợi đầy),
+    GET /jobs/<id>?wait=<giây> (chờ job xong tối đa wait giây).
+    """
+
+    def __init__(self, service: AnalysisService, host: str = "127.0.0.1", port: int = 8766,
+                 max_body: int = 8 * 1024 * 1024):
+        self.service = service
+        self.max_body = max_body
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ServiceServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "ServiceServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send(self, status: int, body: Any):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/health":
+                    return self._send(200, {"status": "ok", **server.service.stats()})
+                if url.path == "/jobs":
+                    return self._send(200, server.service.list_jobs())
+                if url.path.startswith("/jobs/"):
+                    try:
+                        wait = min(float(parse_qs(url.query).get("wait", ["0"])[0]), 300.0)
+                    except ValueError:
+                        return self._send(400, {"error": "wait phải là số giây"})
+                    job = server.service.get(url.path[len("/jobs/"):], wait=wait)
+                    if job is None:
+                        return self._send(404, {"error": "Không tìm thấy job"})
+                    return self._send(200, job)
+                self._send(404, {"error": "Not found"})
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/jobs":
+                    return self._send(404, {"error": "Not found"})
+                length = int(self.headers.get("Content-Length", 0))
+                if length > server.max_body:
+                    return self._send(413, {"error": "Yêu cầu quá lớn"})
+                try:
+                    payload = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                    job = server.service.submit(payload)
+                except ValueError as e:
+                    return self._send(400, {"error": str(e)})
+                except queue.Full:
+                    return self._send(503, {"error": "Hàng đợi đã đầy, thử lại sau"})
+                self._send(202, job)
+
+        return Handler
+
+def main():
+    """Chạy phân tích không cần giao diện (analyze) hoặc chạy service HTTP/JSON (serve)"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Phân tích GPA không cần giao diện / service HTTP local")
+    parser.add_argument("--model", default="qwen3:8b")
+    parser.add_argument("--cache", help="Thư mục cache kết quả phân tích")
+    parser.add_argument("--history", help="File SQLite lưu lịch sử scrape")
+    parser.add_argument("--backend", choices=["http", "selenium"], default="selenium",
+                        help="http không cần trình duyệt nhưng cần --grades-json-url (bảng mybk được render bằng JS)")
+    parser.add_argument("--grades-json-url", help="Endpoint JSON bảng điểm cho backend http")
+    parser.add_argument("--login-url", default=SSO_LOGIN_URL)
+    parser.add_argument("--grades-url", default=GRADES_URL)
+    parser.add_argument("--trace", help="Ghi trace thời gian từng bước (JSON dạng Chrome trace) ra file khi thoát")
+    parser.add_argument("--profile", action="store_true", help="Chạy kèm cProfile (ghi thêm file .prof cạnh trace)")
+    parser.add_argument("--trace-memory", action="store_true", help="Theo dõi bộ nhớ bằng tracemalloc")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze = commands.add_parser("analyze", help="Phân tích một bảng điểm rồi thoát")
+    source = analyze.add_mutually_exclusive_group(required=True)
+    source.add_argument("--transcript", help="File bảng điểm đã lưu (ví dụ ket_qua.json)")
+    source.add_argument("--username", help=f"Tài khoản để scrape mới, mật khẩu lấy từ biến môi trường {PASSWORD_ENV}")
+    analyze.add_argument("--target", type=float, default=3.6, help="Mục tiêu GPA")
+    analyze.add_argument("--fee", type=float, help="Học phí mỗi tín chỉ (VNĐ)")
+    analyze.add_argument("--curriculum", help="File PDF chương trình đào tạo")
+    analyze.add_argument("--semesters", type=int, help="Số kỳ còn lại")
+    analyze.add_argument("--offline", action="store_true", help="Chỉ dùng số liệu tính sẵn, không gọi model")
+    analyze.add_argument("--output", help="Ghi kết quả JSON ra file thay vì stdout")
+
+    serve = commands.add_parser("serve", help="Chạy service HTTP/JSON với một analyzer luôn sẵn sàng")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8766)
+    serve.add_argument("--workers", type=int, default=2, help="Số job chạy đồng thời")
+    serve.add_argument("--queue-size", type=int, default=32, help="Số job tối đa đang chờ")
+    serve.add_argument("--data-dir", help="Thư mục chứa bảng điểm/PDF mà job được phép tham chiếu bằng đường dẫn "
+                                          "(mặc định chỉ nhận bảng điểm gửi trực tiếp trong data)")
+    args = parser.parse_args()
+
+    analysis_cache = None
+    if args.cache:
+        from Analysis_cache import AnalysisCache
+        analysis_cache = AnalysisCache(args.cache)
+    history_db = None
+    if args.history:
+        from History_db import HistoryDB
+        history_db = HistoryDB(args.history)
+    tracer = None
+    if args.trace or args.profile or args.trace_memory:
+        tracer = Tracer(args.trace, profile=args.profile, trace_memory=args.trace_memory).start()
+    analyzer = GpaAnalyzer(model_id=args.model, analysis_cache=analysis_cache, history_db=history_db, tracer=tracer)
+
+    if args.command == "analyze":
+        service = AnalysisService(analyzer, workers=0, backend=args.backend, login_url=args.login_url,
+                                  grades_url=args.grades_url, grades_json_url=args.grades_json_url)
+        payload = {"transcript": args.transcript, "target_gpa": args.target, "credit_fee": args.fee,
+                   "curriculum_path": args.curriculum, "remaining_semesters": args.semesters, "offline": args.offline}
+        if args.username:
+            password = os.environ.get(PASSWORD_ENV)
+            if not password:
+                parser.error(f"Cần đặt biến môi trường {PASSWORD_ENV} khi dùng --username")
+            payload.update(username=args.username, password=password)
+        try:
+            result, timings = service.run(parse_request(payload))
+        finally:
+            service.stop()
+            if tracer is not None:
+                tracer.stop()
+        result["timings"] = timings
+        text = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text)
+            logger.info(f"Kết quả phân tích đã được lưu vào {args.output}")
+        else:
+            print(text)
+        return
+
+    service = AnalysisService(analyzer, workers=args.workers, max_queue=args.queue_size, backend=args.backend,
+                              login_url=args.login_url, grades_url=args.grades_url,
+                              grades_json_url=args.grades_json_url, data_dir=args.data_dir).start()
+    server = ServiceServer(service, args.host, args.port)
+    logger.info(f"Service đang chạy tại {server.base_url} ({args.workers} worker, hàng đợi {args.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        service.stop()
+        if tracer is not None:
+            tracer.stop()
+
+if __name__ == "__main__":
+    main()
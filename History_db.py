@@ -0,0 +1,372 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Dict, Any
+
+import Semester_records
+from Gpa_engine import BestAttemptIndex
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS scrapes (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    scraped_at TEXT NOT NULL,
+    changed INTEGER NOT NULL,
+    snapshot_id INTEGER NOT NULL
+);
+-- Mọi lần học từng thấy của một môn, chỉ ghi thêm: điểm được sửa (kể cả cùng cap_nhat) là một dòng mới.
+-- content_hash = băm nội dung dòng + thứ tự của nó giữa các dòng trùng hệt trong cùng lần scrape (attempt_hashes)
+CREATE TABLE IF NOT EXISTS course_attempts (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    content_hash TEXT NOT NULL,
+    ma_mon TEXT NOT NULL,
+    cap_nhat TEXT NOT NULL,
+    ten_mon TEXT,
+    tin_chi INTEGER,
+    diem_tp TEXT,
+    diem_so REAL,
+    diem_chu TEXT,
+    diem_dat TEXT,
+    hoc_ky INTEGER,
+    first_scrape_id INTEGER NOT NULL,
+    UNIQUE (student_id, content_hash)
+);
+-- Snapshot chỉ lưu cho lần scrape có thay đổi (các lần học đọc được trong lần scrape đó);
+-- lần không đổi trỏ về snapshot trước (scrapes.snapshot_id)
+CREATE TABLE IF NOT EXISTS snapshot_attempts (
+    scrape_id INTEGER NOT NULL REFERENCES scrapes(id),
+    position INTEGER NOT NULL,
+    attempt_id INTEGER NOT NULL REFERENCES course_attempts(id),
+    PRIMARY KEY (scrape_id, position)
+);
+CREATE TABLE IF NOT EXISTS snapshot_semesters (
+    scrape_id INTEGER NOT NULL REFERENCES scrapes(id),
+    hoc_ky INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (scrape_id, hoc_ky)
+);
+-- Trạng thái mới nhất của từng môn, phục vụ truy vấn cả nhóm
+CREATE TABLE IF NOT EXISTS current_courses (
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    ma_mon TEXT NOT NULL,
+    cap_nhat TEXT NOT NULL,
+    tin_chi INTEGER,
+    diem_so REAL,
+    diem_chu TEXT,
+    PRIMARY KEY (student_id, ma_mon)
+);
+CREATE TABLE IF NOT EXISTS student_meta (
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (student_id, key)
+);
+CREATE INDEX IF NOT EXISTS idx_current_mon_diem ON current_courses (ma_mon, diem_chu);
+CREATE INDEX IF NOT EXISTS idx_current_diem ON current_courses (diem_chu, diem_so);
+CREATE INDEX IF NOT EXISTS idx_scrapes_student ON scrapes (student_id, id);
+CREATE INDEX IF NOT EXISTS idx_attempts_mon ON course_attempts (student_id, ma_mon, id);
+"""
+
+# Các trường quyết định một môn có thay đổi hay không (ngoài cap_nhat)
+DIFF_FIELDS = ("tin_chi", "diem_so", "diem_chu")
+
+# Nội dung một lần học được lưu trong course_attempts
+ATTEMPT_FIELDS = ("ma_mon", "cap_nhat", "ten_mon", "tin_chi", "diem_tp", "diem_so", "diem_chu", "diem_dat", "hoc_ky")
+
+def _attempt_values(mon: Dict[str, Any]) -> List[Any]:
+    return [(mon.get(field) or "") if field == "cap_nhat" else mon.get(field) for field in ATTEMPT_FIELDS]
+
+def attempt_hashes(attempts: Iterable[Dict[str, Any]]) -> List[str]:
+    """Khóa nội dung của từng lần học; các dòng trùng hệt nhau được phân biệt bằng số thứ tự xuất hiện"""
+    hashes, seen = [], {}
+    for mon in attempts:
+        content = json.dumps(_attempt_values(mon), ensure_ascii=False)
+        occurrence = seen[content] = seen.get(content, -1) + 1
+        hashes.append(hashlib.sha1(f"{content}#{occurrence}".encode("utf-8")).hexdigest())
+    return hashes
+
+class HistoryDB:
+    """Lịch sử bảng điểm trong SQLite: mọi lần học, mọi lần scrape, diff giữa hai lần scrape liên tiếp"""
+
+    def __init__(self, path: str = "history.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        # Một kết nối dùng chung giữa các worker (Batch_runner), truy cập được khóa bằng _lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate_legacy_attempts()
+
+    def _migrate_legacy_attempts(self):
+        """Chuyển bảng attempts/snapshot_courses cũ (khóa theo cap_nhat, bị ghi đè khi điểm được sửa) sang bảng mới"""
+        tables = {row["name"] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "attempts" not in tables:
+            return
+        with self.conn:
+            ids = {}
+            for row in self.conn.execute("SELECT * FROM attempts ORDER BY first_scrape_id, rowid").fetchall():
+                ids[row["student_id"], row["ma_mon"], row["cap_nhat"]] = self.conn.execute(
+                    "INSERT INTO course_attempts (student_id, content_hash, ma_mon, cap_nhat, ten_mon, tin_chi, "
+                    "diem_tp, diem_so, diem_chu, diem_dat, hoc_ky, first_scrape_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [row["student_id"], attempt_hashes([dict(row)])[0]] + _attempt_values(dict(row))
+                    + [row["first_scrape_id"]]).lastrowid
+            if "snapshot_courses" in tables:
+                rows = self.conn.execute(
+                    "SELECT s.scrape_id, r.student_id, s.ma_mon, s.cap_nhat FROM snapshot_courses s "
+                    "JOIN scrapes r ON r.id = s.scrape_id ORDER BY s.scrape_id, s.rowid").fetchall()
+                positions: Dict[int, int] = {}
+                for row in rows:
+                    attempt_id = ids.get((row["student_id"], row["ma_mon"], row["cap_nhat"]))
+                    if attempt_id is None:
+                        continue
+                    position = positions[row["scrape_id"]] = positions.get(row["scrape_id"], -1) + 1
+                    self.conn.execute(
+                        "INSERT INTO snapshot_attempts (scrape_id, position, attempt_id) VALUES (?, ?, ?)",
+                        (row["scrape_id"], position, attempt_id))
+                self.conn.execute("DROP TABLE snapshot_courses")
+            self.conn.execute("DROP TABLE attempts")
+        logger.info(f"Đã chuyển {len(ids)} lần học sang bảng course_attempts trong {self.path}")
+
+    def _student_id(self, username: str, create: bool = True) -> Optional[int]:
+        row = self.conn.execute("SELECT id FROM students WHERE username = ?", (username,)).fetchone()
+        if row is not None:
+            return row["id"]
+        if not create:
+            return None
+        return self.conn.execute("INSERT INTO students (username) VALUES (?)", (username,)).lastrowid
+
+    def _latest_snapshot(self, student_id: int) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT snapshot_id FROM scrapes WHERE student_id = ? ORDER BY id DESC LIMIT 1", (student_id,)
+        ).fetchone()
+        return row["snapshot_id"] if row else None
+
+    def _semesters(self, snapshot_id: Optional[int]) -> List[Dict[str, Any]]:
+        if snapshot_id is None:
+            return []
+        rows = self.conn.execute(
+            "SELECT record FROM snapshot_semesters WHERE scrape_id = ? ORDER BY hoc_ky", (snapshot_id,)
+        ).fetchall()
+        return [json.loads(row["record"]) for row in rows]
+
+    def _current(self, student_id: Optional[int]) -> Dict[str, Dict[str, Any]]:
+        if student_id is None:
+            return {}
+        return {
+            row["ma_mon"]: dict(row) for row in self.conn.execute(
+                "SELECT ma_mon, cap_nhat, tin_chi, diem_so, diem_chu FROM current_courses WHERE student_id = ?",
+                (student_id,))
+        }
+
+    def _known_attempts(self, student_id: Optional[int]) -> Dict[str, int]:
+        """content_hash -> id của các lần học đã lưu"""
+        if student_id is None:
+            return {}
+        return {
+            row["content_hash"]: row["id"] for row in self.conn.execute(
+                "SELECT id, content_hash FROM course_attempts WHERE student_id = ?", (student_id,))
+        }
+
+    def diff(self, username: str, data: Dict[str, Any],
+             attempts: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """So sánh bảng điểm với lần scrape gần nhất (theo cap_nhat và điểm), không ghi gì vào DB"""
+        with self._lock:
+            student_id = self._student_id(username, create=False)
+            latest_snapshot = self._latest_snapshot(student_id) if student_id is not None else None
+            return self._diff(self._current(student_id), self._semesters(latest_snapshot), data,
+                              first=latest_snapshot is None,
+                              hashes=attempt_hashes(attempts if attempts is not None else data.get("bang_diem", [])),
+                              known_attempts=self._known_attempts(student_id))
+
+    def _diff(self, previous: Dict[str, Dict[str, Any]], previous_semesters: List[Dict[str, Any]],
+              data: Dict[str, Any], first: bool, hashes: List[str],
+              known_attempts: Dict[str, int]) -> Dict[str, Any]:
+        added, changed, unchanged = [], [], 0
+        seen = set()
+        for mon in data.get("bang_diem", []):
+            seen.add(mon["ma_mon"])
+            old = previous.get(mon["ma_mon"])
+            if old is None:
+                added.append(mon["ma_mon"])
+            elif old["cap_nhat"] != (mon.get("cap_nhat") or "") or any(old[f] != mon.get(f) for f in DIFF_FIELDS):
+                changed.append({
+                    "ma_mon": mon["ma_mon"],
+                    "cu": {field: old[field] for field in ("cap_nhat",) + DIFF_FIELDS},
+                    "moi": {field: mon.get(field) for field in ("cap_nhat",) + DIFF_FIELDS},
+                })
+            else:
+                unchanged += 1
+        removed = sorted(set(previous) - seen)
+        semesters_changed = Semester_records.semesters_of(data) != previous_semesters
+        # Lần học mới không phải lần tốt nhất (ví dụ học lại điểm thấp hơn) không đổi bang_diem nhưng vẫn cần ghi
+        new_attempts = [digest for digest in hashes if digest not in known_attempts]
+        return {
+            "first_scrape": first,
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+            "unchanged": unchanged,
+            "semesters_changed": semesters_changed,
+            "new_attempts": len(new_attempts),
+            "has_changes": bool(first or added or changed or removed or semesters_changed or new_attempts),
+        }
+
+    def record_scrape(self, username: str, data: Dict[str, Any],
+                      attempts: Optional[Iterable[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Ghi một lần scrape, trả về diff so với lần trước (kèm scrape_id)
+
+        attempts: mọi dòng môn học đọc được, trước khi BestAttemptIndex chỉ giữ lần học tốt nhất
+        (mặc định data["bang_diem"]); mọi lần học đều được lưu và không bao giờ bị sửa, bang_diem chỉ dùng cho diff.
+        """
+        attempts = list(attempts) if attempts is not None else data.get("bang_diem", [])
+        hashes = attempt_hashes(attempts)
+        with self._lock, self.conn:
+            student_id = self._student_id(username)
+            latest_snapshot = self._latest_snapshot(student_id)
+            known_attempts = self._known_attempts(student_id)
+            diff = self._diff(self._current(student_id), self._semesters(latest_snapshot), data,
+                              first=latest_snapshot is None, hashes=hashes, known_attempts=known_attempts)
+
+            scraped_at = data.get("timestamp") or time.strftime("%Y-%m-%d %H:%M:%S")
+            cursor = self.conn.execute(
+                "INSERT INTO scrapes (student_id, scraped_at, changed, snapshot_id) VALUES (?, ?, ?, 0)",
+                (student_id, scraped_at, int(diff["has_changes"])))
+            scrape_id = cursor.lastrowid
+            snapshot_id = scrape_id if diff["has_changes"] else latest_snapshot
+            self.conn.execute("UPDATE scrapes SET snapshot_id = ? WHERE id = ?", (snapshot_id, scrape_id))
+            diff["scrape_id"] = scrape_id
+
+            if diff["has_changes"]:
+                bang_diem = data.get("bang_diem", [])
+                attempt_ids = []
+                for mon, digest in zip(attempts, hashes):
+                    if digest not in known_attempts:
+                        known_attempts[digest] = self.conn.execute(
+                            "INSERT INTO course_attempts (student_id, content_hash, ma_mon, cap_nhat, ten_mon, tin_chi, "
+                            "diem_tp, diem_so, diem_chu, diem_dat, hoc_ky, first_scrape_id) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            [student_id, digest] + _attempt_values(mon) + [scrape_id]).lastrowid
+                    attempt_ids.append(known_attempts[digest])
+                self.conn.executemany(
+                    "INSERT INTO snapshot_attempts (scrape_id, position, attempt_id) VALUES (?, ?, ?)",
+                    [(scrape_id, position, attempt_id) for position, attempt_id in enumerate(attempt_ids)])
+                self.conn.executemany(
+                    "INSERT INTO snapshot_semesters (scrape_id, hoc_ky, record) VALUES (?, ?, ?)",
+                    [(scrape_id, record["hoc_ky"], json.dumps(record, ensure_ascii=False))
+                     for record in Semester_records.semesters_of(data)])
+                self.conn.execute("DELETE FROM current_courses WHERE student_id = ?", (student_id,))
+                self.conn.executemany(
+                    "INSERT INTO current_courses (student_id, ma_mon, cap_nhat, tin_chi, diem_so, diem_chu) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(student_id, mon["ma_mon"], mon.get("cap_nhat") or "", mon.get("tin_chi"),
+                      mon.get("diem_so"), mon.get("diem_chu")) for mon in bang_diem])
+
+        logger.info(f"[{username}] Lần scrape {scrape_id}: thêm {len(diff['added'])}, đổi {len(diff['changed'])}, "
+                    f"bỏ {len(diff['removed'])}, giữ nguyên {diff['unchanged']}")
+        return diff
+
+    def snapshot(self, username: str, scrape_id: Optional[int] = None) -> Dict[str, Any]:
+        """Dựng lại bảng điểm (bang_diem, hoc_ky) của một lần scrape, mặc định là lần mới nhất"""
+        with self._lock:
+            student_id = self._student_id(username, create=False)
+            if student_id is None:
+                raise KeyError(f"Không có lịch sử của {username}")
+            if scrape_id is None:
+                row = self.conn.execute(
+                    "SELECT id, scraped_at, snapshot_id FROM scrapes WHERE student_id = ? ORDER BY id DESC LIMIT 1",
+                    (student_id,)).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT id, scraped_at, snapshot_id FROM scrapes WHERE student_id = ? AND id = ?",
+                    (student_id, scrape_id)).fetchone()
+            if row is None:
+                raise KeyError(f"Không có lần scrape {scrape_id} của {username}")
+
+            courses = self.conn.execute(
+                "SELECT a.ma_mon, a.ten_mon, a.tin_chi, a.diem_tp, a.diem_so, a.diem_chu, a.diem_dat, a.cap_nhat, "
+                "a.hoc_ky FROM snapshot_attempts s JOIN course_attempts a ON a.id = s.attempt_id "
+                "WHERE s.scrape_id = ? ORDER BY s.position",
+                (row["snapshot_id"],)).fetchall()
+            # Snapshot lưu mọi lần học của lần scrape đó; chọn lại lần tốt nhất như lúc scrape
+            return {
+                "bang_diem": BestAttemptIndex().extend(dict(course) for course in courses).to_list(),
+                "hoc_ky": self._semesters(row["snapshot_id"]),
+                "timestamp": row["scraped_at"],
+            }
+
+    def course_history(self, username: str, ma_mon: str) -> List[Dict[str, Any]]:
+        """Mọi lần học đã ghi nhận của một môn, theo thứ tự xuất hiện"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT a.* FROM course_attempts a JOIN students s ON s.id = a.student_id "
+                "WHERE s.username = ? AND a.ma_mon = ? ORDER BY a.id",
+                (username, ma_mon)).fetchall()
+        return [dict(row) for row in rows]
+
+    def students_with_grade(self, ma_mon: str, diem_chu: str) -> List[str]:
+        """Các sinh viên có điểm chữ diem_chu ở môn ma_mon (theo lần scrape mới nhất), dùng idx_current_mon_diem"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT s.username FROM current_courses c JOIN students s ON s.id = c.student_id "
+                "WHERE c.ma_mon = ? AND c.diem_chu = ? ORDER BY s.username",
+                (ma_mon, diem_chu)).fetchall()
+        return [row["username"] for row in rows]
+
+    def get_meta(self, username: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT m.value FROM student_meta m JOIN students s ON s.id = m.student_id "
+                "WHERE s.username = ? AND m.key = ?", (username, key)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, username: str, key: str, value: Optional[str]):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO student_meta (student_id, key, value) VALUES (?, ?, ?)",
+                (self._student_id(username), key, value))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def main():
+    """Truy vấn lịch sử bảng điểm từ dòng lệnh"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lịch sử bảng điểm (SQLite)")
+    parser.add_argument("--db", default="history.db")
+    commands = parser.add_subparsers(dest="command", required=True)
+    grade_cmd = commands.add_parser("grade", help="Sinh viên có điểm chữ cho trước ở một môn, ví dụ: grade MT1003 F")
+    grade_cmd.add_argument("ma_mon")
+    grade_cmd.add_argument("diem_chu")
+    course_cmd = commands.add_parser("course", help="Các lần học một môn của một sinh viên")
+    course_cmd.add_argument("username")
+    course_cmd.add_argument("ma_mon")
+    args = parser.parse_args()
+
+    db = HistoryDB(args.db)
+    try:
+        if args.command == "grade":
+            for username in db.students_with_grade(args.ma_mon, args.diem_chu):
+                print(username)
+        else:
+            for attempt in db.course_history(args.username, args.ma_mon):
+                print(f"{attempt['cap_nhat']}: {attempt['diem_so']} ({attempt['diem_chu']})")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
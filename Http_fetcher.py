@@ -0,0 +1,217 @@
+import logging
+from html.parser import HTMLParser
+from typing import Callable, List, Optional, Dict, Any
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Agent_core import LoginFailed
+
+logger = logging.getLogger(__name__)
+
+class LoginFormParser(HTMLParser):
+    """Lấy action và toàn bộ input (kể cả hidden như lt/execution) của form đăng nhập CAS"""
+
+    def __init__(self):
+        super().__init__()
+        self.action: Optional[str] = None
+        self.fields: Dict[str, str] = {}
+        self._in_form = False
+        self._form_fields: Dict[str, str] = {}
+        self._form_action: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._in_form = True
+            self._form_fields = {}
+            self._form_action = attrs.get("action")
+        elif tag == "input" and self._in_form and attrs.get("name"):
+            self._form_fields[attrs["name"]] = attrs.get("value") or ""
+
+    def handle_endtag(self, tag):
+        if tag == "form" and self._in_form:
+            self._in_form = False
+            if "username" in self._form_fields and self.action is None:
+                self.action = self._form_action or ""
+                self.fields = self._form_fields
+
+class TableSnapshotParser(HTMLParser):
+    """Chuyển HTML của #lsKetQuaHocTap thành snapshot giống TABLE_SNAPSHOT_JS trong Agent_core"""
+
+    def __init__(self, table_id: str = "lsKetQuaHocTap"):
+        super().__init__()
+        self.table_id = table_id
+        self.found = False
+        self.body_rows: List[List[str]] = []
+        self.footer_rows: List[List[Dict[str, Any]]] = []
+        self._table_depth = 0
+        self._in_tbody = False
+        self._row: Optional[List[Dict[str, Any]]] = None
+        self._cell: Optional[Dict[str, Any]] = None
+        self._in_b = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "table":
+            if self._table_depth == 0 and attrs.get("id") == self.table_id:
+                self.found = True
+                self._table_depth = 1
+            elif self._table_depth:
+                self._table_depth += 1
+            return
+        if self._table_depth != 1:
+            return
+
+        if tag == "tbody":
+            self._in_tbody = True
+        elif tag == "tr":
+            self._row = []
+        elif tag == "td" and self._row is not None:
+            self._cell = {"text": [], "b": None, "colspan": attrs.get("colspan")}
+        elif tag == "b" and self._cell is not None:
+            self._in_b = True
+            self._cell["b"] = self._cell["b"] or []
+        elif tag == "br" and self._cell is not None:
+            self._cell["text"].append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._table_depth:
+            self._table_depth -= 1
+            return
+        if self._table_depth != 1:
+            return
+
+        if tag == "tbody":
+            self._in_tbody = False
+        elif tag == "b":
+            self._in_b = False
+        elif tag == "td" and self._cell is not None:
+            self._row.append(self._cell)
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._in_tbody:
+                self.body_rows.append(["".join(cell["text"]) for cell in self._row])
+            footer = [
+                {"text": "".join(cell["text"]), "b": "".join(cell["b"]) if cell["b"] is not None else None}
+                for cell in self._row if cell["colspan"] == "2"
+            ]
+            if footer:
+                self.footer_rows.append(footer)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is None:
+            return
+        self._cell["text"].append(data)
+        if self._in_b:
+            self._cell["b"].append(data)
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        if not self.found:
+            return None
+        return {"body_rows": self.body_rows, "footer_rows": self.footer_rows}
+
+class HttpTranscriptFetcher:
+    """Backend lấy bảng điểm chỉ bằng HTTP (không cần trình duyệt): post form CAS rồi tải trang/endpoint bảng điểm
+
+    Trang mybk thật render bảng bằng JS nên cần json_url; không có json_url chỉ đọc được trang có bảng
+    render sẵn (ví dụ Mock_mybk), vì vậy Batch_runner/Gpa_service mặc định dùng Selenium.
+    """
+
+    def __init__(self, login_url: str, grades_url: str, json_url: Optional[str] = None,
+                 parse_json: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                 timeout: float = 15.0, pool_size: int = 4, max_retries: int = 2):
+        self.login_url = login_url
+        self.grades_url = grades_url
+        # json_url: endpoint trả dữ liệu bảng điểm; parse_json chuyển phản hồi về dạng snapshot
+        self.json_url = json_url
+        self.parse_json = parse_json or (lambda payload: payload)
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def login(self, username: str, password: str):
+        """Đăng nhập CAS bằng form post, cookie mybk được giữ trong session"""
+        self.session.cookies.clear()
+        response = self.session.get(self.login_url, timeout=self.timeout)
+        response.raise_for_status()
+
+        form = LoginFormParser()
+        form.feed(response.text)
+        if form.action is None:
+            raise ValueError("Không tìm thấy form đăng nhập CAS")
+
+        fields = dict(form.fields, username=username, password=password)
+        response = self.session.post(urljoin(response.url, form.action), data=fields, timeout=self.timeout)
+        response.raise_for_status()
+
+        # Đăng nhập thành công thì CAS chuyển hướng về host của mybk
+        if urlparse(response.url).netloc != urlparse(self.grades_url).netloc or \
+                urlparse(response.url).path == urlparse(self.login_url).path:
+            raise LoginFailed("Đăng nhập CAS thất bại: sai tài khoản hoặc mật khẩu")
+
+    def fetch_snapshot(self, username: str, password: str) -> Dict[str, Any]:
+        """Đăng nhập và trả về snapshot bảng điểm (body_rows/footer_rows)"""
+        self.login(username, password)
+
+        if self.json_url:
+            response = self.session.get(self.json_url, timeout=self.timeout)
+            response.raise_for_status()
+            return self.parse_json(response.json())
+
+        response = self.session.get(self.grades_url, timeout=self.timeout)
+        response.raise_for_status()
+        parser = TableSnapshotParser()
+        parser.feed(response.text)
+        snapshot = parser.snapshot()
+        if snapshot is None:
+            raise ValueError("Trang bảng điểm không chứa bảng lsKetQuaHocTap (cần json_url hoặc backend Selenium)")
+        return snapshot
+
+    def close(self):
+        self.session.close()
+
+def main():
+    """So sánh thời gian scrape của backend HTTP và Selenium trên server mô phỏng"""
+    import argparse
+    import json
+    import time
+    from Agent_core import GpaAnalyzer
+    from Mock_mybk import MockMybkServer
+
+    parser = argparse.ArgumentParser(description="Benchmark backend HTTP và Selenium trên server mô phỏng")
+    parser.add_argument("--data", default="ket_qua.json")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-selenium", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+
+    with MockMybkServer(transcript) as server:
+        backends = {"http": HttpTranscriptFetcher(server.login_url, server.grades_url)}
+        if not args.skip_selenium:
+            backends["selenium"] = None
+
+        for name, fetcher in backends.items():
+            analyzer = GpaAnalyzer(fetcher=fetcher, login_url=server.login_url, grades_url=server.grades_url)
+            start = time.perf_counter()
+            try:
+                analyzer.setup_driver()
+                for _ in range(args.runs):
+                    data = analyzer.login_and_scrape("sinhvien", "matkhau")
+            except Exception as e:
+                print(f"{name}: lỗi {e}")
+                continue
+            finally:
+                analyzer.cleanup()
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {args.runs} lần, {elapsed / args.runs * 1000:.1f} ms/lần, {len(data['bang_diem'])} môn")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import html
+import json
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from typing import List, Optional, Dict, Any
+from urllib.parse import urlparse, parse_qs, urlencode
+
+LOGIN_PATH = "/cas/login"
+SERVICE_PATH = "/app/login/cas"
+HOME_PATH = "/app/"
+GRADES_PATH = "/app/sinh-vien/ket-qua-hoc-tap/bang-diem-hoc-ky"
+GRADES_JSON_PATH = "/app/api/sinh-vien/bang-diem-hoc-ky"
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Central Authentication Service</title></head>
+<body>
+<form method="post" action="{action}">
+  <input type="text" name="username">
+  <input type="password" name="password">
+  <input type="submit" name="submit" value="Đăng nhập">
+</form>
+{error}
+</body></html>"""
+
+GRADES_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Bảng điểm học kỳ</title></head>
+<body>
+<table id="lsKetQuaHocTap"><tbody>{rows}</tbody></table>
+{script}
+</body></html>"""
+
+# Trang thật render bảng bằng JS, render_delay > 0 mô phỏng điều đó để kiểm tra các bước đợi
+DELAYED_RENDER_SCRIPT = """<script>
+setTimeout(function () {{
+  document.querySelector('#lsKetQuaHocTap tbody').innerHTML = {rows};
+}}, {delay_ms});
+</script>"""
+
+def split_semesters(data: Dict[str, Any]) -> List[List[Dict[str, Any]]]:
+    """Chia bang_diem (theo thứ tự) thành các học kỳ tương ứng với total_gpa"""
+    courses = data.get("bang_diem", [])
+    semesters = max(len(data.get("total_gpa", [])), 1)
+    size, extra = divmod(len(courses), semesters)
+    chunks, start = [], 0
+    for i in range(semesters):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(courses[start:end])
+        start = end
+    return chunks
+
+def render_table_rows(data: Dict[str, Any]) -> str:
+    """Render các dòng tbody của #lsKetQuaHocTap giống cấu trúc trang mybk"""
+    parts = []
+    total_gpa = data.get("total_gpa", [])
+    for i, courses in enumerate(split_semesters(data)):
+        for mon in courses:
+            cells = [
+                mon["ma_mon"], mon["ten_mon"], mon["tin_chi"], mon["diem_tp"],
+                mon["diem_so"], mon["diem_chu"], mon["diem_dat"], mon["cap_nhat"]
+            ]
+            parts.append("<tr>" + "".join(
+                f"<td>{html.escape(str(cell)).replace(chr(10), '<br>')}</td>" for cell in cells
+            ) + "</tr>")
+        if i < len(total_gpa):
+            gpa = total_gpa[i]
+            parts.append(
+                f'<tr><td colspan="2">{html.escape(gpa["tin_chi"])}</td>'
+                f'<td colspan="2">Điểm trung bình học kỳ: <b>{gpa["gpa_hk"]}</b></td>'
+                f'<td colspan="2">Điểm trung bình tích lũy: <b>{gpa["gpa_chung"]}</b></td>'
+                f'<td colspan="2"></td></tr>'
+            )
+    return "".join(parts)
+
+def table_snapshot(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Dữ liệu bảng điểm ở dạng snapshot (body_rows/footer_rows) cho endpoint JSON"""
+    body_rows, footer_rows = [], []
+    total_gpa = data.get("total_gpa", [])
+    for i, courses in enumerate(split_semesters(data)):
+        for mon in courses:
+            body_rows.append([str(mon[key]) for key in (
+                "ma_mon", "ten_mon", "tin_chi", "diem_tp", "diem_so", "diem_chu", "diem_dat", "cap_nhat")])
+        if i < len(total_gpa):
+            gpa = total_gpa[i]
+            footer = [
+                {"text": gpa["tin_chi"], "b": None},
+                {"text": f"Điểm trung bình học kỳ: {gpa['gpa_hk']}", "b": str(gpa["gpa_hk"])},
+                {"text": f"Điểm trung bình tích lũy: {gpa['gpa_chung']}", "b": str(gpa["gpa_chung"])},
+                {"text": "", "b": None},
+            ]
+            body_rows.append([cell["text"] for cell in footer])
+            footer_rows.append(footer)
+    return {"body_rows": body_rows, "footer_rows": footer_rows}
+
+class MockMybkServer:
+    """Server HTTP local mô phỏng trang đăng nhập CAS và trang bảng điểm mybk"""
+
+    def __init__(self, transcript: Dict[str, Any], accounts: Optional[Dict[str, str]] = None,
+                 host: str = "127.0.0.1", port: int = 0, render_delay: float = 0.0):
+        self.transcript = transcript
+        self.accounts = accounts if accounts is not None else {"sinhvien": "matkhau"}
+        self.render_delay = render_delay
+        self.tickets: Dict[str, str] = {}
+        self.tgts: Dict[str, str] = {}
+        self.sessions: Dict[str, str] = {}
+        self.request_counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def service_url(self) -> str:
+        return self.base_url + SERVICE_PATH
+
+    @property
+    def login_url(self) -> str:
+        return f"{self.base_url}{LOGIN_PATH}?{urlencode({'service': self.service_url})}"
+
+    @property
+    def grades_url(self) -> str:
+        return self.base_url + GRADES_PATH
+
+    @property
+    def grades_json_url(self) -> str:
+        return self.base_url + GRADES_JSON_PATH
+
+    def start(self) -> "MockMybkServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def expire_sessions(self):
+        """Hủy mọi phiên mybk và ticket CAS (mô phỏng phiên hết hạn)"""
+        with self.lock:
+            self.tgts.clear()
+            self.sessions.clear()
+            self.tickets.clear()
+
+    def __enter__(self) -> "MockMybkServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _cookies(self) -> Dict[str, str]:
+                cookie = SimpleCookie(self.headers.get("Cookie", ""))
+                return {key: morsel.value for key, morsel in cookie.items()}
+
+            def _send(self, status: int, body: str = "", headers: Optional[Dict[str, str]] = None,
+                      content_type: str = "text/html; charset=utf-8"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _redirect(self, location: str, set_cookie: Optional[str] = None):
+                headers = {"Location": location}
+                if set_cookie:
+                    headers["Set-Cookie"] = set_cookie
+                self._send(302, headers=headers)
+
+            def _count(self, path: str):
+                with server.lock:
+                    server.request_counts[path] = server.request_counts.get(path, 0) + 1
+
+            def _issue_ticket(self, username: str) -> str:
+                ticket = "ST-" + secrets.token_hex(8)
+                with server.lock:
+                    server.tickets[ticket] = username
+                return ticket
+
+            def _session_user(self) -> Optional[str]:
+                return server.sessions.get(self._cookies().get("JSESSIONID", ""))
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                self._count(url.path)
+
+                if url.path == LOGIN_PATH:
+                    service = query.get("service", [server.service_url])[0]
+                    username = server.tgts.get(self._cookies().get("CASTGC", ""))
+                    if username:
+                        # CAS: đã có TGT hợp lệ thì chuyển thẳng về service
+                        return self._redirect(f"{service}?ticket={self._issue_ticket(username)}")
+                    return self._send(200, LOGIN_PAGE.format(action=html.escape(self.path), error=""))
+
+                if url.path == SERVICE_PATH:
+                    with server.lock:
+                        username = server.tickets.pop(query.get("ticket", [""])[0], None)
+                        if username:
+                            session = secrets.token_hex(16)
+                            server.sessions[session] = username
+                    if not username:
+                        return self._redirect(server.login_url)
+                    return self._redirect(HOME_PATH, f"JSESSIONID={session}; Path=/app; HttpOnly")
+
+                if url.path == HOME_PATH:
+                    if not self._session_user():
+                        return self._redirect(server.login_url)
+                    return self._send(200, "<html><body><h1>mybk</h1></body></html>")
+
+                if url.path == GRADES_PATH:
+                    if not self._session_user():
+                        return self._redirect(server.login_url)
+                    rows = render_table_rows(server.transcript)
+                    if server.render_delay > 0:
+                        script = DELAYED_RENDER_SCRIPT.format(
+                            rows=json.dumps(rows), delay_ms=int(server.render_delay * 1000))
+                        return self._send(200, GRADES_PAGE.format(rows="", script=script))
+                    return self._send(200, GRADES_PAGE.format(rows=rows, script=""))
+
+                if url.path == GRADES_JSON_PATH:
+                    if not self._session_user():
+                        return self._send(401, json.dumps({"error": "unauthorized"}),
+                                          content_type="application/json")
+                    return self._send(200, json.dumps(table_snapshot(server.transcript), ensure_ascii=False),
+                                      content_type="application/json; charset=utf-8")
+
+                self._send(404, "Not found")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                self._count(url.path)
+                if url.path != LOGIN_PATH:
+                    return self._send(404, "Not found")
+
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                username = form.get("username", [""])[0]
+                password = form.get("password", [""])[0]
+                service = parse_qs(url.query).get("service", [server.service_url])[0]
+
+                if server.accounts.get(username) != password or not username:
+                    return self._send(200, LOGIN_PAGE.format(
+                        action=html.escape(self.path), error="<div id='msg'>Thông tin đăng nhập không đúng</div>"))
+
+                tgt = "TGT-" + secrets.token_hex(16)
+                with server.lock:
+                    server.tgts[tgt] = username
+                self._redirect(f"{service}?ticket={self._issue_ticket(username)}",
+                               f"CASTGC={tgt}; Path=/cas; HttpOnly")
+
+        return Handler
+
+def main():
+    """Chạy server mô phỏng với dữ liệu ket_qua.json"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Server mô phỏng CAS + mybk để kiểm thử")
+    parser.add_argument("--data", default="ket_qua.json")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--render-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+
+    with MockMybkServer(transcript, port=args.port, render_delay=args.render_delay) as server:
+        print(f"Trang đăng nhập: {server.login_url}")
+        print(f"Trang bảng điểm: {server.grades_url}")
+        print(f"Endpoint JSON: {server.grades_json_url}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PipelineCancelled(Exception):
+    """Pipeline bị hủy theo yêu cầu (cancel_event được set)"""
+
+class AsyncPipeline:
+    """Chạy song song scrape và warm-up model/index, ghi JSON ngoài đường găng, đo thời gian từng bước"""
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.timings: Dict[str, float] = {}
+        self.on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.cancel_event: Optional[threading.Event] = None
+
+    def _emit(self, event: Dict[str, Any]):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise PipelineCancelled("Pipeline đã bị hủy")
+
+    def _traced(self, stage: str, func: Callable, *args) -> Any:
+        # Span mở trong thread chạy bước, các span của analyzer bên trong sẽ lồng dưới nó
+        tracer = getattr(self.analyzer, "tracer", None)
+        if tracer is None:
+            return func(*args)
+        with tracer.span(f"pipeline.{stage}"):
+            return func(*args)
+
+    async def _timed(self, stage: str, func: Callable, *args) -> Any:
+        self._check_cancelled()
+        self._emit({"type": "stage", "name": stage, "status": "start"})
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = await asyncio.to_thread(self._traced, stage, func, *args)
+            status = "done"
+            return result
+        except PipelineCancelled:
+            status = "cancelled"
+            raise
+        finally:
+            self.timings[stage] = time.perf_counter() - start
+            logger.info(f"Bước '{stage}' mất {self.timings[stage]:.2f}s")
+            self._emit({"type": "stage", "name": stage, "status": status, "elapsed": self.timings[stage]})
+
+    def _scrape(self, username: str, password: str) -> Dict[str, Any]:
+        self.analyzer.setup_driver()
+        return self.analyzer.login_and_scrape(username, password)
+
+    def _analyze(self, target_gpa: float, credit_fee: Optional[float],
+                 on_event: Optional[Callable[[Dict[str, Any]], None]]):
+        if on_event is None and self.cancel_event is None:
+            return self.analyzer.analyze_gpa(target_gpa, credit_fee)
+        result = None
+        stream = self.analyzer.analyze_gpa_stream(target_gpa, credit_fee)
+        try:
+            for event in stream:
+                # Hủy giữa hai chunk: đóng generator để ngừng đọc stream của model
+                self._check_cancelled()
+                if on_event is not None:
+                    on_event(event)
+                if event["type"] == "result":
+                    result = event["value"]
+        finally:
+            stream.close()
+        return result
+
+    async def run(self, username: str, password: str, target_gpa: float, credit_fee: Optional[float] = None,
+                  on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  cancel_event: Optional[threading.Event] = None) -> Tuple[Any, Dict[str, float]]:
+        """Chạy toàn bộ pipeline, trả về (kết quả phân tích, thời gian từng bước)
+
+        on_event nhận thêm sự kiện {"type": "stage", "name", "status", "elapsed"} cho từng bước.
+        Khi cancel_event được set, pipeline dừng ở ranh giới bước kế tiếp và ném PipelineCancelled.
+        """
+        self.timings = {}
+        self.on_event = on_event
+        self.cancel_event = cancel_event
+        start = time.perf_counter()
+
+        warm_up = asyncio.create_task(self._timed("warm_up", self.analyzer.warm_up))
+        try:
+            data = await self._timed("scrape", self._scrape, username, password)
+        except BaseException:
+            warm_up.cancel()
+            raise
+
+        # Ghi JSON song song với phần còn lại: agent đọc dữ liệu trực tiếp từ data, không đợi file
+        save = asyncio.create_task(self._timed("save_data", self.analyzer.save_data, data))
+
+        try:
+            try:
+                await warm_up
+            except Exception as e:
+                # Warm-up chỉ để tăng tốc, lỗi ở đây không làm hỏng phân tích
+                logger.warning(f"Warm-up thất bại, tiếp tục không warm-up: {e}")
+
+            await self._timed("setup_agent", self.analyzer.setup_agent, data)
+            result = await self._timed("analyze", self._analyze, target_gpa, credit_fee, on_event)
+        except BaseException:
+            # Phân tích lỗi/bị hủy: vẫn đợi ghi file xong để không để lại file ghi dở hay mất lỗi của bước lưu
+            save_error, = await asyncio.gather(save, return_exceptions=True)
+            if isinstance(save_error, BaseException):
+                logger.error(f"Bước save_data cũng thất bại: {save_error}")
+            raise
+        await save
+
+        self.timings["total"] = time.perf_counter() - start
+        return result, self.timings
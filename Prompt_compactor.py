@@ -0,0 +1,86 @@
+import json
+import math
+import re
+from typing import Callable, List, Optional, Dict, Any
+
+import Gpa_engine
+import Semester_records
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (không cần tokenizer): mỗi từ ~1 token/4 ký tự, mỗi dấu câu 1 token"""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in re.findall(r"\w+|[^\w\s]", text))
+
+def count_tokens(text: str, tokenizer: Optional[Callable[[str], List[Any]]] = None) -> int:
+    """Số token của text, dùng tokenizer thật nếu có (hàm encode trả về list token)"""
+    return len(tokenizer(text)) if tokenizer is not None else estimate_tokens(text)
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+def compact_transcript(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Bảng điểm rút gọn: môn đã dedup, bỏ môn 0 tín chỉ, chỉ giữ mã/tên/tín chỉ/điểm 10/điểm 4
+
+    Môn được xếp theo điểm thang 4 tăng dần (môn cần cải thiện lên đầu) để khi cắt theo
+    ngân sách token chỉ mất các môn điểm cao.
+    """
+    courses = sorted(Gpa_engine.graded_courses(data.get("bang_diem", [])),
+                     key=lambda mon: (mon["diem_4"], -mon["tin_chi"], mon["ma_mon"]))
+    return {
+        "mon": [[mon["ma_mon"], mon["ten_mon"], mon["tin_chi"], mon["diem_so"], mon["diem_4"]] for mon in courses],
+        "hoc_ky": Semester_records.semesters_of(data),
+    }
+
+def render_compact(compact: Dict[str, Any], max_courses: Optional[int] = None) -> str:
+    """Dạng text gọn (mỗi dòng một bản ghi, phân cách bằng |) để chèn thẳng vào instructions"""
+    courses = compact["mon"] if max_courses is None else compact["mon"][:max_courses]
+    lines = ["BẢNG ĐIỂM (mã|tên|tc|điểm 10|điểm 4), điểm thấp trước:"]
+    lines += ["|".join(_fmt(value) for value in mon) for mon in courses]
+    omitted = compact["mon"][len(courses):]
+    if omitted:
+        lines.append(f"... và {len(omitted)} môn khác có điểm 4 >= {_fmt(omitted[0][4])}")
+    if compact["hoc_ky"]:
+        lines.append("GPA THEO HỌC KỲ (hk|tc đạt/đk|TCTL|gpa hk|gpa tl):")
+        lines += [
+            f"{hk['hoc_ky']}|{_fmt(hk['tc_dat'])}/{_fmt(hk['tc_dang_ky'])}|{_fmt(hk['tc_tich_luy'])}|"
+            f"{_fmt(hk['gpa_hk'])}|{_fmt(hk['gpa_tich_luy'])}"
+            for hk in compact["hoc_ky"]
+        ]
+    return "\n".join(lines)
+
+def fit_to_budget(compact: Dict[str, Any], budget: int = DEFAULT_TOKEN_BUDGET,
+                  tokenizer: Optional[Callable[[str], List[Any]]] = None) -> str:
+    """Bản text dài nhất (nhiều môn nhất) vừa ngân sách token, bỏ bớt các môn điểm cao nhất"""
+    text = render_compact(compact)
+    if count_tokens(text, tokenizer) <= budget:
+        return text
+    # Số token tăng theo số môn nên tìm nhị phân số môn giữ lại
+    low, high = 0, len(compact["mon"])
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(render_compact(compact, middle), tokenizer) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return render_compact(compact, low)
+
+def prompt_report(sections: Dict[str, str], transcript: str, full_transcript: Dict[str, Any],
+                  budget: int = DEFAULT_TOKEN_BUDGET,
+                  tokenizer: Optional[Callable[[str], List[Any]]] = None) -> Dict[str, Any]:
+    """Số token từng phần của prompt, của bảng điểm rút gọn so với ngân sách và so với JSON đầy đủ"""
+    tokens = {name: count_tokens(text, tokenizer) for name, text in sections.items()}
+    transcript_tokens = count_tokens(transcript, tokenizer)
+    return {
+        "sections": tokens,
+        "total": sum(tokens.values()),
+        "transcript": transcript_tokens,
+        "transcript_budget": budget,
+        "over_budget": transcript_tokens > budget,
+        "full_transcript": count_tokens(json.dumps(full_transcript, ensure_ascii=False), tokenizer),
+        "estimated": tokenizer is None,
+    }
@@ -0,0 +1,159 @@
+from typing import Iterable, List, Optional, Dict, Any
+
+import numpy as np
+
+import Gpa_engine
+
+class RetakeSolver:
+    """Tìm tập môn học lại tốn ít tín chỉ (học phí) nhất để đạt GPA mục tiêu bằng knapsack DP trên mảng NumPy"""
+
+    def __init__(self, courses: List[Dict[str, Any]], achievable: float = Gpa_engine.ACHIEVABLE_GRADE,
+                 achievable_by_course: Optional[Dict[str, float]] = None,
+                 max_retake_score: float = 7.0, credit_fee: Optional[float] = None):
+        # courses: kết quả của Gpa_engine.graded_courses (đã dedup, bỏ môn 0 tín chỉ)
+        self.credit_fee = credit_fee
+        all_credits = np.array([mon["tin_chi"] for mon in courses], dtype=np.int64)
+        all_grades = np.array([mon["diem_4"] for mon in courses], dtype=np.float64)
+        self.total_credits = int(all_credits.sum())
+        self.total_points = float(all_credits @ all_grades)
+
+        achievable_by_course = achievable_by_course or {}
+        ach = np.array([achievable_by_course.get(mon["ma_mon"], achievable) for mon in courses], dtype=np.float64)
+        scores = np.array([mon["diem_so"] if mon["diem_so"] is not None else 0.0 for mon in courses])
+        gain = all_credits * np.clip(ach - all_grades, 0.0, None)
+
+        mask = (gain > 0) & (scores < max_retake_score)
+        self.candidates = [mon for mon, keep in zip(courses, mask) if keep]
+        self.credits = all_credits[mask]
+        self.grades = all_grades[mask]
+        self.achievable = ach[mask]
+        self.gain = gain[mask]
+        self.max_budget = int(self.credits.sum())
+        self._dp, self._keep = self._knapsack(np.ones(len(self.candidates), dtype=bool))
+
+    def _knapsack(self, allowed: np.ndarray):
+        """dp[k] = tổng điểm (thang 4 × tín chỉ) tăng thêm lớn nhất khi học lại tối đa k tín chỉ"""
+        dp = np.zeros(self.max_budget + 1)
+        keep = np.zeros((len(self.candidates), self.max_budget + 1), dtype=bool)
+        for i in np.flatnonzero(allowed):
+            c = int(self.credits[i])
+            with_item = dp[:-c] + self.gain[i] if c else dp + self.gain[i]
+            better = with_item > dp[c:] + 1e-12
+            keep[i, c:] = better
+            dp[c:] = np.where(better, with_item, dp[c:])
+        return dp, keep
+
+    def _need(self, target_gpa: float) -> float:
+        return target_gpa * self.total_credits - self.total_points
+
+    def gpa_for_gain(self, gain: float) -> float:
+        return (self.total_points + gain) / self.total_credits if self.total_credits else 0.0
+
+    def min_credits(self, target_gpa: float) -> Optional[int]:
+        """Số tín chỉ học lại ít nhất để đạt mục tiêu, None nếu không thể"""
+        return self.sweep([target_gpa])[0]
+
+    def sweep(self, targets: Iterable[float]) -> List[Optional[int]]:
+        """Số tín chỉ học lại ít nhất cho nhiều mục tiêu cùng lúc (dp đơn điệu nên chỉ cần searchsorted)"""
+        needs = np.asarray(list(targets), dtype=np.float64) * self.total_credits - self.total_points
+        budgets = np.searchsorted(self._dp, needs - 1e-9, side="left")
+        budgets[needs <= 0] = 0
+        return [int(b) if b <= self.max_budget else None for b in budgets]
+
+    def _reconstruct(self, dp: np.ndarray, keep: np.ndarray, budget: int) -> List[int]:
+        chosen = []
+        k = budget
+        for i in range(len(self.candidates) - 1, -1, -1):
+            if keep[i, k]:
+                chosen.append(i)
+                k -= int(self.credits[i])
+        return chosen[::-1]
+
+    def _plan(self, chosen: List[int], target_gpa: float) -> Dict[str, Any]:
+        chosen = sorted(chosen, key=lambda i: self.gain[i], reverse=True)
+        credits = int(self.credits[chosen].sum()) if chosen else 0
+        gain = float(self.gain[chosen].sum()) if chosen else 0.0
+        gpa = self.gpa_for_gain(gain)
+        return {
+            "mon": [
+                dict(self.candidates[i], diem_du_kien=float(self.achievable[i]),
+                     gpa_tang_them=float(self.gain[i]) / self.total_credits)
+                for i in chosen
+            ],
+            "tong_tin_chi": credits,
+            "chi_phi": credits * self.credit_fee if self.credit_fee else None,
+            "gpa_du_kien": round(gpa, 4),
+            "dat_muc_tieu": gpa >= target_gpa - 1e-9,
+        }
+
+    def solve(self, target_gpa: float, max_plans: int = 3) -> List[Dict[str, Any]]:
+        """Các phương án học lại xếp theo chi phí tăng dần; nếu không đạt được thì trả về phương án tăng GPA nhiều nhất"""
+        budget = self.min_credits(target_gpa)
+        if budget is None:
+            return [self._plan(self._reconstruct(self._dp, self._keep, self.max_budget), target_gpa)]
+
+        best = self._reconstruct(self._dp, self._keep, budget)
+        plans = [self._plan(best, target_gpa)]
+        seen = {tuple(best)}
+        need = self._need(target_gpa)
+
+        # Phương án thay thế: bỏ lần lượt một trong max_plans môn tăng GPA ít nhất của phương án tốt nhất (dễ thay
+        # bằng môn khác cùng chi phí) rồi giải lại; mỗi lần giải là một knapsack đầy đủ nên không thử hết mọi môn
+        for excluded in sorted(best, key=lambda i: self.gain[i])[:max_plans]:
+            allowed = np.ones(len(self.candidates), dtype=bool)
+            allowed[excluded] = False
+            dp, keep = self._knapsack(allowed)
+            alt_budget = int(np.searchsorted(dp, need - 1e-9, side="left")) if need > 0 else 0
+            if alt_budget > self.max_budget:
+                continue
+            chosen = self._reconstruct(dp, keep, alt_budget)
+            if tuple(chosen) not in seen:
+                seen.add(tuple(chosen))
+                plans.append(self._plan(chosen, target_gpa))
+
+        plans.sort(key=lambda plan: (plan["tong_tin_chi"], -plan["gpa_du_kien"]))
+        return plans[:max_plans]
+
+def improvement_label(diem_4: float, diem_du_kien: float) -> str:
+    """Đánh giá khả năng cải thiện theo khoảng cách điểm thang 4"""
+    gap = diem_du_kien - diem_4
+    if gap <= 1.0:
+        return "Dễ"
+    if gap <= 2.0:
+        return "Trung bình"
+    return "Khó"
+
+def plan_to_hoc_phan_uu_tien(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Chuyển một phương án thành danh sách đúng dạng HocPhanUuTien"""
+    result = []
+    for rank, mon in enumerate(plan["mon"]):
+        result.append({
+            "ma_mon": mon["ma_mon"],
+            "ten_mon": mon["ten_mon"],
+            "tin_chi": mon["tin_chi"],
+            "diem_hien_tai": mon["diem_so"],
+            "uu_tien_vi": f"Học lại đạt {mon['diem_du_kien']:.1f}/4 tăng GPA thêm {mon['gpa_tang_them']:.3f}",
+            "kha_nang_cai_thien": improvement_label(mon["diem_4"], mon["diem_du_kien"]),
+            "thoi_gian_de_xuat": "Học kỳ tới" if rank < 2 else "Trong năm",
+        })
+    return result
+
+def plan_to_mon_can_cai_thien(plan: Dict[str, Any], courses: List[Dict[str, Any]],
+                              threshold: float = 6.0,
+                              achievable: float = Gpa_engine.ACHIEVABLE_GRADE) -> List[Dict[str, Any]]:
+    """Các môn trong phương án (xếp trước) cùng các môn dưới ngưỡng còn lại, đúng dạng MonCanCaiThien"""
+    ranked = Gpa_engine.courses_to_improve(courses, threshold, achievable)
+    by_code = {mon["ma_mon"]: mon for mon in ranked}
+    result = []
+    for mon in plan["mon"]:
+        entry = by_code.pop(mon["ma_mon"], None) or {
+            "ma_mon": mon["ma_mon"],
+            "ten_mon": mon["ten_mon"],
+            "diem_so": mon["diem_so"],
+            "tin_chi": mon["tin_chi"],
+            "diem_chu": mon["diem_chu"],
+            "ly_do": f"Điểm {mon['diem_chu']} ({mon['diem_so']}) thuộc phương án học lại tối ưu",
+            "muc_do_uu_tien": Gpa_engine.priority_label(mon["diem_so"]),
+        }
+        result.append(entry)
+    return result + list(by_code.values())
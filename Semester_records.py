@@ -0,0 +1,101 @@
+import json
+import re
+from typing import Iterable, List, Optional, Dict, Any, Tuple
+
+# Footer của mybk, ví dụ "Số tín chỉ đạt/đăng ký học kỳ: 18/21 - Số TCTL chung: 64"
+FOOTER_CREDITS_RE = re.compile(r"(\d+)\s*/\s*(\d+).*?TCTL[^\d]*(\d+)", re.IGNORECASE)
+
+# Các cột của chuỗi thời gian học kỳ (export dạng cột)
+SERIES_FIELDS = ("hoc_ky", "tc_dat", "tc_dang_ky", "tc_tich_luy", "gpa_hk", "gpa_tich_luy", "so_mon")
+
+def parse_footer_credits(text: str) -> Optional[Tuple[int, int, int]]:
+    """(tín chỉ đạt, tín chỉ đăng ký, tín chỉ tích lũy) từ câu footer, None nếu không đúng dạng"""
+    match = FOOTER_CREDITS_RE.search(text or "")
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+def is_footer_row(cells: List[str]) -> bool:
+    """Dòng tổng kết học kỳ nằm xen giữa các dòng môn học trong tbody"""
+    return 0 < len(cells) < 8 and parse_footer_credits(cells[0]) is not None
+
+def semester_record(hoc_ky: int, footer: Optional[Dict[str, Any]], mon: List[str]) -> Dict[str, Any]:
+    """Bản ghi học kỳ có kiểu rõ ràng từ footer dạng {"tin_chi", "gpa_hk", "gpa_chung"}"""
+    credits = parse_footer_credits(footer["tin_chi"]) if footer else None
+    return {
+        "hoc_ky": hoc_ky,
+        "tc_dat": credits[0] if credits else None,
+        "tc_dang_ky": credits[1] if credits else None,
+        "tc_tich_luy": credits[2] if credits else None,
+        "gpa_hk": footer["gpa_hk"] if footer else None,
+        "gpa_tich_luy": footer["gpa_chung"] if footer else None,
+        "mon": mon,
+    }
+
+class SemesterBuilder:
+    """Gán học kỳ cho từng dòng môn học khi duyệt bảng điểm theo thứ tự, rồi ghép với footer"""
+
+    def __init__(self):
+        self._groups: List[List[Dict[str, Any]]] = [[]]
+
+    def add_course(self, mon_hoc: Dict[str, Any]):
+        self._groups[-1].append(mon_hoc)
+
+    def end_semester(self):
+        """Gặp dòng footer: các môn tiếp theo thuộc học kỳ sau"""
+        self._groups.append([])
+
+    def build(self, footers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Ghi trường hoc_ky vào từng môn và trả về các bản ghi học kỳ
+
+        Nếu số footer xen trong tbody không khớp với số footer đọc được (bố cục trang khác),
+        môn học không được gán học kỳ thay vì gán sai.
+        """
+        closed, current = self._groups[:-1], self._groups[-1]
+        if len(closed) != len(footers):
+            for group in self._groups:
+                for mon_hoc in group:
+                    mon_hoc["hoc_ky"] = None
+            return [semester_record(i, footer, []) for i, footer in enumerate(footers, start=1)]
+
+        records = []
+        for i, group in enumerate(closed + ([current] if current else []), start=1):
+            for mon_hoc in group:
+                mon_hoc["hoc_ky"] = i
+            records.append(semester_record(i, footers[i - 1] if i <= len(footers) else None,
+                                           [mon_hoc["ma_mon"] for mon_hoc in group]))
+        return records
+
+def records_from_total_gpa(total_gpa: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Bản ghi học kỳ cho dữ liệu cũ chỉ có total_gpa (không liên kết được với môn học)"""
+    return [semester_record(i, footer, []) for i, footer in enumerate(total_gpa, start=1)]
+
+def semesters_of(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Bản ghi học kỳ của bảng điểm, parse từ total_gpa nếu file được lưu trước khi có trường hoc_ky"""
+    if "hoc_ky" in data:
+        return data["hoc_ky"]
+    return records_from_total_gpa(data.get("total_gpa", []))
+
+def to_columns(records: Iterable[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Chuỗi thời gian dạng cột (mỗi trường một list), không cần parse chuỗi khi đọc lại"""
+    columns: Dict[str, List[Any]] = {field: [] for field in SERIES_FIELDS}
+    for record in records:
+        for field in SERIES_FIELDS[:-1]:
+            columns[field].append(record[field])
+        columns["so_mon"].append(len(record["mon"]))
+    return columns
+
+def save_columns(records: Iterable[Dict[str, Any]], path: str):
+    """Ghi chuỗi thời gian dạng cột ra JSON gọn"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_columns(records), f, ensure_ascii=False, separators=(",", ":"))
+
+def gpa_trend(columns: Dict[str, List[Any]], field: str = "gpa_hk") -> Optional[float]:
+    """Độ dốc (thay đổi GPA mỗi học kỳ) theo bình phương tối thiểu, None nếu ít hơn 2 học kỳ có GPA"""
+    points = [(x, y) for x, y in zip(columns["hoc_ky"], columns[field]) if y is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
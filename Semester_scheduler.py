@@ -0,0 +1,282 @@
+import time
+from typing import List, Optional, Dict, Any, Tuple
+
+DEFAULT_MAX_CREDITS = 24
+
+def build_items(retake_plan: Optional[Dict[str, Any]], remaining: Optional[Dict[str, Any]],
+                curriculum: Optional[Dict[str, Any]] = None, expected_grade: float = 2.5,
+                graded: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """Các học phần cần xếp lịch: môn học lại (tùy chọn, có mức tăng điểm) và môn còn thiếu theo chương trình (bắt buộc)
+
+    gain là số điểm (thang 4 × tín chỉ) tăng thêm cho môn đã tính trong GPA; môn mới (moi=True)
+    được cộng vào GPA với điểm dự kiến expected_grade. graded: ma_mon -> điểm thang 4 của các môn
+    đang tính trong GPA (Gpa_engine.graded_courses); môn rớt điểm 0 đã bị bỏ khỏi GPA nên là môn mới.
+    """
+    graded = graded or {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for mon in (retake_plan or {}).get("mon", []):
+        items[mon["ma_mon"]] = {
+            "ma_mon": mon["ma_mon"], "ten_mon": mon["ten_mon"], "tin_chi": mon["tin_chi"],
+            "loai": "hoc_lai", "bat_buoc": False, "tien_quyet": [],
+            "gain": (mon["diem_du_kien"] - mon["diem_4"]) * mon["tin_chi"], "hoc_ky_ctdt": None, "moi": False,
+        }
+    if remaining:
+        for course in remaining["bat_buoc"]:
+            moi = course["ma_mon"] not in graded
+            gain = 0.0 if moi else max(expected_grade - graded[course["ma_mon"]], 0.0) * course["tin_chi"]
+            item = items.setdefault(course["ma_mon"], {
+                "ma_mon": course["ma_mon"], "ten_mon": course["ten_mon"], "tin_chi": course["tin_chi"],
+                "loai": "bat_buoc", "gain": gain, "moi": moi,
+            })
+            # Môn bắt buộc bị rớt cũng nằm trong phương án học lại: bắt buộc, giữ mức tăng điểm
+            item.update(bat_buoc=True, tien_quyet=course["tien_quyet"], hoc_ky_ctdt=course["hoc_ky"])
+
+        by_code = {course["ma_mon"]: course for course in (curriculum or {}).get("courses", [])}
+        for group in remaining["tu_chon"]:
+            missing = (group["tin_chi_can"] or 0) - group["tin_chi_da_dat"]
+            for code in group["lua_chon"]:
+                if missing <= 0:
+                    break
+                course = by_code.get(code)
+                if course is None or code in items:
+                    continue
+                items[code] = {
+                    "ma_mon": code, "ten_mon": course["ten_mon"], "tin_chi": course["tin_chi"],
+                    "loai": "tu_chon", "bat_buoc": True, "tien_quyet": course["tien_quyet"],
+                    "gain": 0.0, "hoc_ky_ctdt": course["hoc_ky"], "moi": True,
+                }
+                missing -= course["tin_chi"]
+    return list(items.values())
+
+class SemesterScheduler:
+    """Xếp môn học lại và môn còn thiếu vào các học kỳ còn lại bằng branch-and-bound có memo
+
+    Thứ tự ưu tiên của lời giải: xếp được nhiều tín chỉ bắt buộc nhất, tăng điểm (GPA) nhiều nhất,
+    học phí thấp nhất, rồi học càng sớm càng tốt. Tìm kiếm dừng khi hết time_limit/max_nodes và trả về
+    lời giải tốt nhất đã tìm được (luôn có lời giải tham lam ban đầu).
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], remaining_semesters: int,
+                 max_credits: int = DEFAULT_MAX_CREDITS, credit_fee: Optional[float] = None,
+                 passed: Optional[set] = None, time_limit: float = 0.8, max_nodes: int = 200000):
+        self.semesters = max(int(remaining_semesters), 0)
+        self.max_credits = max_credits
+        self.credit_fee = credit_fee or 0.0
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        passed = passed or set()
+
+        # Môn có tiên quyết chưa đạt mà không nằm trong danh sách cần xếp (hoặc chính nó bị chặn) thì không thể xếp;
+        # lặp đến điểm bất động để chặn cả chuỗi môn phía sau
+        codes = {item["ma_mon"] for item in items}
+        blocked: set = set()
+        while True:
+            newly = {
+                item["ma_mon"] for item in items
+                if item["ma_mon"] not in blocked and any(
+                    code not in passed and (code not in codes or code in blocked) for code in item["tien_quyet"])
+            }
+            if not newly:
+                break
+            blocked |= newly
+        self.blocked = [item for item in items if item["ma_mon"] in blocked]
+        schedulable = [item for item in items if item["ma_mon"] not in blocked]
+        ordered = self._order(schedulable, passed)
+
+        # Độ sâu chuỗi tiên quyết = học kỳ sớm nhất có thể; môn sâu hơn số kỳ còn lại thì không thể xếp
+        depth: Dict[str, int] = {}
+        for item in ordered:
+            depth[item["ma_mon"]] = max((depth[code] + 1 for code in item["tien_quyet"] if code in depth), default=0)
+        self.blocked += [item for item in ordered if depth[item["ma_mon"]] >= self.semesters]
+        self.items = [item for item in ordered if depth[item["ma_mon"]] < self.semesters]
+        self.depth = [depth[item["ma_mon"]] for item in self.items]
+
+        index = {item["ma_mon"]: i for i, item in enumerate(self.items)}
+        self.prereqs = [
+            tuple(index[code] for code in item["tien_quyet"] if code in index and index[code] < i)
+            for i, item in enumerate(self.items)
+        ]
+        # Các môn còn là tiên quyết của môn phía sau: vị trí của chúng là một phần của trạng thái memo
+        self._needed_after = [
+            tuple(sorted({p for j in range(i, len(self.items)) for p in self.prereqs[j] if p < i}))
+            for i in range(len(self.items) + 1)
+        ]
+        self._suffix_mandatory = self._suffix(lambda item: item["tin_chi"] if item["bat_buoc"] else 0)
+        self._suffix_gain = self._suffix(lambda item: item["gain"])
+        self.nodes = 0
+        self.complete = False
+
+    def _order(self, items: List[Dict[str, Any]], passed: set) -> List[Dict[str, Any]]:
+        """Thứ tự topo theo tiên quyết; cùng mức thì môn bắt buộc, học kỳ CTĐT sớm, nhiều tín chỉ xếp trước"""
+        by_code = {item["ma_mon"]: item for item in items}
+        key = lambda item: (not item["bat_buoc"], item["hoc_ky_ctdt"] or 99, -item["tin_chi"], item["ma_mon"])
+        ordered, state = [], {}
+
+        def visit(item):
+            if state.get(item["ma_mon"]) is not None:
+                return
+            state[item["ma_mon"]] = "visiting"
+            for code in item["tien_quyet"]:
+                if code in by_code and code not in passed:
+                    visit(by_code[code])
+            state[item["ma_mon"]] = "done"
+            ordered.append(item)
+
+        for item in sorted(items, key=key):
+            visit(item)
+        return ordered
+
+    def _suffix(self, value) -> List[float]:
+        suffix = [0.0] * (len(self.items) + 1)
+        for i in range(len(self.items) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + value(self.items[i])
+        return suffix
+
+    def _score(self, placement: List[Optional[int]]) -> Tuple[float, float, float, float]:
+        mandatory = gain = fee = earliness = 0.0
+        for item, semester in zip(self.items, placement):
+            if semester is None:
+                continue
+            mandatory += item["tin_chi"] if item["bat_buoc"] else 0
+            gain += item["gain"]
+            fee += item["tin_chi"] * self.credit_fee
+            earliness += item["tin_chi"] * semester
+        return round(mandatory, 6), round(gain, 6), -round(fee, 6), -earliness
+
+    def _earliest(self, i: int, placement: List[Optional[int]]) -> Optional[int]:
+        """Học kỳ sớm nhất có thể xếp môn i (sau mọi môn tiên quyết), None nếu tiên quyết chưa được xếp"""
+        earliest = self.depth[i]
+        for p in self.prereqs[i]:
+            if placement[p] is None:
+                return None
+            earliest = max(earliest, placement[p] + 1)
+        return earliest
+
+    def _greedy(self) -> List[Optional[int]]:
+        caps = [self.max_credits] * self.semesters
+        placement: List[Optional[int]] = []
+        for i, item in enumerate(self.items):
+            placement.append(None)
+            earliest = self._earliest(i, placement)
+            if earliest is None:
+                continue
+            for semester in range(earliest, self.semesters):
+                if caps[semester] >= item["tin_chi"]:
+                    caps[semester] -= item["tin_chi"]
+                    placement[i] = semester
+                    break
+        return placement
+
+    def solve(self) -> List[Optional[int]]:
+        """Học kỳ (0 = học kỳ tới) của từng môn trong self.items, None = không xếp"""
+        best = self._greedy()
+        best_score = self._score(best)
+        deadline = time.perf_counter() + self.time_limit
+        memo: Dict[Any, Tuple] = {}
+        placement: List[Optional[int]] = []
+        caps = [self.max_credits] * self.semesters
+        self.nodes = 0
+        self.complete = True
+
+        def search(i: int, mandatory: float, gain: float, fee: float, earliness: float):
+            nonlocal best, best_score
+            self.nodes += 1
+            if self.nodes > self.max_nodes or (self.nodes % 1024 == 0 and time.perf_counter() > deadline):
+                self.complete = False
+                raise TimeoutError
+            if i == len(self.items):
+                score = (round(mandatory, 6), round(gain, 6), -round(fee, 6), -earliness)
+                if score > best_score:
+                    best, best_score = list(placement), score
+                return
+
+            # Cận trên: mọi môn còn lại được xếp mà không tốn thêm học phí/độ trễ
+            bound = (round(mandatory + self._suffix_mandatory[i], 6), round(gain + self._suffix_gain[i], 6),
+                     -round(fee, 6), -earliness)
+            if bound <= best_score:
+                return
+            # Cùng các tín chỉ còn trống và vị trí các môn tiên quyết còn cần: phần còn lại giống nhau
+            state = (i, tuple(caps), tuple(placement[p] for p in self._needed_after[i]))
+            prefix = (mandatory, gain, -fee, -earliness)
+            seen = memo.get(state)
+            if seen is not None and seen >= prefix:
+                return
+            memo[state] = prefix
+
+            item = self.items[i]
+            earliest = self._earliest(i, placement)
+            if earliest is not None:
+                for semester in range(earliest, self.semesters):
+                    if caps[semester] < item["tin_chi"]:
+                        continue
+                    caps[semester] -= item["tin_chi"]
+                    placement.append(semester)
+                    search(i + 1, mandatory + (item["tin_chi"] if item["bat_buoc"] else 0), gain + item["gain"],
+                           fee + item["tin_chi"] * self.credit_fee, earliness + item["tin_chi"] * semester)
+                    placement.pop()
+                    caps[semester] += item["tin_chi"]
+            placement.append(None)
+            search(i + 1, mandatory, gain, fee, earliness)
+            placement.pop()
+
+        try:
+            search(0, 0.0, 0.0, 0.0, 0.0)
+        except TimeoutError:
+            pass
+        return best
+
+    def schedule(self, total_points: float, total_credits: int, expected_grade: float,
+                 first_semester: int = 1) -> Dict[str, Any]:
+        """Lịch học theo từng học kỳ kèm học phí và GPA tích lũy dự kiến sau mỗi học kỳ"""
+        start = time.perf_counter()
+        placement = self.solve()
+        elapsed = time.perf_counter() - start
+
+        points, credits = total_points, total_credits
+        hoc_ky, total_fee = [], 0.0
+        for semester in range(self.semesters):
+            chosen = [item for item, s in zip(self.items, placement) if s == semester]
+            for item in chosen:
+                points += item["gain"]
+                if item["moi"]:
+                    # Môn mới: tính vào GPA với điểm dự kiến
+                    points += expected_grade * item["tin_chi"]
+                    credits += item["tin_chi"]
+            tin_chi = sum(item["tin_chi"] for item in chosen)
+            fee = tin_chi * self.credit_fee
+            total_fee += fee
+            hoc_ky.append({
+                "hoc_ky": first_semester + semester,
+                "mon": [{"ma_mon": item["ma_mon"], "ten_mon": item["ten_mon"], "tin_chi": item["tin_chi"],
+                         "loai": item["loai"]} for item in chosen],
+                "tin_chi": tin_chi,
+                "chi_phi": fee if self.credit_fee else None,
+                "gpa_du_kien": round(points / credits, 2) if credits else None,
+            })
+
+        unscheduled = [item for item, s in zip(self.items, placement) if s is None] + self.blocked
+        return {
+            "hoc_ky": hoc_ky,
+            "khong_xep_duoc": [{"ma_mon": item["ma_mon"], "ten_mon": item["ten_mon"], "tin_chi": item["tin_chi"],
+                                "loai": item["loai"]} for item in unscheduled],
+            "tong_chi_phi": total_fee if self.credit_fee else None,
+            "gpa_cuoi_khoa": round(points / credits, 2) if credits else None,
+            "toi_uu": self.complete,
+            "so_nut": self.nodes,
+            "thoi_gian": round(elapsed, 4),
+        }
+
+def schedule_steps(lich_hoc: Dict[str, Any]) -> List[str]:
+    """Các bước thực hiện (cac_buoc_thuc_hien) sinh từ lịch học"""
+    steps = []
+    for hoc_ky in lich_hoc["hoc_ky"]:
+        if not hoc_ky["mon"]:
+            continue
+        mon = ", ".join(f"{m['ma_mon']}{' (học lại)' if m['loai'] == 'hoc_lai' else ''}" for m in hoc_ky["mon"])
+        chi_phi = f", học phí {hoc_ky['chi_phi']:,.0f} VNĐ" if hoc_ky["chi_phi"] else ""
+        steps.append(f"Học kỳ {hoc_ky['hoc_ky']}: {mon} ({hoc_ky['tin_chi']} tín chỉ{chi_phi}), "
+                     f"GPA tích lũy dự kiến {hoc_ky['gpa_du_kien']}")
+    if lich_hoc["khong_xep_duoc"]:
+        steps.append("Chưa xếp được trong số học kỳ còn lại: "
+                     + ", ".join(m["ma_mon"] for m in lich_hoc["khong_xep_duoc"]))
+    return steps
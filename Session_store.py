@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Biến môi trường chứa khóa Fernet (nếu không có sẽ tạo file khóa ngoài thư mục lưu phiên)
+SESSION_KEY_ENV = "AAGENT_SESSION_KEY"
+# File khóa mặc định: nằm ngoài thư mục phiên để ai đọc được phiên cũng không có sẵn khóa giải mã
+DEFAULT_KEY_FILE = os.path.join(os.path.expanduser("~"), ".config", "aagent", "session.key")
+
+class SessionStore:
+    """Lưu cookie mybk/CAS xuống đĩa (mã hóa Fernet) để dùng lại phiên đăng nhập giữa các lần chạy"""
+
+    def __init__(self, directory: str = ".sessions", key: Optional[bytes] = None, max_age: float = 8 * 3600,
+                 key_file: str = DEFAULT_KEY_FILE):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError as e:
+            raise ImportError("SessionStore cần thư viện cryptography: pip install cryptography") from e
+
+        self.directory = directory
+        self.max_age = max_age
+        self.key_file = key_file
+        os.makedirs(self.directory, exist_ok=True)
+        self._fernet = Fernet(key or self._load_or_create_key())
+
+    def _load_or_create_key(self) -> bytes:
+        """Lấy khóa từ biến môi trường hoặc file khóa ngoài thư mục phiên (tạo mới với quyền 600 nếu chưa có)"""
+        from cryptography.fernet import Fernet
+
+        env_key = os.environ.get(SESSION_KEY_ENV)
+        if env_key:
+            return env_key.encode()
+
+        directory = os.path.realpath(self.directory)
+        key_file = os.path.realpath(self.key_file)
+        if os.path.commonpath([directory, key_file]) == directory:
+            raise ValueError(f"File khóa {self.key_file} không được nằm trong thư mục phiên {self.directory}")
+
+        # Bản cũ để khóa cạnh các phiên đã mã hóa: bỏ đi, các phiên cũ sẽ không giải mã được và bị xóa khi đọc
+        legacy_key = os.path.join(self.directory, "session.key")
+        if os.path.exists(legacy_key):
+            os.remove(legacy_key)
+            logger.warning(f"Đã xóa khóa cũ nằm trong thư mục phiên ({legacy_key}), cần đăng nhập lại")
+
+        if os.path.exists(key_file):
+            if os.name == "posix" and os.stat(key_file).st_mode & 0o077:
+                logger.warning(f"File khóa {key_file} cho phép người khác đọc, đặt lại quyền 600")
+                os.chmod(key_file, 0o600)
+            with open(key_file, "rb") as f:
+                return f.read().strip()
+
+        os.makedirs(os.path.dirname(key_file), mode=0o700, exist_ok=True)
+        key = Fernet.generate_key()
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        logger.info(f"Đã tạo khóa mã hóa phiên mới tại {key_file}")
+        return key
+
+    def _path(self, username: str) -> str:
+        digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}.session")
+
+    def save(self, username: str, cookies: List[Dict[str, Any]]):
+        """Mã hóa và lưu danh sách cookie (định dạng Selenium) của một tài khoản"""
+        payload = json.dumps({"saved_at": time.time(), "cookies": cookies}).encode("utf-8")
+        path = self._path(username)
+        tmp_path = path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._fernet.encrypt(payload))
+        os.replace(tmp_path, path)
+        logger.info(f"Đã lưu phiên đăng nhập ({len(cookies)} cookie)")
+
+    def load(self, username: str) -> Optional[List[Dict[str, Any]]]:
+        """Đọc cookie còn hạn của tài khoản, trả về None nếu không có phiên hợp lệ"""
+        from cryptography.fernet import InvalidToken
+
+        path = self._path(username)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                payload = json.loads(self._fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError) as e:
+            logger.warning(f"Không đọc được phiên đã lưu, bỏ qua: {e}")
+            self.clear(username)
+            return None
+
+        now = time.time()
+        if now - payload.get("saved_at", 0) > self.max_age:
+            logger.info("Phiên đăng nhập đã lưu quá hạn")
+            self.clear(username)
+            return None
+
+        cookies = [c for c in payload.get("cookies", []) if c.get("expiry") is None or c["expiry"] > now]
+        return cookies or None
+
+    def clear(self, username: str):
+        """Xóa phiên đã lưu của tài khoản"""
+        path = self._path(username)
+        if os.path.exists(path):
+            os.remove(path)
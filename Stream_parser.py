@@ -0,0 +1,106 @@
+import json
+from typing import Any, Iterator, List, Optional, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+class IncrementalJsonFields:
+    """Đọc dần một object JSON đang được stream, trả về từng trường cấp 1 ngay khi giá trị của nó hoàn tất"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Thêm một đoạn text, trả về các (tên trường, giá trị) vừa hoàn tất"""
+        self.buffer += chunk
+        return list(self._scan())
+
+    def _scan(self) -> Iterator[Tuple[str, Any]]:
+        while self._pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self._pos]
+            i = self._pos
+            self._pos += 1
+
+            if not self._started:
+                # Bỏ qua phần trước JSON (thẻ <think>...</think>, ```json ...)
+                if ch == "<":
+                    rest = self.buffer[i:]
+                    if THINK_OPEN.startswith(rest):
+                        self._pos = i
+                        return
+                    if rest.startswith(THINK_OPEN):
+                        close = self.buffer.find(THINK_CLOSE, i)
+                        if close < 0:
+                            self._pos = i
+                            return
+                        self._pos = close + len(THINK_CLOSE)
+                    continue
+                if ch == "{":
+                    self._start = i
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(self.buffer[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+                continue
+
+            if self._depth == 1 and self._key is not None and self._value_start is None and ch == ":":
+                self._value_start = i + 1
+                continue
+
+            if ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+
+            if (self._depth == 1 and ch == ",") or self._depth == 0:
+                field = self._finish_value(i)
+                if field is not None:
+                    yield field
+                if self._depth == 0:
+                    self.done = True
+
+    def _finish_value(self, end: int) -> Optional[Tuple[str, Any]]:
+        if self._key is None or self._value_start is None:
+            return None
+        key, raw = self._key, self.buffer[self._value_start:end].strip()
+        self._key = None
+        self._value_start = None
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return None
+        self.fields[key] = value
+        return key, value
+
+    def result(self) -> Optional[dict]:
+        """Toàn bộ object khi đã stream xong"""
+        if not self.done:
+            return None
+        return json.loads(self.buffer[self._start:self._pos])
@@ -0,0 +1,243 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterator, List, Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+class Tracer:
+    """Thu thập span thời gian (lồng nhau theo thread), bộ đếm và giá trị đo của một lần chạy
+
+    Kết quả ghi ra file JSON dạng Chrome trace (mở được bằng chrome://tracing hoặc Perfetto) kèm
+    bộ đếm và thống kê theo tên span, hoặc gửi từng span cho on_metric. Tracer(enabled=False) không
+    ghi gì và gần như không tốn chi phí, là mặc định của GpaAnalyzer.
+    """
+
+    def __init__(self, trace_file: Optional[str] = None, on_metric: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 profile: bool = False, trace_memory: bool = False, enabled: bool = True, top_n: int = 30):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.on_metric = on_metric
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.top_n = top_n
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self.values: Dict[str, Any] = {}
+        self.report: Dict[str, Any] = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiler = None
+
+    def _stack(self) -> List[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _emit(self, metric: Dict[str, Any]):
+        if self.on_metric is not None:
+            try:
+                self.on_metric(metric)
+            except Exception as e:
+                logger.warning(f"Lỗi trong callback metric: {e}")
+
+    def _add(self, name: str, start: float, duration: float, attrs: Dict[str, Any]):
+        stack = self._stack()
+        span = {
+            "name": name,
+            "start": start - self._origin,
+            "duration": duration,
+            "parent": stack[-1] if stack else None,
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        }
+        with self._lock:
+            self.spans.append(span)
+        self._emit({"type": "span", **span})
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Dict[str, Any]]:
+        """Đo thời gian một khối lệnh; dict trả về dùng để gắn thêm thuộc tính trong khi chạy"""
+        if not self.enabled:
+            yield attrs
+            return
+        stack = self._stack()
+        memory = None
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        stack.append(name)
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            duration = time.perf_counter() - start
+            if memory is not None:
+                import tracemalloc
+                attrs["mem_delta"] = tracemalloc.get_traced_memory()[0] - memory
+            self._add(name, start, duration, attrs)
+
+    def add_span(self, name: str, duration: float, **attrs):
+        """Ghi một span có thời lượng đo ở nơi khác (ví dụ thời gian prefill/decode do Ollama báo về)"""
+        if self.enabled:
+            self._add(name, time.perf_counter() - duration, duration, attrs)
+
+    def count(self, name: str, value: float = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_value(self, name: str, value: Any):
+        if self.enabled:
+            with self._lock:
+                self.values[name] = value
+            self._emit({"type": "value", "name": name, "value": value})
+
+    def instrument_driver(self, driver):
+        """Đếm số lần gọi WebDriver (mỗi lệnh là một round-trip tới trình duyệt) và tổng thời gian chờ"""
+        if not self.enabled or getattr(driver, "_traced_execute", False):
+            return driver
+        execute = driver.execute
+
+        def traced_execute(driver_command, params=None):
+            start = time.perf_counter()
+            try:
+                return execute(driver_command, params)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.count("webdriver.round_trips")
+                self.count(f"webdriver.{driver_command}")
+                self.count("webdriver.seconds", elapsed)
+
+        driver.execute = traced_execute
+        driver._traced_execute = True
+        return driver
+
+    def instrument_session(self, session):
+        """Đếm số request HTTP của một requests.Session (backend HTTP)"""
+        if not self.enabled or getattr(session, "_traced", False):
+            return session
+
+        def on_response(response, *args, **kwargs):
+            self.count("http.round_trips")
+            self.count("http.seconds", response.elapsed.total_seconds())
+            self.count("http.bytes", len(response.content or b""))
+
+        session.hooks.setdefault("response", []).append(on_response)
+        session._traced = True
+        return session
+
+    def start(self) -> "Tracer":
+        """Bật cProfile/tracemalloc nếu được yêu cầu (tốn chi phí, chỉ dùng khi cần tìm chỗ chậm)"""
+        if not self.enabled:
+            return self
+        if self.profile and self._profiler is None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if self.trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        """Tắt profiler, ghi trace ra file (nếu có) và trả về báo cáo"""
+        if not self.enabled:
+            return {}
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.report["profile"] = self._profile_stats()
+            self._profiler = None
+        if self.trace_memory:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics("lineno")[:self.top_n]
+                self.report["memory"] = {
+                    "current": current,
+                    "peak": peak,
+                    "top": [{"location": str(stat.traceback[0]), "size": stat.size, "count": stat.count}
+                            for stat in top],
+                }
+                tracemalloc.stop()
+        if self.trace_file:
+            self.write(self.trace_file)
+        return self.to_dict()
+
+    def _profile_stats(self) -> List[Dict[str, Any]]:
+        import pstats
+        if self.trace_file:
+            self._profiler.dump_stats(os.path.splitext(self.trace_file)[0] + ".prof")
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, function), (calls, primitive, tottime, cumtime, _) in stats.stats.items():
+            rows.append({"function": f"{os.path.basename(filename)}:{line}({function})", "calls": calls,
+                         "tottime": tottime, "cumtime": cumtime})
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:self.top_n]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Tổng thời gian, số lần và thời gian lớn nhất theo tên span"""
+        result: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            item = result.setdefault(span["name"], {"count": 0, "total": 0.0, "max": 0.0})
+            item["count"] += 1
+            item["total"] += span["duration"]
+            item["max"] = max(item["max"], span["duration"])
+        for item in result.values():
+            item["mean"] = item["total"] / item["count"]
+        return dict(sorted(result.items(), key=lambda entry: entry[1]["total"], reverse=True))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Trace dạng Chrome trace event (span là sự kiện "X", thời gian tính bằng micro giây)"""
+        pid = os.getpid()
+        threads: Dict[str, int] = {}
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+            values = dict(self.values)
+        events = []
+        for span in spans:
+            tid = threads.setdefault(span["thread"], len(threads) + 1)
+            events.append({"name": span["name"], "ph": "X", "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6,
+                           "pid": pid, "tid": tid, "args": span["attrs"]})
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                   for name, tid in threads.items()]
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "summary": self.summary(),
+            "counters": counters,
+            "values": values,
+            **self.report,
+        }
+
+    def write(self, path: str):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(path + ".tmp", path)
+        logger.info(f"Trace đã được lưu vào {path} ({len(self.spans)} span)")
+
+def traced(name: str):
+    """Decorator cho method của object có thuộc tính tracer: mỗi lần gọi là một span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.tracer.span(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional, Dict, Any, Tuple
+
+import numpy as np
+
+import Gpa_engine
+import Semester_records
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 1
+
+# Cột của bảng môn học và bảng học kỳ; "str" = mã int32 trỏ vào từ điển chuỗi của cột
+COURSE_COLUMNS = {
+    "ma_mon": "str", "ten_mon": "str", "tin_chi": "<i2", "diem_tp": "str", "diem_so": "<f4",
+    "diem_chu": "str", "diem_dat": "str", "cap_nhat": "str", "hoc_ky": "<i2",
+}
+SEMESTER_COLUMNS = {
+    "hoc_ky": "<i2", "tc_dat": "<i2", "tc_dang_ky": "<i2", "tc_tich_luy": "<i2",
+    "gpa_hk": "<f4", "gpa_tich_luy": "<f4",
+}
+TABLES = {"mon": COURSE_COLUMNS, "hoc_ky": SEMESTER_COLUMNS}
+
+def _dtype(kind: str) -> np.dtype:
+    return np.dtype("<i4" if kind == "str" else kind)
+
+def _encode_number(value: Any, dtype: np.dtype):
+    """None -> NaN (số thực) hoặc -1 (số nguyên)"""
+    if value is None:
+        return np.nan if dtype.kind == "f" else -1
+    return value
+
+def _decode_number(value, dtype: np.dtype):
+    if dtype.kind == "f":
+        return None if np.isnan(value) else round(float(value), 2)
+    return None if value < 0 else int(value)
+
+class TranscriptStore:
+    """Kho bảng điểm dạng cột: mỗi cột là một file nhị phân chỉ ghi nối thêm, đọc bằng mmap không sao chép
+
+    Mỗi lần scrape nối thêm các dòng môn học/học kỳ của một sinh viên; chuỗi (mã môn, tên môn...)
+    được mã hóa qua từ điển riêng của từng cột. manifest.json ghi số dòng hợp lệ và vị trí của
+    từng lần scrape, được ghi sau cùng nên lần ghi dở dang không làm hỏng dữ liệu đã có.
+    """
+
+    def __init__(self, directory: str = "transcript_store"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._manifest = self._load_manifest()
+        self._dictionaries: Dict[str, List[str]] = {}
+        self._codes: Dict[str, Dict[str, int]] = {}
+        self._pending_bytes: Dict[str, int] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        path = self._path("manifest.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != STORE_VERSION:
+                raise ValueError(f"Kho bảng điểm {self.directory} khác phiên bản ({manifest.get('version')})")
+            return manifest
+        return {"version": STORE_VERSION, "rows": {table: 0 for table in TABLES},
+                "dictionaries": {}, "dictionary_bytes": {}, "students": [], "scrapes": []}
+
+    def _save_manifest(self):
+        path = self._path("manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+
+    def dictionary(self, column: str) -> List[str]:
+        """Từ điển chuỗi của một cột (file mỗi dòng một chuỗi JSON, chỉ ghi nối thêm)"""
+        if column not in self._dictionaries:
+            size = self._manifest["dictionaries"].get(column, 0)
+            values = []
+            path = self._path(f"{column}.dict")
+            if size and os.path.exists(path):
+                with open(path, "rb") as f:
+                    content = f.read(self._manifest["dictionary_bytes"][column])
+                values = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+            self._dictionaries[column] = values
+            self._codes[column] = {value: code for code, value in enumerate(values)}
+        return self._dictionaries[column]
+
+    def _encode_strings(self, column: str, values: List[Any]) -> Tuple[np.ndarray, List[str]]:
+        self.dictionary(column)
+        codes, new_values = self._codes[column], []
+        encoded = np.empty(len(values), dtype="<i4")
+        for i, value in enumerate(values):
+            value = "" if value is None else str(value)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self._dictionaries[column])
+                self._dictionaries[column].append(value)
+                new_values.append(value)
+            encoded[i] = code
+        return encoded, new_values
+
+    def _append_dictionary(self, column: str, values: List[str]):
+        valid_bytes = self._manifest.setdefault("dictionary_bytes", {}).get(column, 0)
+        with open(self._path(f"{column}.dict"), "ab") as f:
+            if f.tell() != valid_bytes:
+                f.truncate(valid_bytes)
+                f.seek(valid_bytes)
+            f.write("".join(json.dumps(value, ensure_ascii=False) + "\n" for value in values).encode("utf-8"))
+            self._pending_bytes[column] = f.tell()
+
+    def _append_column(self, table: str, column: str, array: np.ndarray):
+        path = self._path(f"{table}.{column}.bin")
+        valid_bytes = self._manifest["rows"][table] * array.dtype.itemsize
+        with open(path, "ab") as f:
+            # Bỏ phần thừa của lần ghi bị ngắt giữa chừng (vượt quá số dòng trong manifest)
+            if f.tell() != valid_bytes:
+                f.truncate(valid_bytes)
+                f.seek(valid_bytes)
+            f.write(array.tobytes())
+
+    def _append_table(self, table: str, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+        start = self._manifest["rows"][table]
+        for column, kind in TABLES[table].items():
+            values = [row.get(column) for row in rows]
+            if kind == "str":
+                array, new_values = self._encode_strings(column, values)
+                if new_values:
+                    self._append_dictionary(column, new_values)
+            else:
+                dtype = _dtype(kind)
+                array = np.array([_encode_number(value, dtype) for value in values], dtype=dtype)
+            self._append_column(table, column, array)
+        return start, start + len(rows)
+
+    def append(self, student: str, data: Dict[str, Any]) -> int:
+        """Nối thêm kết quả một lần scrape của sinh viên, trả về số thứ tự lần scrape"""
+        with self._lock:
+            try:
+                mon = self._append_table("mon", data.get("bang_diem", []))
+                hoc_ky = self._append_table("hoc_ky", Semester_records.semesters_of(data))
+            except Exception:
+                # Từ điển trong bộ nhớ có thể đã có chuỗi chưa được ghi vào manifest
+                self._dictionaries.clear()
+                self._codes.clear()
+                self._pending_bytes.clear()
+                raise
+
+            manifest = self._manifest
+            if student not in manifest["students"]:
+                manifest["students"].append(student)
+            manifest["scrapes"].append({
+                "student": manifest["students"].index(student),
+                "timestamp": data.get("timestamp") or time.strftime("%Y-%m-%d %H:%M:%S"),
+                "mon": list(mon),
+                "hoc_ky": list(hoc_ky),
+            })
+            manifest["rows"] = {"mon": mon[1], "hoc_ky": hoc_ky[1]}
+            manifest["dictionaries"] = {column: len(values) for column, values in self._dictionaries.items()}
+            manifest.setdefault("dictionary_bytes", {}).update(self._pending_bytes)
+            self._pending_bytes.clear()
+            self._save_manifest()
+            logger.info(f"Đã lưu {mon[1] - mon[0]} môn của {student} vào kho {self.directory}")
+            return len(manifest["scrapes"]) - 1
+
+    def columns(self, table: str = "mon") -> Dict[str, np.ndarray]:
+        """Các cột của bảng dưới dạng np.memmap chỉ đọc (không parse, không sao chép)"""
+        rows = self._manifest["rows"][table]
+        result = {}
+        for column, kind in TABLES[table].items():
+            dtype = _dtype(kind)
+            if rows == 0:
+                result[column] = np.empty(0, dtype=dtype)
+            else:
+                result[column] = np.memmap(self._path(f"{table}.{column}.bin"), dtype=dtype, mode="r", shape=(rows,))
+        return result
+
+    @property
+    def students(self) -> List[str]:
+        return list(self._manifest["students"])
+
+    def latest_scrapes(self) -> Dict[str, Dict[str, Any]]:
+        """Lần scrape mới nhất của từng sinh viên"""
+        latest = {}
+        for scrape in self._manifest["scrapes"]:
+            latest[self._manifest["students"][scrape["student"]]] = scrape
+        return latest
+
+    def to_json(self, student: str, scrape: Optional[int] = None) -> Dict[str, Any]:
+        """Dựng lại dữ liệu dạng ket_qua.json của một lần scrape (mặc định là lần mới nhất)"""
+        if scrape is None:
+            entry = self.latest_scrapes().get(student)
+            if entry is None:
+                raise KeyError(f"Không có dữ liệu của {student} trong kho")
+        else:
+            entry = self._manifest["scrapes"][scrape]
+
+        tables = {}
+        for table, spec in TABLES.items():
+            start, end = entry[table]
+            columns = self.columns(table)
+            rows = []
+            for i in range(start, end):
+                row = {}
+                for column, kind in spec.items():
+                    if kind == "str":
+                        row[column] = self.dictionary(column)[columns[column][i]]
+                    else:
+                        row[column] = _decode_number(columns[column][i], columns[column].dtype)
+                rows.append(row)
+            tables[table] = rows
+
+        bang_diem = tables["mon"]
+        for semester in tables["hoc_ky"]:
+            semester["mon"] = [mon["ma_mon"] for mon in bang_diem if mon["hoc_ky"] == semester["hoc_ky"]]
+        total_gpa = [
+            {"tin_chi": (f"Số tín chỉ đạt/đăng ký học kỳ: {semester['tc_dat']}/{semester['tc_dang_ky']} "
+                         f"- Số TCTL chung: {semester['tc_tich_luy']}"),
+             "gpa_hk": semester["gpa_hk"], "gpa_chung": semester["gpa_tich_luy"]}
+            for semester in tables["hoc_ky"]
+        ]
+        return {"bang_diem": bang_diem, "total_gpa": total_gpa, "hoc_ky": tables["hoc_ky"],
+                "timestamp": entry["timestamp"]}
+
+    def export_json(self, student: str, path: str):
+        """Xuất bảng điểm của một sinh viên ra JSON như GpaAnalyzer.save_data"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(student), f, ensure_ascii=False, indent=2)
+
+    def export_npz(self, path: str):
+        """Đóng gói toàn bộ kho thành một file .npz nén (để chia sẻ, không dùng cho mmap)"""
+        arrays = {f"{table}.{column}": np.asarray(array)
+                  for table in TABLES for column, array in self.columns(table).items()}
+        for column in self._manifest["dictionaries"]:
+            arrays[f"dict.{column}"] = np.array(self.dictionary(column), dtype=str)
+        arrays["manifest"] = np.array(json.dumps(self._manifest, ensure_ascii=False))
+        np.savez_compressed(path, **arrays)
+
+    def cohort_gpa(self) -> Dict[str, Optional[float]]:
+        """GPA thang 4 (lần scrape mới nhất) của mọi sinh viên, tính vector hóa trên các cột mmap"""
+        latest = self.latest_scrapes()
+        columns = self.columns("mon")
+        letters = self.dictionary("diem_chu")
+        points = np.array([Gpa_engine.GRADE_POINTS.get(letter, np.nan) for letter in letters] or [np.nan])
+
+        starts = np.array([entry["mon"][0] for entry in latest.values()], dtype=np.int64)
+        ends = np.array([entry["mon"][1] for entry in latest.values()], dtype=np.int64)
+        owner = np.repeat(np.arange(len(latest)), ends - starts)
+        rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(latest) else np.empty(0, int)
+
+        credits = columns["tin_chi"][rows].astype(np.float64)
+        grades = points[columns["diem_chu"][rows]]
+        graded = (credits > 0) & ~np.isnan(grades)
+        total_points = np.bincount(owner[graded], weights=(credits * grades)[graded], minlength=len(latest))
+        total_credits = np.bincount(owner[graded], weights=credits[graded], minlength=len(latest))
+
+        return {
+            student: round(float(p / c), 2) if c else None
+            for student, p, c in zip(latest, total_points, total_credits)
+        }
+
+def main():
+    """Nhập/xuất kho bảng điểm từ dòng lệnh"""
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Kho bảng điểm dạng cột")
+    parser.add_argument("--store", default="transcript_store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="Nhập các file bảng điểm JSON trong thư mục")
+    import_cmd.add_argument("directory")
+    export_cmd = commands.add_parser("export", help="Xuất JSON của một sinh viên")
+    export_cmd.add_argument("student")
+    export_cmd.add_argument("output")
+    npz_cmd = commands.add_parser("npz", help="Đóng gói kho thành file .npz")
+    npz_cmd.add_argument("output")
+    commands.add_parser("gpa", help="In GPA của cả nhóm")
+    args = parser.parse_args()
+
+    store = TranscriptStore(args.store)
+    if args.command == "import":
+        for path in sorted(glob.glob(os.path.join(args.directory, "*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                store.append(os.path.splitext(os.path.basename(path))[0], json.load(f))
+    elif args.command == "export":
+        store.export_json(args.student, args.output)
+    elif args.command == "npz":
+        store.export_npz(args.output)
+    else:
+        for student, gpa in store.cohort_gpa().items():
+            print(f"{student}: {gpa}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import json
+
+from Agent_core import GpaAnalyzer, LoginFailed
+from Batch_runner import BatchRunner
+
+class FlakyAnalyzer(GpaAnalyzer):
+    """Analyzer giả: hành vi setup_driver/login_and_scrape do test quyết định"""
+
+    launches = 0
+
+    def __init__(self, fail_launch=False, fail_login=None):
+        super().__init__()
+        self.fail_launch = fail_launch
+        self.fail_login = fail_login
+
+    def setup_driver(self):
+        FlakyAnalyzer.launches += 1
+        if self.fail_launch:
+            raise RuntimeError("không khởi động được Edge")
+
+    def login_and_scrape(self, username, password):
+        if self.fail_login is not None:
+            raise self.fail_login
+        self.last_diff = None
+        return {"bang_diem": [], "total_gpa": []}
+
+    def cleanup(self, force=False):
+        pass
+
+def runner(tmp_path, factory):
+    FlakyAnalyzer.launches = 0
+    return BatchRunner(output_dir=str(tmp_path), workers=2, max_retries=3, backoff=0.0, rate=0,
+                       analyzer_factory=factory)
+
+def test_driver_launch_failure_is_retried_and_recorded(tmp_path):
+    summary = runner(tmp_path, lambda: FlakyAnalyzer(fail_launch=True)).run_credentials(
+        [{"username": "a", "password": "x"}, {"username": "b", "password": "y"}])
+
+    assert summary["error"] == 2
+    assert all(result["attempts"] == 3 for result in summary["results"])
+    assert FlakyAnalyzer.launches == 6
+    with open(tmp_path / "summary.json", encoding="utf-8") as f:
+        assert json.load(f)["total"] == 2
+
+def test_login_failed_is_not_retried(tmp_path):
+    summary = runner(tmp_path, lambda: FlakyAnalyzer(fail_login=LoginFailed("sai mật khẩu"))).run_credentials(
+        [{"username": "a", "password": "x"}])
+    assert summary["results"][0]["attempts"] == 1
+
+def test_other_value_errors_are_retried(tmp_path):
+    summary = runner(tmp_path, lambda: FlakyAnalyzer(fail_login=ValueError("không có bảng điểm"))).run_credentials(
+        [{"username": "a", "password": "x"}])
+    assert summary["results"][0]["attempts"] == 3
@@ -0,0 +1,43 @@
+import pytest
+
+from Gpa_engine import BestAttemptIndex, to_4_point
+
+@pytest.mark.parametrize("diem_so, diem_chu, expected", [
+    (None, "A+", 4.0), (None, "b+", 3.5), (None, " C ", 2.0), (None, "F", 0.0),
+    (9.5, None, 4.0), (8.4, None, 3.5), (6.9, None, 2.5), (5.0, None, 1.5), (3.9, None, 0.0),
+    # Điểm chữ được ưu tiên hơn điểm số
+    (9.0, "C", 2.0),
+])
+def test_to_4_point(diem_so, diem_chu, expected):
+    assert to_4_point(diem_so, diem_chu) == expected
+
+@pytest.mark.parametrize("diem_chu", ["MT", "CT", "RT"])
+def test_to_4_point_unknown_letter_is_not_graded(diem_chu):
+    assert to_4_point(8.0, diem_chu) is None
+
+def test_to_4_point_without_grade():
+    assert to_4_point() is None
+
+def mon(ma_mon, diem_so, tin_chi=3):
+    return {"ma_mon": ma_mon, "diem_so": diem_so, "tin_chi": tin_chi}
+
+def test_best_attempt_keeps_highest_score():
+    index = BestAttemptIndex()
+    assert index.add(mon("CO1005", 4.5))
+    assert index.add(mon("CO1005", 7.0))
+    assert not index.add(mon("CO1005", 6.0))
+    assert not index.add(mon("CO1005", None))
+    assert len(index) == 1 and "CO1005" in index
+    assert index.to_list() == [mon("CO1005", 7.0)]
+
+def test_best_attempt_replaces_ungraded_attempt():
+    index = BestAttemptIndex().extend([mon("MT1003", None), mon("MT1003", 5.5)])
+    assert index.to_list() == [mon("MT1003", 5.5)]
+
+def test_best_attempt_keeps_first_seen_order():
+    index = BestAttemptIndex().extend([mon("A", 5.0), mon("B", 6.0), mon("A", 8.0)])
+    assert [row["ma_mon"] for row in index.to_list()] == ["A", "B"]
+
+def test_best_attempt_without_score_has_no_credits():
+    rows = BestAttemptIndex().extend([mon("PE1003", None), mon("CO2003", 0.0), mon("CO2001", 7.5)]).to_list()
+    assert [row["tin_chi"] for row in rows] == [0, 0, 3]
@@ -0,0 +1,68 @@
+import sqlite3
+
+from Gpa_engine import BestAttemptIndex
+from History_db import HistoryDB
+
+def mon(ma_mon, diem_so, diem_chu, cap_nhat="2024-01-10", hoc_ky=231, tin_chi=3):
+    return {"ma_mon": ma_mon, "ten_mon": ma_mon, "tin_chi": tin_chi, "diem_tp": "", "diem_so": diem_so,
+            "diem_chu": diem_chu, "diem_dat": "Đạt", "cap_nhat": cap_nhat, "hoc_ky": hoc_ky}
+
+def record(db, attempts, timestamp):
+    data = {"bang_diem": BestAttemptIndex().extend(attempts).to_list(), "hoc_ky": [], "timestamp": timestamp}
+    return db.record_scrape("sv1", data, attempts)
+
+def test_corrected_grade_keeps_old_snapshot(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    first = record(db, [mon("CO1005", 4.5, "D")], "2024-01-10 08:00:00")
+    # Phòng đào tạo sửa điểm nhưng không đổi cap_nhat
+    second = record(db, [mon("CO1005", 6.5, "C+")], "2024-01-20 08:00:00")
+
+    assert second["changed"][0]["ma_mon"] == "CO1005"
+    assert db.snapshot("sv1", first["scrape_id"])["bang_diem"][0]["diem_so"] == 4.5
+    assert db.snapshot("sv1", second["scrape_id"])["bang_diem"][0]["diem_so"] == 6.5
+    assert [attempt["diem_so"] for attempt in db.course_history("sv1", "CO1005")] == [4.5, 6.5]
+
+def test_attempts_with_same_or_empty_cap_nhat_are_kept(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    attempts = [mon("MT1003", 3.0, "F", cap_nhat="", hoc_ky=221), mon("MT1003", 3.5, "F", cap_nhat="", hoc_ky=222),
+                mon("MT1003", 3.0, "F", cap_nhat="", hoc_ky=221), mon("MT1003", 7.0, "B", cap_nhat="", hoc_ky=231)]
+    diff = record(db, attempts, "2024-01-10 08:00:00")
+
+    assert diff["new_attempts"] == 4
+    assert len(db.course_history("sv1", "MT1003")) == 4
+    assert db.snapshot("sv1")["bang_diem"][0]["diem_so"] == 7.0
+
+def test_unchanged_scrape_adds_nothing(tmp_path):
+    db = HistoryDB(str(tmp_path / "history.db"))
+    attempts = [mon("CO1005", 4.5, "D", cap_nhat=""), mon("CO1005", 4.5, "D", cap_nhat="")]
+    record(db, attempts, "2024-01-10 08:00:00")
+    diff = record(db, attempts, "2024-01-11 08:00:00")
+
+    assert not diff["has_changes"] and diff["new_attempts"] == 0
+    assert len(db.course_history("sv1", "CO1005")) == 2
+    assert db.snapshot("sv1")["timestamp"] == "2024-01-11 08:00:00"
+
+def test_legacy_attempts_table_is_migrated(tmp_path):
+    path = str(tmp_path / "history.db")
+    HistoryDB(path).close()
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE attempts (student_id INTEGER NOT NULL, ma_mon TEXT NOT NULL, cap_nhat TEXT NOT NULL,
+            ten_mon TEXT, tin_chi INTEGER, diem_tp TEXT, diem_so REAL, diem_chu TEXT, diem_dat TEXT, hoc_ky INTEGER,
+            first_scrape_id INTEGER NOT NULL, PRIMARY KEY (student_id, ma_mon, cap_nhat));
+        CREATE TABLE snapshot_courses (scrape_id INTEGER NOT NULL, ma_mon TEXT NOT NULL, cap_nhat TEXT NOT NULL,
+            PRIMARY KEY (scrape_id, ma_mon));
+        INSERT INTO students (id, username) VALUES (1, 'sv1');
+        INSERT INTO scrapes (id, student_id, scraped_at, changed, snapshot_id) VALUES (1, 1, '2024-01-10', 1, 1);
+        INSERT INTO attempts VALUES (1, 'CO1005', '2024-01-10', 'CO1005', 3, '', 4.5, 'D', 'Đạt', 231, 1);
+        INSERT INTO snapshot_courses VALUES (1, 'CO1005', '2024-01-10');
+    """)
+    conn.close()
+
+    db = HistoryDB(path)
+    assert db.snapshot("sv1")["bang_diem"][0]["diem_so"] == 4.5
+    # Bảng điểm giống hệt lần scrape cũ: lần học đã được chuyển sang nên không ghi lại
+    diff = record(db, [mon("CO1005", 4.5, "D")], "2024-01-11 08:00:00")
+    assert diff["new_attempts"] == 0
+    tables = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "attempts" not in tables and "snapshot_courses" not in tables
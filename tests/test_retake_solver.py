@@ -0,0 +1,73 @@
+import itertools
+import random
+
+import pytest
+
+import Gpa_engine
+from Retake_solver import RetakeSolver
+
+def random_courses(rng, n):
+    courses = []
+    for i in range(n):
+        diem_so = round(rng.uniform(4.0, 9.5), 1)
+        courses.append({"ma_mon": f"M{i:02d}", "ten_mon": f"Môn {i}", "tin_chi": rng.choice([1, 2, 3, 4]),
+                        "diem_so": diem_so, "diem_4": Gpa_engine.to_4_point(diem_so)})
+    return courses
+
+def brute_force_gain(solver, budget):
+    """Tổng mức tăng lớn nhất với tối đa budget tín chỉ, duyệt mọi tập con"""
+    best = 0.0
+    n = len(solver.candidates)
+    for size in range(1, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            if solver.credits[list(subset)].sum() <= budget:
+                best = max(best, float(solver.gain[list(subset)].sum()))
+    return best
+
+def brute_force_min_credits(solver, target):
+    need = target * solver.total_credits - solver.total_points
+    if need <= 0:
+        return 0
+    best = None
+    n = len(solver.candidates)
+    for size in range(1, n + 1):
+        for subset in itertools.combinations(range(n), size):
+            if solver.gain[list(subset)].sum() >= need - 1e-9:
+                credits = int(solver.credits[list(subset)].sum())
+                best = credits if best is None else min(best, credits)
+    return best
+
+@pytest.mark.parametrize("seed", range(20))
+def test_knapsack_matches_brute_force(seed):
+    rng = random.Random(seed)
+    solver = RetakeSolver(random_courses(rng, rng.randint(1, 8)))
+    for budget in range(solver.max_budget + 1):
+        assert solver._dp[budget] == pytest.approx(brute_force_gain(solver, budget))
+
+@pytest.mark.parametrize("seed", range(20))
+def test_min_credits_matches_brute_force(seed):
+    rng = random.Random(seed)
+    solver = RetakeSolver(random_courses(rng, rng.randint(1, 8)))
+    targets = [2.0, 2.5, 2.8, 3.0, 3.2, 3.5, 3.8]
+    expected = [brute_force_min_credits(solver, target) for target in targets]
+    assert solver.sweep(targets) == expected
+    assert [solver.min_credits(target) for target in targets] == expected
+
+@pytest.mark.parametrize("seed", range(10))
+def test_best_plan_reaches_target_with_min_credits(seed):
+    rng = random.Random(seed)
+    solver = RetakeSolver(random_courses(rng, 8))
+    target = solver.gpa_for_gain(float(solver._dp[-1]) * 0.6)
+    plan = solver.solve(target)[0]
+    assert plan["dat_muc_tieu"]
+    assert plan["tong_tin_chi"] == brute_force_min_credits(solver, target)
+    assert plan["tong_tin_chi"] == sum(mon["tin_chi"] for mon in plan["mon"])
+
+def test_unreachable_target_returns_max_gain_plan():
+    courses = [{"ma_mon": "A", "ten_mon": "A", "tin_chi": 3, "diem_so": 5.0, "diem_4": 1.5},
+               {"ma_mon": "B", "ten_mon": "B", "tin_chi": 2, "diem_so": 9.0, "diem_4": 4.0}]
+    solver = RetakeSolver(courses)
+    assert solver.min_credits(3.9) is None
+    plan = solver.solve(3.9)[0]
+    assert not plan["dat_muc_tieu"]
+    assert [mon["ma_mon"] for mon in plan["mon"]] == ["A"]
@@ -0,0 +1,37 @@
+from Semester_scheduler import SemesterScheduler
+
+def item(ma_mon, tien_quyet=(), tin_chi=3, bat_buoc=True):
+    return {"ma_mon": ma_mon, "ten_mon": ma_mon, "tin_chi": tin_chi, "loai": "bat_buoc", "bat_buoc": bat_buoc,
+            "tien_quyet": list(tien_quyet), "gain": 0.0, "hoc_ky_ctdt": None, "moi": True}
+
+def placement(items, semesters, **kwargs):
+    lich = SemesterScheduler(items, semesters, **kwargs).schedule(0.0, 0, 2.5)
+    where = {mon["ma_mon"]: hk["hoc_ky"] for hk in lich["hoc_ky"] for mon in hk["mon"]}
+    return where, sorted(mon["ma_mon"] for mon in lich["khong_xep_duoc"])
+
+def test_prerequisite_chain_is_scheduled_in_order():
+    where, unscheduled = placement([item("C", ["B"]), item("B", ["A"]), item("A", ["X"])], 3, passed={"X"})
+    assert unscheduled == []
+    assert where["A"] < where["B"] < where["C"]
+
+def test_prerequisite_chain_longer_than_remaining_semesters():
+    where, unscheduled = placement([item("A"), item("B", ["A"]), item("C", ["B"])], 2)
+    assert where == {"A": 1, "B": 2}
+    assert unscheduled == ["C"]
+
+def test_missing_prerequisite_blocks_course():
+    where, unscheduled = placement([item("A", ["X"]), item("D")], 3)
+    assert "A" not in where
+    assert unscheduled == ["A"]
+
+def test_credit_limit_pushes_chain_later():
+    where, unscheduled = placement([item("A", tin_chi=4), item("B", tin_chi=4), item("C", ["A"], tin_chi=4)], 3,
+                                   max_credits=8)
+    assert unscheduled == []
+    assert where["C"] > where["A"]
+    assert all(sum(4 for code in where if where[code] == hk) <= 8 for hk in (1, 2, 3))
+
+def test_missing_prerequisite_blocks_whole_chain():
+    where, unscheduled = placement([item("A", ["X"]), item("B", ["A"]), item("C", ["B"]), item("D")], 3)
+    assert where == {"D": 1}
+    assert unscheduled == ["A", "B", "C"]
@@ -0,0 +1,189 @@
+import json
+import os
+from typing import List, Optional, Dict, Any
+from urllib.parse import urljoin
+
+import pytest
+import requests
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+
+from Agent_core import GpaAnalyzer, LoginFailed, TABLE_ROW_COUNT_JS, TABLE_SNAPSHOT_JS
+from Http_fetcher import LoginFormParser, TableSnapshotParser
+from Mock_mybk import MockMybkServer
+from Session_store import SESSION_KEY_ENV, SessionStore
+
+TRANSCRIPT = {
+    "bang_diem": [
+        {"ma_mon": "MT1003", "ten_mon": "Giải tích 1", "tin_chi": 4, "diem_tp": "--", "diem_so": 6.4,
+         "diem_chu": "C", "diem_dat": "", "cap_nhat": "01/02/2023 10:00"},
+        {"ma_mon": "CO1005", "ten_mon": "Nhập môn điện toán", "tin_chi": 3, "diem_tp": "--", "diem_so": 8.5,
+         "diem_chu": "A", "diem_dat": "", "cap_nhat": "01/02/2023 10:00"},
+    ],
+    "total_gpa": [{"tin_chi": "Số tín chỉ đạt/đăng ký học kỳ: 7/7 - Số TCTL chung: 7", "gpa_hk": 2.86, "gpa_chung": 2.86}],
+}
+
+class FakeElement:
+    def __init__(self, driver: "RequestsDriver", name: Optional[str] = None):
+        self.driver = driver
+        self.name = name
+
+    def send_keys(self, text: str):
+        self.driver.form[self.name] = text
+
+    def click(self):
+        self.driver.submit()
+
+class RequestsDriver:
+    """WebDriver tối giản chạy bằng requests trên Mock_mybk (trang mock không cần JS để render bảng)"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.current_url = ""
+        self.page = ""
+        self.form: Dict[str, str] = {}
+        self.logins = 0
+
+    def _load(self, response: requests.Response):
+        self.current_url = response.url
+        self.page = response.text
+
+    def get(self, url: str):
+        self.form = {}
+        try:
+            self._load(self.session.get(url, timeout=5))
+        except requests.ConnectionError:
+            # Trình duyệt thật hiện trang lỗi; ở đây chỉ cần ghi nhận URL
+            self.current_url, self.page = url, ""
+
+    def submit(self):
+        parser = LoginFormParser()
+        parser.feed(self.page)
+        self.logins += 1
+        self._load(self.session.post(urljoin(self.current_url, parser.action),
+                                     data=dict(parser.fields, **self.form), timeout=5))
+
+    def _snapshot(self) -> Optional[Dict[str, Any]]:
+        parser = TableSnapshotParser()
+        parser.feed(self.page)
+        return parser.snapshot()
+
+    def find_elements(self, by: str, value: str) -> List[FakeElement]:
+        if by == By.NAME and f'name="{value}"' in self.page:
+            return [FakeElement(self, value)]
+        if by == By.ID and (f'id="{value}"' in self.page or f"id='{value}'" in self.page):
+            return [FakeElement(self)]
+        if by == By.CSS_SELECTOR:
+            snapshot = self._snapshot()
+            return [FakeElement(self)] if snapshot and snapshot["footer_rows"] else []
+        return []
+
+    def find_element(self, by: str, value: str) -> FakeElement:
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"{by}={value}")
+        return elements[0]
+
+    def execute_script(self, script: str, *args):
+        snapshot = self._snapshot()
+        if script == TABLE_SNAPSHOT_JS:
+            return snapshot
+        if script == TABLE_ROW_COUNT_JS:
+            return len(snapshot["body_rows"]) if snapshot else 0
+        return None
+
+    def get_cookies(self) -> List[Dict[str, Any]]:
+        return [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path, "secure": c.secure}
+                for c in self.session.cookies]
+
+    def add_cookie(self, cookie: Dict[str, Any]):
+        self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"],
+                                 path=cookie.get("path", "/"))
+
+    def delete_all_cookies(self):
+        self.session.cookies.clear()
+
+    def quit(self):
+        self.session.close()
+
+@pytest.fixture
+def mybk():
+    with MockMybkServer(TRANSCRIPT) as server:
+        yield server
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.delenv(SESSION_KEY_ENV, raising=False)
+    return SessionStore(str(tmp_path / "sessions"), key_file=str(tmp_path / "keys" / "session.key"))
+
+def scrape(mybk: MockMybkServer, store: SessionStore, password: str = "matkhau"):
+    """Mỗi lần gọi là một trình duyệt mới (cookie rỗng), chỉ dùng lại phiên qua SessionStore"""
+    analyzer = GpaAnalyzer(session_store=store, login_url=mybk.login_url, grades_url=mybk.grades_url,
+                           readiness_timeouts={"stable_for": 0.02, "poll_interval": 0.01, "sso_redirect": 5.0})
+    analyzer.driver = RequestsDriver()
+    data = analyzer.login_and_scrape("sinhvien", password)
+    return data, analyzer.driver
+
+def test_session_reused_across_browsers(mybk, store):
+    first, driver = scrape(mybk, store)
+    assert driver.logins == 1
+    assert store.load("sinhvien")
+
+    second, driver = scrape(mybk, store)
+    assert driver.logins == 0
+    assert [mon["ma_mon"] for mon in second["bang_diem"]] == [mon["ma_mon"] for mon in first["bang_diem"]]
+
+def test_expired_server_session_logs_in_again(mybk, store):
+    scrape(mybk, store)
+    mybk.expire_sessions()
+
+    data, driver = scrape(mybk, store)
+    assert driver.logins == 1
+    assert len(data["bang_diem"]) == 2
+    # Phiên mới được lưu lại thay cho phiên đã hết hạn
+    _, driver = scrape(mybk, store)
+    assert driver.logins == 0
+
+def test_session_older_than_max_age_is_dropped(mybk, store):
+    scrape(mybk, store)
+    store.max_age = 0
+    assert store.load("sinhvien") is None
+    assert not os.path.exists(store._path("sinhvien"))
+
+def test_wrong_password_raises_login_failed_without_saving(mybk, store):
+    with pytest.raises(LoginFailed):
+        scrape(mybk, store, password="sai")
+    assert store.load("sinhvien") is None
+
+def test_sessions_are_encrypted(mybk, store):
+    scrape(mybk, store)
+    with open(store._path("sinhvien"), "rb") as f:
+        raw = f.read()
+    assert b"JSESSIONID" not in raw
+    with pytest.raises(ValueError):
+        json.loads(raw)
+
+def test_key_file_is_kept_outside_session_directory(tmp_path, monkeypatch):
+    monkeypatch.delenv(SESSION_KEY_ENV, raising=False)
+    sessions = tmp_path / "sessions"
+    sessions.mkdir()
+    (sessions / "session.key").write_bytes(b"old")
+
+    key_file = tmp_path / "keys" / "session.key"
+    SessionStore(str(sessions), key_file=str(key_file))
+    assert key_file.exists()
+    assert not (sessions / "session.key").exists()
+    if os.name == "posix":
+        assert key_file.stat().st_mode & 0o777 == 0o600
+
+    with pytest.raises(ValueError):
+        SessionStore(str(sessions), key_file=str(sessions / "session.key"))
+
+def test_env_key_takes_precedence(tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+    monkeypatch.setenv(SESSION_KEY_ENV, Fernet.generate_key().decode())
+    key_file = tmp_path / "keys" / "session.key"
+    store = SessionStore(str(tmp_path / "sessions"), key_file=str(key_file))
+    store.save("sv", [{"name": "a", "value": "b"}])
+    assert store.load("sv") == [{"name": "a", "value": "b"}]
+    assert not key_file.exists()
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from Stream_parser import IncrementalJsonFields
+
+DOCUMENT = {
+    "tom_tat": 'GPA "hiện tại" là 2.8 {chưa tính} [môn miễn], đường dẫn C:\\mybk\\',
+    "hoc_phan_uu_tien": [{"ma_mon": "CO1005", "ghi_chu": "học lại, }]"}],
+    "gpa_muc_tieu": 3.2,
+    "cac_buoc_thuc_hien": ["Học kỳ 1: CO1005", "Học kỳ 2: \"MT1003\""],
+}
+
+def feed_all(parser, text, size):
+    fields = []
+    for i in range(0, len(text), size):
+        fields += parser.feed(text[i:i + size])
+    return fields
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_split_chunks(size):
+    parser = IncrementalJsonFields()
+    fields = feed_all(parser, json.dumps(DOCUMENT, ensure_ascii=False, indent=2), size)
+    assert fields == list(DOCUMENT.items())
+    assert parser.done
+    assert parser.result() == DOCUMENT
+
+def test_split_inside_escape_sequences():
+    text = json.dumps(DOCUMENT, ensure_ascii=False)
+    # Cắt ngay sau mỗi dấu gạch chéo ngược để chuỗi thoát bị tách qua hai lần feed
+    cuts = [i + 1 for i, ch in enumerate(text) if ch == "\\"]
+    parser = IncrementalJsonFields()
+    fields, start = [], 0
+    for cut in cuts + [len(text)]:
+        fields += parser.feed(text[start:cut])
+        start = cut
+    assert dict(fields) == DOCUMENT
+
+def test_fields_are_emitted_as_soon_as_complete():
+    parser = IncrementalJsonFields()
+    assert parser.feed('{"tom_tat": "ok", "gpa_muc_tieu": 3.') == [("tom_tat", "ok")]
+    assert parser.result() is None
+    assert parser.feed('5}') == [("gpa_muc_tieu", 3.5)]
+    assert parser.result() == {"tom_tat": "ok", "gpa_muc_tieu": 3.5}
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_think_block_and_preamble_are_skipped(size):
+    text = ('<think>bảng điểm {"tom_tat": "nháp"}</think>\nĐây là kết quả:\n```json\n'
+            + json.dumps(DOCUMENT, ensure_ascii=False) + "\n```")
+    parser = IncrementalJsonFields()
+    assert dict(feed_all(parser, text, size)) == DOCUMENT
+    assert parser.result() == DOCUMENT
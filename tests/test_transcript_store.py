@@ -0,0 +1,45 @@
+import numpy as np
+
+from Transcript_store import TranscriptStore
+
+def transcript(diem_co1005, timestamp):
+    return {
+        "bang_diem": [
+            {"ma_mon": "CO1005", "ten_mon": "Nhập môn điện toán", "tin_chi": 3, "diem_tp": "7.0/8.0",
+             "diem_so": diem_co1005, "diem_chu": "B", "diem_dat": "Đạt", "cap_nhat": "2024-01-10", "hoc_ky": 231},
+            {"ma_mon": "PE1003", "ten_mon": "Giáo dục thể chất", "tin_chi": 0, "diem_tp": "",
+             "diem_so": None, "diem_chu": "MT", "diem_dat": "Đạt", "cap_nhat": "", "hoc_ky": 231},
+        ],
+        "hoc_ky": [{"hoc_ky": 231, "tc_dat": 3, "tc_dang_ky": 3, "tc_tich_luy": 3,
+                    "gpa_hk": 3.0, "gpa_tich_luy": 3.0, "mon": ["CO1005", "PE1003"]}],
+        "timestamp": timestamp,
+    }
+
+def test_round_trip_through_mmap(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    first = store.append("sv1", transcript(7.5, "2024-01-10 08:00:00"))
+    store.append("sv2", transcript(9.0, "2024-01-11 08:00:00"))
+    store.append("sv1", transcript(8.0, "2024-02-01 08:00:00"))
+
+    # Mở lại từ đĩa: dữ liệu chỉ đến từ manifest và các file cột
+    reopened = TranscriptStore(str(tmp_path))
+    assert reopened.students == ["sv1", "sv2"]
+
+    columns = reopened.columns("mon")
+    assert isinstance(columns["diem_so"], np.memmap)
+    assert len(columns["ma_mon"]) == 6
+    assert np.isnan(columns["diem_so"][1])
+    assert columns["tin_chi"].tolist() == [3, 0] * 3
+
+    data = reopened.to_json("sv1")
+    expected = transcript(8.0, "2024-02-01 08:00:00")
+    assert data["bang_diem"] == expected["bang_diem"]
+    assert data["hoc_ky"] == expected["hoc_ky"]
+    assert data["timestamp"] == expected["timestamp"]
+    assert data["total_gpa"][0]["gpa_chung"] == 3.0
+    assert reopened.to_json("sv1", first)["bang_diem"][0]["diem_so"] == 7.5
+
+def test_cohort_gpa(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    store.append("sv1", transcript(7.5, "2024-01-10 08:00:00"))
+    assert TranscriptStore(str(tmp_path)).cohort_gpa() == {"sv1": 3.0}